@@ -1,72 +1,849 @@
-from llama_index import VectorStoreIndex, SimpleDirectoryReader, ServiceContext
-from llama_index.llms import OpenAI
-from llama_index.readers.web import SimpleWebPageReader
-from llama_index.core import Settings
-from typing import List, Dict, Any, Optional
+from __future__ import annotations
+
+from itertools import islice
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Awaitable, Callable, TYPE_CHECKING
+import asyncio
 import os
 from dotenv import load_dotenv
-import supabase
 
 # Load environment variables
 load_dotenv("../.env")
 
-# Initialize LlamaIndex
-Settings.llm = OpenAI(model="gpt-4", temperature=0.1)
+from cache import DocumentCache, CachedDocument, SemanticCache, content_hash
+from chunking import CHUNK_MAX_TOKENS_PER_REQUEST, TokenBudget, chunk_text
+from clients import LLM_MODEL, embedding_model_id, get_database_embed_model, get_embed_model, get_llm, get_supabase_client
+from coalesce import SingleFlight
+from entities import Entity, EntityIndex, is_simple_lookup
+from fetcher import PageFetcher
+from rerank import RERANK_ENABLED, candidate_count, compress
+from retrieval import search_rag_documents, search_rag_documents_batch, RAG_TOP_K
+from routing import ROUTER_PROBE_CHARS, is_low_confidence, route_query
+from vectorstore import MmapVectorStore, store_name
+from metrics import span, record_cache, record_context_tokens, record_route
+from patient_context import PatientContextCache
+import executor
+
+# llama_index is imported on first use to keep worker start-up fast
+if TYPE_CHECKING:
+    from llama_index.core.schema import NodeWithScore, QueryBundle
+
+# Cache of fetched pages and their chunk embeddings, shared across requests
+document_cache = DocumentCache(
+    directory=os.getenv("DOCUMENT_CACHE_DIR", ".cache/documents"),
+    ttl=float(os.getenv("DOCUMENT_CACHE_TTL_SECONDS", "3600")),
+    maxsize=int(os.getenv("DOCUMENT_CACHE_MAX_ENTRIES", "256")),
+    max_disk_entries=int(os.getenv("DOCUMENT_CACHE_MAX_DISK_ENTRIES", "2048")),
+)
+
+# Answers to previous questions, reused for near-identical queries over the same sources
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256")),
+    max_scopes=int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", "1024")),
+)
+
+# Chunk vectors and texts of cached pages, memory-mapped and shared by every worker on the host
+vector_store = MmapVectorStore(
+    directory=os.path.join(os.getenv("VECTOR_STORE_DIR", ".cache/vectors"), store_name(embedding_model_id())),
+    max_documents=int(os.getenv("VECTOR_STORE_MAX_DOCUMENTS", "4096")),
+    compact_ratio=float(os.getenv("VECTOR_STORE_COMPACT_RATIO", "0.5")),
+)
+
+# Pooled, non-blocking fetcher for browser RAG pages
+page_fetcher = PageFetcher(
+    max_connections=int(os.getenv("FETCH_MAX_CONNECTIONS", "100")),
+    per_host_limit=int(os.getenv("FETCH_PER_HOST_LIMIT", "4")),
+    timeout=float(os.getenv("FETCH_TIMEOUT_SECONDS", "15")),
+    max_bytes=int(os.getenv("FETCH_MAX_BYTES", str(5 * 1024 * 1024))),
+)
+
+def _on_reference_change() -> None:
+    semantic_cache.invalidate()
+    patient_contexts.invalidate()
+
+def on_documents_written(ids: List[Any]) -> None:
+    """
+    Drop what rag_documents rows given a new embedding outside a request may have changed.
+
+    Answers built from a rewritten row are stale, and a newly embedded row can now
+    be retrieved for any database question, so every database answer and patient
+    bundle goes.
+    """
+    semantic_cache.invalidate_where(lambda scope: scope[0] == "collection")
+    patient_contexts.invalidate()
+
+# Conditions and medications from the reference tables, matched in queries
+entity_index = EntityIndex(get_supabase_client, on_change=_on_reference_change)
+
+# Each patient's diagnosis and prescription context, retrieved when they log in
+patient_contexts = PatientContextCache(entity_index)
+
+# Chunks embedded per call while a page is being chunked
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# Most LLM calls in flight for one batch request
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+# Concurrent identical index builds and questions share one in-flight computation
+index_flights = SingleFlight("index")
+answer_flights = SingleFlight("answer")
+
+def _embed_chunks(text: str, budget: Optional[TokenBudget] = None) -> List[Dict[str, Any]]:
+    """
+    Chunk a page as a stream and embed the chunks a batch at a time.
+
+    Chunking stops once the page's or the request's token budget is spent, so
+    the rest of a very large page is never parsed or embedded.
+    """
+    embed_model = get_embed_model()
+    chunks = chunk_text(text, budget=budget)
+    embedded: List[Dict[str, Any]] = []
+    while True:
+        with span("chunk"):
+            batch = [chunk for chunk, _ in islice(chunks, EMBED_BATCH_SIZE)]
+        if not batch:
+            return embedded
+        with span("embed"):
+            embeddings = embed_model.get_text_embedding_batch(batch)
+        embedded.extend({"text": chunk, "embedding": embedding} for chunk, embedding in zip(batch, embeddings))
+
+def _store_chunks(document: CachedDocument, chunks: List[Dict[str, Any]]) -> None:
+    vector_store.put(
+        document.url,
+        document.content_hash,
+        [chunk["text"] for chunk in chunks],
+        [chunk["embedding"] for chunk in chunks],
+        metadata={"url": document.url},
+    )
+
+def _has_vectors(document: CachedDocument) -> bool:
+    """
+    True if the page's chunks are in the shared vector store.
+
+    Cache entries written before the store existed carry their chunks, which are moved there.
+    """
+    segment = vector_store.get(document.url)
+    if segment is not None and segment.version == document.content_hash:
+        return True
+    if not document.chunks:
+        return False
+    _store_chunks(document, document.chunks)
+    document.chunks = []
+    document_cache.put(document)
+    return True
+
+async def _load_documents(urls: List[str]) -> Tuple[List[CachedDocument], Dict[str, str]]:
+    """
+    Return cached pages for the URLs, concurrently revalidating or re-fetching stale ones.
+
+    URLs that fail to load are returned with their error instead of failing the
+    whole request; a stale cached copy is served when revalidation fails.
+    """
+    documents: Dict[str, CachedDocument] = {}
+    stale: Dict[str, Optional[CachedDocument]] = {}
+    model_id = embedding_model_id()
+    for url in dict.fromkeys(urls):
+        cached = document_cache.get(url)
+        if cached is not None and (cached.embedding_model != model_id or not _has_vectors(cached)):
+            # Embedded by a different model, or compacted out of the store: fetch and embed again
+            cached = None
+        if cached is not None and document_cache.is_fresh(cached):
+            record_cache("document", "hit")
+            documents[url] = cached
+        else:
+            stale[url] = cached
+
+    with span("fetch"):
+        results = await page_fetcher.fetch_all([
+            (url, cached.etag if cached else None, cached.last_modified if cached else None)
+            for url, cached in stale.items()
+        ])
+
+    failed: Dict[str, str] = {}
+    to_embed: List[CachedDocument] = []
+    for result in results:
+        cached = stale[result.url]
+        if result.error:
+            if cached is not None:
+                record_cache("document", "stale")
+                documents[result.url] = cached
+            else:
+                failed[result.url] = result.error
+            continue
+
+        if result.not_modified and cached is not None:
+            record_cache("document", "revalidated")
+            document_cache.touch(cached)
+            documents[result.url] = cached
+            continue
+
+        digest = content_hash(result.text)
+        # Same content behind a new response: keep the existing embeddings
+        if cached is not None and cached.content_hash == digest:
+            record_cache("document", "revalidated")
+            cached.etag, cached.last_modified = result.etag, result.last_modified
+            document_cache.touch(cached)
+            documents[result.url] = cached
+            continue
+
+        record_cache("document", "miss")
+        to_embed.append(CachedDocument(
+            url=result.url,
+            content_hash=digest,
+            text=result.text,
+            etag=result.etag,
+            last_modified=result.last_modified,
+            embedding_model=model_id,
+        ))
+
+    if to_embed:
+        budget = TokenBudget(CHUNK_MAX_TOKENS_PER_REQUEST)
+
+        def embed_all() -> List[bool]:
+            truncated = []
+            for document in to_embed:
+                _store_chunks(document, _embed_chunks(document.text, budget))
+                truncated.append(budget.exhausted)
+            return truncated
+
+        for document, truncated in zip(to_embed, await executor.run_io(embed_all)):
+            # A page cut short by the request budget is only used for this request
+            if not truncated:
+                document_cache.put(document)
+            documents[document.url] = document
+
+    return [documents[url] for url in dict.fromkeys(urls) if url in documents], failed
 
-# Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-supabase_client = supabase.create_client(supabase_url, supabase_key)
+async def _browser_documents(urls: List[str]) -> Tuple[List[CachedDocument], List[str], Dict[str, str], str]:
+    """
+    Load the pages behind the URLs, with their chunks in the shared vector store.
+    
+    Also returns a version fingerprint of the loaded content for the semantic cache.
+    """
+    # Load pages from the cache, fetching and embedding only new or changed ones
+    documents, failed_urls = await _load_documents(urls)
+    if not documents:
+        raise ValueError(f"Could not load any of the provided URLs: {failed_urls}")
+    
+    version = content_hash("".join(sorted(document.content_hash for document in documents)))
+    return documents, [document.url for document in documents], failed_urls, version
+
+async def _database_nodes(
+    query: str,
+    query_embedding: List[float],
+    collection_name: Optional[str],
+    category: Optional[str],
+    tags: Optional[List[str]],
+    top_k: Optional[int]
+) -> Tuple[List[NodeWithScore], List[str]]:
+    """
+    Fetch the best matching rag_documents from Postgres (hybrid full-text + vector search)
+    """
+    def search():
+        with span("retrieval"):
+            rows = search_rag_documents(
+                get_supabase_client(),
+                query_embedding,
+                candidate_count(top_k or RAG_TOP_K),
+                category or collection_name,
+                tags,
+                query
+            )
+        return _context_nodes(query, rows, top_k)
+    
+    return await executor.run_io(search)
+
+def _row_nodes(rows: List[Dict[str, Any]]) -> Tuple[List[NodeWithScore], List[str]]:
+    from llama_index.core.schema import TextNode, NodeWithScore
+    
+    nodes = [
+        NodeWithScore(
+            node=TextNode(
+                text=row["content"],
+                metadata={"id": row.get("id"), "title": row["title"], "url": row.get("url")}
+            ),
+            score=row.get("score", row.get("similarity"))
+        )
+        for row in rows
+    ]
+    return nodes, [row["title"] for row in rows]
+
+def _compress(query: str, nodes: List[NodeWithScore], top_n: int) -> List[NodeWithScore]:
+    """
+    The retrieved nodes worth sending to the LLM, best first: reranked, without
+    near-copies and trimmed to the context token budget
+    """
+    from llama_index.core.schema import TextNode, NodeWithScore
+    
+    if not RERANK_ENABLED or not nodes:
+        return nodes
+    with span("rerank"):
+        result = compress(query, [node.node.get_content() for node in nodes], [node.score for node in nodes], top_n)
+    record_context_tokens(result.context_tokens, result.saved_tokens)
+    kept = []
+    for i, text in zip(result.indices, result.texts):
+        node = nodes[i]
+        if text != node.node.get_content():
+            node = NodeWithScore(
+                node=TextNode(id_=node.node.node_id, text=text, metadata=dict(node.node.metadata)),
+                score=node.score
+            )
+        kept.append(node)
+    return kept
+
+def _context_nodes(query: str, rows: List[Dict[str, Any]], top_k: Optional[int]) -> Tuple[List[NodeWithScore], List[str]]:
+    """
+    Context nodes for the answer from over-fetched rag_documents rows, and their titles
+    """
+    nodes = _compress(query, _row_nodes(rows)[0], top_k or RAG_TOP_K)
+    return nodes, [node.node.metadata["title"] for node in nodes]
+
+async def _entity_nodes(query: str) -> Tuple[List[NodeWithScore], List[str], bool]:
+    """
+    Reference entities mentioned in the query, as grounded context nodes.
+    
+    The flag is set when the query is a plain lookup about them and needs no retrieval.
+    """
+    with span("entity_match"):
+        entities, other_words = await entity_index.match(query)
+    record_cache("entity", "hit" if entities else "miss")
+    return _reference_nodes(entities), [entity.name for entity in entities], is_simple_lookup(entities, other_words)
+
+def _reference_nodes(entities: List[Entity]) -> List[NodeWithScore]:
+    from llama_index.core.schema import TextNode, NodeWithScore
+    
+    return [
+        NodeWithScore(
+            node=TextNode(
+                text=entity.context(),
+                metadata={"entity": entity.kind, "entity_id": entity.id, "title": entity.name}
+            ),
+            score=1.0
+        )
+        for entity in entities
+    ]
+
+async def _patient_nodes(
+    user_id: Optional[str], query: str, entity_nodes: List[NodeWithScore], filtered: bool, top_k: Optional[int]
+) -> Optional[Tuple[List[NodeWithScore], List[str]]]:
+    """
+    Context from the patient's pre-warmed bundle, if it covers the question.
+    
+    Questions filtered to a collection, category or tags always go to the search.
+    """
+    context = None if filtered else patient_contexts.get(user_id)
+    if context is None:
+        return None
+    entity_keys = [(node.node.metadata["entity"], node.node.metadata["entity_id"]) for node in entity_nodes]
+    if not context.covers(query, entity_keys):
+        record_cache("patient_context", "miss")
+        return None
+    record_cache("patient_context", "hit")
+    nodes, sources = await executor.run_io(_context_nodes, query, context.documents, top_k)
+    return _reference_nodes(context.entities) + nodes, [entity.name for entity in context.entities] + sources
+
+def _database_scope(collection_name, category, tags, top_k) -> Tuple:
+    return ("collection", category or collection_name, tuple(sorted(tags or [])), top_k or RAG_TOP_K)
+
+async def _embed_query(query: str, database: bool = False) -> List[float]:
+    # rag_documents are searched with the model that embedded them
+    get_model = get_database_embed_model if database else get_embed_model
+    with span("embed_query"):
+        return await executor.run_io(lambda: get_model().get_query_embedding(query))
+
+async def _embed_queries(queries: List[str], database: bool = False) -> List[List[float]]:
+    """
+    Embed several queries in batched calls (the models used embed queries and texts alike)
+    """
+    if not queries:
+        return []
+    get_model = get_database_embed_model if database else get_embed_model
+    with span("embed_query"):
+        return await executor.run_io(lambda: get_model().get_text_embedding_batch(queries))
+
+async def _gather_limited(calls: List[Callable[[], Awaitable[Any]]], limit: int) -> List[Any]:
+    """
+    Run the calls concurrently, at most ``limit`` at a time; exceptions are returned, not raised
+    """
+    semaphore = asyncio.Semaphore(limit)
+    
+    async def run(call):
+        async with semaphore:
+            return await call()
+    
+    return await asyncio.gather(*(run(call) for call in calls), return_exceptions=True)
+
+def _batch_item(query: str, outcome: Any) -> Dict[str, Any]:
+    if isinstance(outcome, Exception):
+        return {"query": query, "error": str(outcome)}
+    return {"query": query, **outcome}
+
+def _lookup_answer(scope: Optional[Tuple], query_embedding: List[float], version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    # Answers that depend on the conversation so far have no scope and are never cached
+    if scope is None:
+        return None
+    cached = semantic_cache.lookup(scope, query_embedding, version)
+    record_cache("semantic", "miss" if cached is None else "hit")
+    return cached
+
+def _build_index(documents: List[CachedDocument]) -> Any:
+    """
+    Index over the pages' rows in the shared vector store; no vectors are copied
+    """
+    from llama_index.core import VectorStoreIndex
+    from shared_index import SharedVectorStoreView
+    
+    get_embed_model()
+    with span("index_build"):
+        view = SharedVectorStoreView(vector_store, [(document.url, document.content_hash) for document in documents])
+        return VectorStoreIndex.from_vector_store(view)
+
+def _retrieve(index: Any, query: QueryBundle) -> List[NodeWithScore]:
+    if not RERANK_ENABLED:
+        with span("retrieval"):
+            return index.as_retriever().retrieve(query)
+    with span("retrieval"):
+        nodes = index.as_retriever(similarity_top_k=candidate_count(RAG_TOP_K)).retrieve(query)
+    return _compress(query.query_str, nodes, RAG_TOP_K)
+
+async def _browser_index(urls: List[str]) -> Tuple[Any, List[str], Dict[str, str], str]:
+    """
+    Load the pages behind the URLs and index them.
+    
+    Concurrent calls for the same URL set share one fetch, embed and index build.
+    """
+    async def build():
+        documents, source_urls, failed_urls, version = await _browser_documents(urls)
+        index = await executor.run_io(_build_index, documents)
+        return index, source_urls, failed_urls, version
+    
+    return await index_flights.do(tuple(sorted(set(urls))), build)
+
+def _query_bundle(query: str, query_embedding: List[float]) -> QueryBundle:
+    from llama_index.core.schema import QueryBundle
+    
+    return QueryBundle(query, embedding=query_embedding)
+
+def _store_answer(scope: Optional[Tuple], query_embedding: List[float], value: Dict[str, Any], **kwargs) -> None:
+    if scope is not None:
+        semantic_cache.store(scope, query_embedding, value, **kwargs)
+
+async def _synthesize(
+    query: str,
+    nodes: List[NodeWithScore],
+    streaming: bool = False,
+    history: Optional[str] = None,
+    model: Optional[str] = None
+) -> Any:
+    if history:
+        query = f"{history}\n\nCurrent question: {query}"
+    
+    def run():
+        from llama_index.core import get_response_synthesizer
+        
+        return get_response_synthesizer(llm=get_llm(model), streaming=streaming).synthesize(query, nodes)
+    
+    with span("llm"):
+        return await executor.run_io(run)
+
+async def _stream_tokens(response: Any) -> AsyncIterator[str]:
+    with span("llm_stream"):
+        async for token in executor.iterate_io(response.response_gen):
+            yield token
+
+def _route(query: str, nodes: List[NodeWithScore], grounded: bool) -> Any:
+    route = route_query(query, [node.node.get_content() for node in nodes], grounded)
+    record_route(route.tier, route.reason)
+    return route
+
+async def _answer(
+    query: str, nodes: List[NodeWithScore], history: Optional[str] = None, grounded: bool = False
+) -> Tuple[str, str]:
+    """
+    Answer with the model routed for the question, and return the model used.
+    
+    A fast-model answer that hedges is redone by the large model.
+    """
+    route = _route(query, nodes, grounded)
+    response = str(await _synthesize(query, nodes, history=history, model=route.model))
+    if route.can_fall_back and is_low_confidence(response):
+        record_route("large", "fallback")
+        return str(await _synthesize(query, nodes, history=history, model=LLM_MODEL)), LLM_MODEL
+    return response, route.model
+
+async def _answer_stream(
+    query: str, nodes: List[NodeWithScore], history: Optional[str] = None, grounded: bool = False
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Streaming variant of _answer: yields ("token", text) events, then ("model", name).
+    
+    The first ROUTER_PROBE_CHARS of a fast-model answer are held back and checked,
+    so a hedging answer is replaced by the large model's before anything is sent.
+    """
+    route = _route(query, nodes, grounded)
+    model = route.model
+    tokens = _stream_tokens(await _synthesize(query, nodes, streaming=True, history=history, model=model))
+    if route.can_fall_back:
+        held, held_chars = [], 0
+        async for token in tokens:
+            held.append(token)
+            held_chars += len(token)
+            if held_chars >= ROUTER_PROBE_CHARS:
+                break
+        if is_low_confidence("".join(held)):
+            await tokens.aclose()
+            record_route("large", "fallback")
+            model = LLM_MODEL
+            tokens = _stream_tokens(await _synthesize(query, nodes, streaming=True, history=history, model=model))
+        else:
+            for token in held:
+                yield "token", token
+    async for token in tokens:
+        yield "token", token
+    yield "model", model
+
+async def _browser_answer(query: str, urls: List[str], history: Optional[str] = None) -> Dict[str, Any]:
+    index, source_urls, failed_urls, version = await _browser_index(urls)
+    
+    # Serve near-identical questions about the same pages from the semantic cache
+    scope = None if history else ("urls",) + tuple(sorted(source_urls))
+    query_embedding = await _embed_query(query)
+    cached = _lookup_answer(scope, query_embedding, version)
+    
+    if cached is not None:
+        result = dict(cached)
+    else:
+        # Retrieve from the pre-embedded nodes and answer off the event loop
+        retrieved = await executor.run_io(_retrieve, index, _query_bundle(query, query_embedding))
+        response, model = await _answer(query, retrieved, history=history)
+        result = {
+            "response": response,
+            "source_urls": source_urls,
+            "model": model
+        }
+        _store_answer(scope, query_embedding, dict(result), version=version)
+    
+    if failed_urls:
+        result["failed_urls"] = failed_urls
+    return result
+
+async def _database_answer(
+    query: str,
+    user_id: Optional[str],
+    collection_name: Optional[str],
+    category: Optional[str],
+    tags: Optional[List[str]],
+    top_k: Optional[int],
+    history: Optional[str] = None
+) -> Dict[str, Any]:
+    entity_nodes, entity_sources, simple_lookup = await _entity_nodes(query)
+    if simple_lookup:
+        # Answered from the reference tables alone: no query embedding or search
+        response, model = await _answer(query, entity_nodes, history=history, grounded=True)
+        return {"response": response, "sources": entity_sources, "model": model}
+    
+    patient = await _patient_nodes(user_id, query, entity_nodes, bool(collection_name or category or tags), top_k)
+    if patient is not None:
+        # The patient's own context is not shared through the semantic cache
+        nodes, sources = patient
+        response, model = await _answer(query, nodes, history=history)
+        return {"response": response, "sources": sources, "model": model}
+    
+    query_embedding = await _embed_query(query, database=True)
+    scope = None if history else _database_scope(collection_name, category, tags, top_k)
+    cached = _lookup_answer(scope, query_embedding)
+    if cached is not None:
+        return dict(cached)
+    
+    nodes, sources = await _database_nodes(query, query_embedding, collection_name, category, tags, top_k)
+    nodes, sources = entity_nodes + nodes, entity_sources + sources
+    
+    if not nodes:
+        return {
+            "response": "No documents found in your collection.",
+            "sources": []
+        }
+    
+    # Answer from the retrieved documents off the event loop
+    response, model = await _answer(query, nodes, history=history)
+    
+    result = {
+        "response": response,
+        "sources": sources,
+        "model": model
+    }
+    _store_answer(scope, query_embedding, dict(result))
+    return result
+
+async def _browser_batch(queries: List[str], urls: List[str]) -> Dict[str, Any]:
+    """
+    Answer several questions about the same pages with one index and one embedding call
+    """
+    index, source_urls, failed_urls, version = await _browser_index(urls)
+    scope = ("urls",) + tuple(sorted(source_urls))
+    embeddings = await _embed_queries(queries)
+    
+    cached = [_lookup_answer(scope, embedding, version) for embedding in embeddings]
+    misses = [i for i, hit in enumerate(cached) if hit is None]
+    # All retrievals run in one hop off the event loop
+    retrieved = await executor.run_io(
+        lambda: [_retrieve(index, _query_bundle(queries[i], embeddings[i])) for i in misses]
+    )
+    
+    async def answer(i: int, nodes: List[NodeWithScore]) -> Dict[str, Any]:
+        response, model = await _answer(queries[i], nodes)
+        result = {"response": response, "model": model}
+        _store_answer(scope, embeddings[i], {**result, "source_urls": source_urls}, version=version)
+        return result
+    
+    answers = await _gather_limited(
+        [lambda i=i, nodes=nodes: answer(i, nodes) for i, nodes in zip(misses, retrieved)],
+        BATCH_LLM_CONCURRENCY
+    )
+    outcomes: List[Any] = [
+        {key: hit[key] for key in ("response", "model") if key in hit} if hit is not None else None
+        for hit in cached
+    ]
+    for i, outcome in zip(misses, answers):
+        outcomes[i] = outcome
+    
+    result = {
+        "results": [_batch_item(query, outcome) for query, outcome in zip(queries, outcomes)],
+        "source_urls": source_urls
+    }
+    if failed_urls:
+        result["failed_urls"] = failed_urls
+    return result
+
+async def _database_batch(
+    queries: List[str],
+    user_id: Optional[str],
+    collection_name: Optional[str],
+    category: Optional[str],
+    tags: Optional[List[str]],
+    top_k: Optional[int]
+) -> Dict[str, Any]:
+    """
+    Answer several questions over the same collection with one embedding call and one search
+    """
+    scope = _database_scope(collection_name, category, tags, top_k)
+    entities = await asyncio.gather(*(_entity_nodes(query) for query in queries))
+    filtered = bool(collection_name or category or tags)
+    patient = await asyncio.gather(*(
+        _patient_nodes(user_id, query, nodes, filtered or simple_lookup, top_k)
+        for query, (nodes, _, simple_lookup) in zip(queries, entities)
+    ))
+    
+    # Plain reference lookups and questions the patient's bundle covers need no embedding or search
+    to_embed = [
+        i for i, (_, _, simple_lookup) in enumerate(entities) if not simple_lookup and patient[i] is None
+    ]
+    embeddings = dict(zip(to_embed, await _embed_queries([queries[i] for i in to_embed], database=True)))
+    outcomes: List[Any] = [None] * len(queries)
+    for i in to_embed:
+        cached = _lookup_answer(scope, embeddings[i])
+        if cached is not None:
+            outcomes[i] = dict(cached)
+    to_search = [i for i in to_embed if outcomes[i] is None]
+    
+    with span("retrieval"):
+        rows = await executor.run_io(
+            search_rag_documents_batch,
+            get_supabase_client(),
+            [embeddings[i] for i in to_search],
+            [queries[i] for i in to_search],
+            candidate_count(top_k or RAG_TOP_K),
+            category or collection_name,
+            tags
+        )
+    searched = dict(zip(to_search, rows))
+    
+    async def answer(i: int) -> Dict[str, Any]:
+        nodes, sources = patient[i] or entities[i][:2]
+        if i in searched:
+            row_nodes, row_sources = await executor.run_io(_context_nodes, queries[i], searched[i], top_k)
+            nodes, sources = nodes + row_nodes, sources + row_sources
+        if not nodes:
+            return {"response": "No documents found in your collection.", "sources": []}
+        response, model = await _answer(queries[i], nodes, grounded=entities[i][2])
+        result = {"response": response, "sources": sources, "model": model}
+        if i in searched:
+            _store_answer(scope, embeddings[i], dict(result))
+        return result
+    
+    pending = [i for i, outcome in enumerate(outcomes) if outcome is None]
+    answers = await _gather_limited([lambda i=i: answer(i) for i in pending], BATCH_LLM_CONCURRENCY)
+    for i, outcome in zip(pending, answers):
+        outcomes[i] = outcome
+    return {"results": [_batch_item(query, outcome) for query, outcome in zip(queries, outcomes)]}
 
 class RAGAgent:
     @staticmethod
-    async def browser_rag(query: str, urls: List[str]) -> Dict[str, Any]:
+    async def browser_rag(query: str, urls: List[str], history: Optional[str] = None) -> Dict[str, Any]:
         """
         Perform browser-assisted RAG using provided URLs
         """
-        # Load documents from URLs
-        documents = SimpleWebPageReader().load_data(urls)
+        if history:
+            return await _browser_answer(query, urls, history)
+        key = ("urls", tuple(sorted(set(urls))), query)
+        return dict(await answer_flights.do(key, lambda: _browser_answer(query, urls)))
+    
+    @staticmethod
+    async def browser_rag_stream(
+        query: str, urls: List[str], history: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of browser_rag: yields ("token", text) events, then ("sources", ...)
+        with the source URLs and the model that answered
+        """
+        index, source_urls, failed_urls, version = await _browser_index(urls)
         
-        # Create index from documents
-        index = VectorStoreIndex.from_documents(documents)
+        scope = None if history else ("urls",) + tuple(sorted(source_urls))
+        query_embedding = await _embed_query(query)
+        cached = _lookup_answer(scope, query_embedding, version)
         
-        # Query the index
-        query_engine = index.as_query_engine()
-        response = query_engine.query(query)
+        if cached is not None:
+            model = cached.get("model")
+            yield "token", cached["response"]
+        else:
+            retrieved = await executor.run_io(_retrieve, index, _query_bundle(query, query_embedding))
+            tokens = []
+            async for event, data in _answer_stream(query, retrieved, history=history):
+                if event == "model":
+                    model = data
+                    continue
+                tokens.append(data)
+                yield "token", data
+            _store_answer(
+                scope,
+                query_embedding,
+                {"response": "".join(tokens), "source_urls": source_urls, "model": model},
+                version=version
+            )
         
-        return {
-            "response": str(response),
-            "source_urls": urls
-        }
+        sources = {"source_urls": source_urls, "model": model}
+        if failed_urls:
+            sources["failed_urls"] = failed_urls
+        yield "sources", sources
     
     @staticmethod
-    async def database_rag(query: str, user_id: str, collection_name: Optional[str] = None) -> Dict[str, Any]:
+    async def database_rag(
+        query: str,
+        user_id: str,
+        collection_name: Optional[str] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        top_k: Optional[int] = None,
+        history: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        Perform database RAG using documents from Supabase
+        Perform database RAG using a pgvector similarity search over rag_documents.
+        
+        Only the query is embedded; the collection name is used as the category filter.
+        Questions covered by the patient's pre-warmed context bundle skip the search.
+        Identical concurrent questions over the same collection share one answer.
         """
-        # Get user-specific data from Supabase
-        collection = collection_name or "default_collection"
+        if history:
+            return await _database_answer(query, user_id, collection_name, category, tags, top_k, history)
+        # Only a flight keyed by the patient may use their bundle; one built after this
+        # check is left for their next question rather than shared with other callers
+        patient = user_id if patient_contexts.get(user_id) is not None else None
+        key = (_database_scope(collection_name, category, tags, top_k), query, patient)
+        result = await answer_flights.do(
+            key, lambda: _database_answer(query, patient, collection_name, category, tags, top_k)
+        )
+        return dict(result)
+    
+    @staticmethod
+    async def browser_rag_batch(queries: List[str], urls: List[str]) -> Dict[str, Any]:
+        """
+        Answer a list of questions about the same URLs.
+        
+        The pages are loaded and indexed once, the questions embedded together and
+        the answers generated concurrently (up to BATCH_LLM_CONCURRENCY at a time).
+        Each result carries either a response or the error for that question.
+        """
+        return await _browser_batch(queries, urls)
+    
+    @staticmethod
+    async def database_rag_batch(
+        queries: List[str],
+        user_id: str,
+        collection_name: Optional[str] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        top_k: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer a list of questions over the same collection.
         
-        # Query user's documents from the database
-        response = supabase_client.table("documents").select("*").eq("user_id", user_id).eq("collection", collection).execute()
+        The questions are embedded together and searched in one database call;
+        answers are generated concurrently (up to BATCH_LLM_CONCURRENCY at a time).
+        """
+        return await _database_batch(queries, user_id, collection_name, category, tags, top_k)
+    
+    @staticmethod
+    async def database_rag_stream(
+        query: str,
+        user_id: str,
+        collection_name: Optional[str] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        top_k: Optional[int] = None,
+        history: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of database_rag: yields ("token", text) events, then ("sources", ...)
+        with the document titles and the model that answered
+        """
+        entity_nodes, entity_sources, simple_lookup = await _entity_nodes(query)
+        if simple_lookup:
+            async for event, data in _answer_stream(query, entity_nodes, history=history, grounded=True):
+                if event == "model":
+                    model = data
+                else:
+                    yield "token", data
+            yield "sources", {"sources": entity_sources, "model": model}
+            return
         
-        if not response.data:
-            return {
-                "response": "No documents found in your collection.",
-                "sources": []
-            }
+        patient = await _patient_nodes(user_id, query, entity_nodes, bool(collection_name or category or tags), top_k)
+        if patient is not None:
+            nodes, sources = patient
+            async for event, data in _answer_stream(query, nodes, history=history):
+                if event == "model":
+                    model = data
+                else:
+                    yield "token", data
+            yield "sources", {"sources": sources, "model": model}
+            return
         
-        # Process documents from database
-        documents = [doc["content"] for doc in response.data]
+        query_embedding = await _embed_query(query, database=True)
+        scope = None if history else _database_scope(collection_name, category, tags, top_k)
+        cached = _lookup_answer(scope, query_embedding)
+        if cached is not None:
+            yield "token", cached["response"]
+            yield "sources", {"sources": cached["sources"], "model": cached.get("model")}
+            return
         
-        # Create index from documents
-        index = VectorStoreIndex.from_documents(documents)
+        nodes, sources = await _database_nodes(query, query_embedding, collection_name, category, tags, top_k)
+        nodes, sources = entity_nodes + nodes, entity_sources + sources
         
-        # Query the index
-        query_engine = index.as_query_engine()
-        response = query_engine.query(query)
+        if not nodes:
+            yield "token", "No documents found in your collection."
+            yield "sources", {"sources": sources}
+            return
         
-        return {
-            "response": str(response),
-            "sources": [doc["title"] for doc in response.data]
-        }
\ No newline at end of file
+        tokens = []
+        async for event, data in _answer_stream(query, nodes, history=history):
+            if event == "model":
+                model = data
+                continue
+            tokens.append(data)
+            yield "token", data
+        _store_answer(
+            scope,
+            query_embedding,
+            {"response": "".join(tokens), "sources": sources, "model": model}
+        )
+        yield "sources", {"sources": sources, "model": model}
@@ -1,22 +1,87 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Optional, Tuple
+import asyncio
+import json
+import time
 from passlib.context import CryptContext
+from pydantic import ValidationError
 import jwt
 import os
 from dotenv import load_dotenv
-import supabase
 
 # Import local modules
-from models import User, Token, TokenData, QueryRequest, DatabaseQueryRequest
-from agent import RAGAgent, supabase_client
+from models import (
+    User, Token, TokenData, QueryRequest, DatabaseQueryRequest, BatchQueryRequest, BatchDatabaseQueryRequest,
+    ChatMessage
+)
+from agent import RAGAgent, entity_index, on_documents_written, page_fetcher, patient_contexts, vector_store
+from clients import get_supabase_client, warm_up, warmup_state
+from cache import TTLCache
+from history import HISTORY_PAGE_SIZE, conversation_context, fetch_messages, message_writer, record_stream
+from jobs import FINISHED, JobRejected, fetch_job, job_queue
+from bulk_import import bulk_importer, embedding_queue, fetch_imports, import_format
+from patient_context import PATIENT_CONTEXT_ENABLED, PATIENT_CONTEXT_REALTIME
+from metrics import MetricsMiddleware, span, record_cache, record_websocket, stage_timings, render as render_metrics
+import executor
 
 # Load environment variables
 load_dotenv()
 
+# Import and connect the LLM, embedding and Supabase clients in the background at start-up
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+WARMUP_PING = os.getenv("WARMUP_PING", "false").lower() == "true"
+# How often a job's event stream checks on a job running in another worker
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# How long a new chat WebSocket may take to send its token
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+
+# Rows embedded after an import drop the cached answers and patient bundles they may change
+embedding_queue.on_written = on_documents_written
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup = None
+    if WARMUP_ON_STARTUP:
+        # Serve immediately; /readyz reports when the clients are in place
+        warmup = asyncio.ensure_future(executor.run_io(warm_up, WARMUP_PING))
+    else:
+        warmup_state["ready"] = True
+    message_writer.start()
+    job_queue.start()
+    # Rebuild the entity matcher when the reference tables change
+    entity_refresh = asyncio.ensure_future(entity_index.run())
+    # Drop replaced pages from the shared vector store now and then
+    vector_compaction = asyncio.ensure_future(vector_store.run())
+    # Drop patients' context bundles when their users row changes
+    patient_refresh = asyncio.ensure_future(patient_contexts.run()) if PATIENT_CONTEXT_REALTIME else None
+    yield
+    entity_refresh.cancel()
+    vector_compaction.cancel()
+    if patient_refresh is not None:
+        patient_refresh.cancel()
+    embedding_queue.cancel()
+    await job_queue.stop()
+    if warmup is not None:
+        await asyncio.gather(warmup, return_exceptions=True)
+    # Write any buffered chat turns before exiting
+    try:
+        await message_writer.stop()
+    except Exception:
+        pass
+    # Release pooled HTTP connections and worker threads on shutdown
+    await page_fetcher.aclose()
+    executor.shutdown(wait=False)
+
 # Initialize FastAPI app
-app = FastAPI(title="LlamaIndex AI Agent API")
+app = FastAPI(title="LlamaIndex AI Agent API", lifespan=lifespan)
+
+# Request latency, in-flight gauge and Server-Timing header
+app.add_middleware(MetricsMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -38,6 +103,12 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Short-lived cache of user rows for tokens without profile claims
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "60")),
+)
+
 # Helper functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -45,6 +116,15 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def user_claims(user: dict) -> dict:
+    """
+    Profile fields embedded in the access token so requests can skip the user lookup
+    """
+    return {"sub": user["username"], "uid": user.get("id"), "email": user.get("email")}
+
+def invalidate_user(username: str):
+    user_cache.invalidate(username)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
@@ -55,7 +135,10 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def authenticate(token: str) -> Tuple[dict, dict]:
+    """
+    The user a bearer token belongs to, and the token's claims
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -70,19 +153,50 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except jwt.PyJWTError:
         raise credentials_exception
     
+    # Tokens issued with profile claims are self-contained
+    if payload.get("uid"):
+        record_cache("user", "claims")
+        return {"id": payload["uid"], "username": token_data.username, "email": payload.get("email")}, payload
+    
+    user = user_cache.get(token_data.username)
+    record_cache("user", "miss" if user is None else "hit")
+    if user is not None:
+        return user, payload
+    
     # Get user from database
-    response = supabase_client.table("users").select("*").eq("username", token_data.username).execute()
+    with span("supabase"):
+        response = await executor.run_io(
+            get_supabase_client().table("users").select("*").eq("username", token_data.username).execute
+        )
     user = response.data[0] if response.data else None
     
     if user is None:
         raise credentials_exception
+    user_cache.set(token_data.username, user)
+    return user, payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    user, _ = await authenticate(token)
     return user
 
+async def get_current_admin(current_user: dict = Depends(get_current_user)):
+    with span("supabase"):
+        response = await executor.run_io(
+            get_supabase_client().table("user_roles").select("role")
+            .eq("user_id", current_user["id"]).eq("role", "admin").execute
+        )
+    if not response.data:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required")
+    return current_user
+
 # Authentication endpoints
 @app.post("/register", response_model=Token)
 async def register_user(user: User):
     # Check if user already exists
-    response = supabase_client.table("users").select("*").eq("username", user.username).execute()
+    with span("supabase"):
+        response = await executor.run_io(
+            get_supabase_client().table("users").select("*").eq("username", user.username).execute
+        )
     if response.data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -90,29 +204,41 @@ async def register_user(user: User):
         )
     
     # Hash password and store user
-    hashed_password = get_password_hash(user.password)
+    with span("password_hash"):
+        hashed_password = await executor.run_cpu(get_password_hash, user.password)
     new_user = {
         "username": user.username,
         "email": user.email,
         "hashed_password": hashed_password
     }
     
-    supabase_client.table("users").insert(new_user).execute()
+    with span("supabase"):
+        inserted = await executor.run_io(get_supabase_client().table("users").insert(new_user).execute)
+    invalidate_user(user.username)
+    created = inserted.data[0] if inserted.data else new_user
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=user_claims(created), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends()):
     # Get user from database
-    response = supabase_client.table("users").select("*").eq("username", form_data.username).execute()
+    with span("supabase"):
+        response = await executor.run_io(
+            get_supabase_client().table("users").select("*").eq("username", form_data.username).execute
+        )
     user = response.data[0] if response.data else None
     
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    password_ok = False
+    if user:
+        with span("password_verify"):
+            password_ok = await executor.run_cpu(verify_password, form_data.password, user["hashed_password"])
+    
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -122,8 +248,13 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": form_data.username}, expires_delta=access_token_expires
+        data=user_claims(user), expires_delta=access_token_expires
     )
+    # Retrieve the patient's context after the response, so the first question finds it ready
+    if PATIENT_CONTEXT_ENABLED and (user.get("diagnosis") or user.get("prescription")):
+        background_tasks.add_task(patient_contexts.warm, {
+            key: user.get(key) for key in ("id", "diagnosis", "prescription")
+        })
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Browser-assisted RAG endpoint
@@ -136,7 +267,10 @@ async def browser_rag(request: QueryRequest, current_user: dict = Depends(get_cu
                 detail="No URLs provided for browser RAG"
             )
         
-        result = await RAGAgent.browser_rag(request.query, request.urls)
+        history = await conversation_context(current_user["id"]) if request.use_history else None
+        result = await RAGAgent.browser_rag(request.query, request.urls, history=history)
+        if request.use_history:
+            message_writer.record_turn(current_user["id"], request.query, result["response"])
         return result
     except Exception as e:
         raise HTTPException(
@@ -148,11 +282,18 @@ async def browser_rag(request: QueryRequest, current_user: dict = Depends(get_cu
 @app.post("/database-rag")
 async def database_rag(request: DatabaseQueryRequest, current_user: dict = Depends(get_current_user)):
     try:
+        history = await conversation_context(current_user["id"]) if request.use_history else None
         result = await RAGAgent.database_rag(
             query=request.query,
             user_id=current_user["id"],
-            collection_name=request.collection_name
+            collection_name=request.collection_name,
+            category=request.category,
+            tags=request.tags,
+            top_k=request.top_k,
+            history=history
         )
+        if request.use_history:
+            message_writer.record_turn(current_user["id"], request.query, result["response"])
         return result
     except Exception as e:
         raise HTTPException(
@@ -160,6 +301,278 @@ async def database_rag(request: DatabaseQueryRequest, current_user: dict = Depen
             detail=f"Error processing database RAG: {str(e)}"
         )
 
+# Batch variants: one index / collection search shared by several questions
+@app.post("/browser-rag/batch")
+async def browser_rag_batch(request: BatchQueryRequest, current_user: dict = Depends(get_current_user)):
+    if not request.urls:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No URLs provided for browser RAG"
+        )
+    try:
+        return await RAGAgent.browser_rag_batch(request.queries, request.urls)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing browser RAG batch: {str(e)}"
+        )
+
+@app.post("/database-rag/batch")
+async def database_rag_batch(request: BatchDatabaseQueryRequest, current_user: dict = Depends(get_current_user)):
+    try:
+        return await RAGAgent.database_rag_batch(
+            queries=request.queries,
+            user_id=current_user["id"],
+            collection_name=request.collection_name,
+            category=request.category,
+            tags=request.tags,
+            top_k=request.top_k
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing database RAG batch: {str(e)}"
+        )
+
+# Streaming (server-sent events) variants of the RAG endpoints
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def sse_stream(events: AsyncIterator[Tuple[str, Any]], timings: bool = False) -> AsyncIterator[str]:
+    try:
+        async for event, data in events:
+            yield format_sse(event, data)
+    except Exception as e:
+        yield format_sse("error", {"detail": str(e)})
+    if timings:
+        # The Server-Timing header went out before retrieval and generation ran
+        yield format_sse("timing", stage_timings())
+
+@app.post("/browser-rag/stream")
+async def browser_rag_stream(request: QueryRequest, current_user: dict = Depends(get_current_user)):
+    if not request.urls:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No URLs provided for browser RAG"
+        )
+    
+    history = await conversation_context(current_user["id"]) if request.use_history else None
+    events = RAGAgent.browser_rag_stream(request.query, request.urls, history=history)
+    if request.use_history:
+        events = record_stream(events, current_user["id"], request.query)
+    return StreamingResponse(sse_stream(events, timings=True), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/database-rag/stream")
+async def database_rag_stream(request: DatabaseQueryRequest, current_user: dict = Depends(get_current_user)):
+    history = await conversation_context(current_user["id"]) if request.use_history else None
+    events = RAGAgent.database_rag_stream(
+        query=request.query,
+        user_id=current_user["id"],
+        collection_name=request.collection_name,
+        category=request.category,
+        tags=request.tags,
+        top_k=request.top_k,
+        history=history
+    )
+    if request.use_history:
+        events = record_stream(events, current_user["id"], request.query)
+    return StreamingResponse(sse_stream(events, timings=True), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# Background jobs for long RAG requests: submit, then poll the job or follow its events
+def rag_events(
+    stream: AsyncIterator[Tuple[str, Any]], user_id: str, query: str, use_history: bool
+) -> AsyncIterator[Tuple[str, Any]]:
+    return record_stream(stream, user_id, query) if use_history else stream
+
+async def submit_job(user_id: str, kind: str, events, response: Response) -> dict:
+    try:
+        job = await job_queue.submit(user_id, kind, events)
+    except JobRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return {"job_id": job.id, "status": job.status}
+
+async def find_job(job_id: str, user_id: str) -> dict:
+    job = job_queue.get(job_id, user_id)
+    if job is not None:
+        return job.view()
+    # Accepted by another worker
+    with span("supabase"):
+        row = await executor.run_io(fetch_job, get_supabase_client(), job_id, user_id)
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return row
+
+@app.post("/jobs/browser-rag", status_code=status.HTTP_202_ACCEPTED)
+async def submit_browser_rag_job(request: QueryRequest, response: Response, current_user: dict = Depends(get_current_user)):
+    if not request.urls:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No URLs provided for browser RAG"
+        )
+    user_id = current_user["id"]
+    
+    async def events():
+        history = await conversation_context(user_id) if request.use_history else None
+        stream = RAGAgent.browser_rag_stream(request.query, request.urls, history=history)
+        async for event in rag_events(stream, user_id, request.query, request.use_history):
+            yield event
+    
+    return await submit_job(user_id, "browser-rag", events, response)
+
+@app.post("/jobs/database-rag", status_code=status.HTTP_202_ACCEPTED)
+async def submit_database_rag_job(request: DatabaseQueryRequest, response: Response, current_user: dict = Depends(get_current_user)):
+    user_id = current_user["id"]
+    
+    async def events():
+        history = await conversation_context(user_id) if request.use_history else None
+        stream = RAGAgent.database_rag_stream(
+            query=request.query,
+            user_id=user_id,
+            collection_name=request.collection_name,
+            category=request.category,
+            tags=request.tags,
+            top_k=request.top_k,
+            history=history
+        )
+        async for event in rag_events(stream, user_id, request.query, request.use_history):
+            yield event
+    
+    return await submit_job(user_id, "database-rag", events, response)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await find_job(job_id, current_user["id"])
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, response: Response, current_user: dict = Depends(get_current_user)):
+    job = await find_job(job_id, current_user["id"])
+    if job["status"] == "failed":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Job failed: {job['error']}"
+        )
+    if job["status"] != "succeeded":
+        response.status_code = status.HTTP_202_ACCEPTED
+        response.headers["Retry-After"] = str(max(1, round(JOB_POLL_SECONDS)))
+        return {"job_id": job_id, "status": job["status"]}
+    return job["result"]
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, current_user: dict = Depends(get_current_user)):
+    user_id = current_user["id"]
+    job = job_queue.get(job_id, user_id)
+    if job is not None:
+        return StreamingResponse(sse_stream(job.follow()), media_type="text/event-stream", headers=SSE_HEADERS)
+    
+    first = await find_job(job_id, user_id)
+    
+    async def poll() -> AsyncIterator[Tuple[str, Any]]:
+        # Only status changes are visible for a job running in another worker
+        row, last_status = first, None
+        while True:
+            if row["status"] != last_status:
+                last_status = row["status"]
+                yield "status", {"status": last_status}
+            if last_status in FINISHED:
+                if last_status == "succeeded":
+                    yield "result", row["result"]
+                else:
+                    yield "error", {"detail": row["error"]}
+                return
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            row = await executor.run_io(fetch_job, get_supabase_client(), job_id, user_id) or row
+    
+    return StreamingResponse(sse_stream(poll()), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# Chat over a persistent WebSocket. The first frame is {"token": "<access token>"};
+# the connection is authenticated once, then each ChatMessage frame is answered with
+# {"type": "token" | "sources", "id", "data"} frames and a final {"type": "done", "id"}.
+# Turns are recorded through the batched history writer, like the HTTP chat endpoints.
+def chat_events(message: ChatMessage, user_id: str, history: Optional[str]) -> AsyncIterator[Tuple[str, Any]]:
+    if message.urls:
+        stream = RAGAgent.browser_rag_stream(message.query, message.urls, history=history)
+    else:
+        stream = RAGAgent.database_rag_stream(
+            query=message.query,
+            user_id=user_id,
+            collection_name=message.collection_name,
+            category=message.category,
+            tags=message.tags,
+            top_k=message.top_k,
+            history=history
+        )
+    return rag_events(stream, user_id, message.query, message.use_history)
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        hello = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT_SECONDS)
+        current_user, claims = await authenticate(str(hello.get("token", "")))
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, HTTPException, ValueError, AttributeError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Could not validate credentials")
+        return
+    
+    record_websocket(1)
+    try:
+        await websocket.send_json({"type": "ready"})
+        while True:
+            try:
+                frame = await websocket.receive_json()
+                message = ChatMessage.model_validate(frame)
+            except (ValueError, ValidationError) as e:
+                detail = e.errors(include_url=False, include_context=False) if isinstance(e, ValidationError) else "Invalid JSON"
+                await websocket.send_json({"type": "error", "id": None, "detail": detail})
+                continue
+            # An expired token ends the connection; the client reconnects with a fresh one
+            if claims.get("exp", 0) <= time.time():
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token expired")
+                return
+            
+            try:
+                with span("chat_turn"):
+                    history = await conversation_context(current_user["id"]) if message.use_history else None
+                    async for event, data in chat_events(message, current_user["id"], history):
+                        await websocket.send_json({"type": event, "id": message.id, "data": data})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "id": message.id, "detail": str(e)})
+                continue
+            await websocket.send_json({"type": "done", "id": message.id})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        record_websocket(-1)
+
+# Conversation history, newest first; pass next_cursor back to page further back
+@app.get("/messages")
+async def list_messages(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    if cursor is None:
+        # Buffered turns go out first so the newest page is complete
+        await message_writer.flush()
+    try:
+        with span("supabase"):
+            messages, next_cursor = await executor.run_io(
+                fetch_messages, get_supabase_client(), current_user["id"], limit, cursor
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"messages": messages, "next_cursor": next_cursor}
+
 # User profile endpoint
 @app.get("/me")
 async def read_users_me(current_user: dict = Depends(get_current_user)):
@@ -168,6 +581,64 @@ async def read_users_me(current_user: dict = Depends(get_current_user)):
         "email": current_user["email"]
     }
 
+# Bulk import of rag_documents. The body is NDJSON (one document object per line) or
+# CSV with a header row, parsed while it uploads and inserted in batches; progress of
+# running imports is listed under /admin/rag-documents/imports.
+@app.post("/admin/rag-documents/import")
+async def import_rag_documents(
+    request: Request,
+    format: Optional[str] = Query(default=None, pattern="^(ndjson|csv)$"),
+    source_type: Optional[str] = Query(default=None, min_length=1),
+    current_user: dict = Depends(get_current_admin)
+):
+    fmt = format or import_format(request.headers.get("content-type", ""))
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send application/x-ndjson or text/csv, or set ?format="
+        )
+    kwargs = {"source_type": source_type} if source_type else {}
+    progress = await bulk_importer.run(request.stream(), fmt, current_user["id"], **kwargs)
+    if progress.status == "failed":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=progress.view())
+    return progress.view()
+
+@app.get("/admin/rag-documents/imports")
+async def list_imports(current_user: dict = Depends(get_current_admin)):
+    # Imports received by other workers too
+    with span("supabase"):
+        stored = await executor.run_io(fetch_imports, get_supabase_client())
+    return {"imports": bulk_importer.views(stored)}
+
+@app.get("/admin/rag-documents/imports/{import_id}")
+async def get_import(import_id: str, current_user: dict = Depends(get_current_admin)):
+    progress = bulk_importer.get(import_id)
+    if progress is not None:
+        return progress.view()
+    # Received by another worker
+    with span("supabase"):
+        rows = await executor.run_io(fetch_imports, get_supabase_client(), import_id)
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import not found")
+    return rows[0]
+
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# Liveness and readiness probes
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz(response: Response):
+    if not warmup_state["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return warmup_state
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,524 @@
+"""
+Local stand-ins for the backend's external services, used by the benchmark suite
+"""
+import hashlib
+import http.server
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CustomLLM, CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+class FakeResponse:
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class FakeQuery:
+    """
+    Subset of the PostgREST query builder used by the backend, over in-memory rows
+    """
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._action = "select"
+        self._payload: Any = None
+        self._filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+
+    # Actions
+    def select(self, columns: str = "*", **kwargs: Any) -> "FakeQuery":
+        self._action = "select"
+        return self
+
+    def insert(self, rows: Any, **kwargs: Any) -> "FakeQuery":
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str = "id", **kwargs: Any) -> "FakeQuery":
+        self._action, self._payload = "upsert", rows
+        self._conflict = on_conflict
+        return self
+
+    def update(self, values: Dict[str, Any], **kwargs: Any) -> "FakeQuery":
+        self._action, self._payload = "update", values
+        return self
+
+    def delete(self, **kwargs: Any) -> "FakeQuery":
+        self._action = "delete"
+        return self
+
+    # Filters
+    def _add(self, column: str, op: str, value: Any) -> "FakeQuery":
+        self._filters.append(lambda row: _compare(row.get(column), op, value))
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        return self._add(column, "eq", value)
+
+    def neq(self, column: str, value: Any) -> "FakeQuery":
+        return self._add(column, "neq", value)
+
+    def gt(self, column: str, value: Any) -> "FakeQuery":
+        return self._add(column, "gt", value)
+
+    def gte(self, column: str, value: Any) -> "FakeQuery":
+        return self._add(column, "gte", value)
+
+    def lt(self, column: str, value: Any) -> "FakeQuery":
+        return self._add(column, "lt", value)
+
+    def lte(self, column: str, value: Any) -> "FakeQuery":
+        return self._add(column, "lte", value)
+
+    def in_(self, column: str, values: List[Any]) -> "FakeQuery":
+        return self._add(column, "in", list(values))
+
+    def is_(self, column: str, value: Any) -> "FakeQuery":
+        return self._add(column, "is", value)
+
+    def or_(self, filters: str) -> "FakeQuery":
+        checks = [_parse_filter(clause) for clause in _split_filters(filters)]
+        self._filters.append(lambda row: any(check(row) for check in checks))
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs: Any) -> "FakeQuery":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> "FakeQuery":
+        self._limit = count
+        return self
+
+    def execute(self) -> FakeResponse:
+        self._db.wait()
+        with self._db.lock:
+            rows = self._db.tables[self._table]
+            if self._action == "insert":
+                return FakeResponse([self._db.add_row(self._table, row) for row in _as_list(self._payload)])
+            if self._action == "upsert":
+                return FakeResponse([
+                    self._db.upsert_row(self._table, row, self._conflict) for row in _as_list(self._payload)
+                ])
+
+            matched = [row for row in rows if all(check(row) for check in self._filters)]
+            if self._action == "update":
+                for row in matched:
+                    row.update(self._payload)
+                return FakeResponse([dict(row) for row in matched])
+            if self._action == "delete":
+                self._db.tables[self._table] = [row for row in rows if row not in matched]
+                return FakeResponse([dict(row) for row in matched])
+
+            # Stable sorts from the last key to the first give a multi-column order
+            for column, desc in reversed(self._order):
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if self._limit is not None:
+                matched = matched[:self._limit]
+            return FakeResponse([dict(row) for row in matched])
+
+
+def _split_filters(filters: str) -> List[str]:
+    """
+    Split a PostgREST filter list on commas outside parentheses
+    """
+    clauses, depth, quoted, current = [], 0, False, ""
+    for char in filters:
+        if char == '"':
+            quoted = not quoted
+        elif char == "," and depth == 0 and not quoted:
+            clauses.append(current)
+            current = ""
+            continue
+        elif not quoted:
+            depth += {"(": 1, ")": -1}.get(char, 0)
+        current += char
+    clauses.append(current)
+    return clauses
+
+
+def _parse_filter(clause: str) -> Callable[[Dict[str, Any]], bool]:
+    if clause.startswith("and(") and clause.endswith(")"):
+        checks = [_parse_filter(inner) for inner in _split_filters(clause[4:-1])]
+        return lambda row: all(check(row) for check in checks)
+    column, op, value = clause.split(".", 2)
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    return lambda row: _compare(row.get(column), op, value)
+
+
+def _as_list(rows: Any) -> List[Dict[str, Any]]:
+    return rows if isinstance(rows, list) else [rows]
+
+
+def _compare(actual: Any, op: str, expected: Any) -> bool:
+    if op == "is":
+        return actual is None if expected in (None, "null") else actual == expected
+    if op == "in":
+        return actual in expected
+    if actual is None:
+        return False
+    if isinstance(expected, str) and not isinstance(actual, str):
+        try:
+            expected = type(actual)(expected)
+        except (TypeError, ValueError):
+            pass
+    return {
+        "eq": lambda: actual == expected,
+        "neq": lambda: actual != expected,
+        "gt": lambda: actual > expected,
+        "gte": lambda: actual >= expected,
+        "lt": lambda: actual < expected,
+        "lte": lambda: actual <= expected,
+    }[op]()
+
+
+class FakeRPC:
+    def __init__(self, db: "FakeSupabase", function: Callable[..., Any], params: Dict[str, Any]):
+        self._db = db
+        self._function = function
+        self._params = params
+
+    def execute(self) -> FakeResponse:
+        self._db.wait()
+        with self._db.lock:
+            return FakeResponse(self._function(self._db, **self._params))
+
+
+class FakeSupabase:
+    """
+    In-memory Supabase client with configurable per-call latency.
+
+    Tables are lists of dict rows; SQL functions are registered as Python callables.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.functions: Dict[str, Callable[..., Any]] = {
+            "match_rag_documents": match_rag_documents,
+            "hybrid_search_rag_documents": hybrid_search_rag_documents,
+            "hybrid_search_rag_documents_batch": hybrid_search_rag_documents_batch,
+            "bulk_import_rag_documents": bulk_import_rag_documents,
+            "bulk_update_rag_document_embeddings": bulk_update_rag_document_embeddings,
+        }
+        self.lock = threading.RLock()
+        self._ids: Dict[str, int] = defaultdict(int)
+
+    def wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(row)
+        if "id" not in row:
+            self._ids[table] += 1
+            row["id"] = self._ids[table]
+        self.tables[table].append(row)
+        return dict(row)
+
+    def upsert_row(self, table: str, row: Dict[str, Any], key: str = "id") -> Dict[str, Any]:
+        for existing in self.tables[table]:
+            if key in row and existing.get(key) == row[key]:
+                existing.update(row)
+                return dict(existing)
+        return self.add_row(table, row)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def from_(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> FakeRPC:
+        return FakeRPC(self, self.functions[name], params or {})
+
+
+def match_rag_documents(
+    db: FakeSupabase,
+    query_embedding: List[float],
+    match_count: int = 5,
+    filter_category: Optional[str] = None,
+    filter_tags: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Python version of the match_rag_documents SQL function
+    """
+    rows = [
+        row for row in db.tables["rag_documents"]
+        if row.get("embedding") is not None
+        and (filter_category is None or row.get("category") == filter_category)
+        and (not filter_tags or set(filter_tags) & set(row.get("tags") or []))
+    ]
+    if not rows:
+        return []
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    matrix = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+    similarities = matrix @ query / np.where(norms == 0, 1.0, norms)
+    best = np.argsort(-similarities)[:match_count]
+    return [
+        {
+            "id": rows[i]["id"],
+            "title": rows[i]["title"],
+            "content": rows[i]["content"],
+            "url": rows[i].get("url"),
+            "category": rows[i].get("category"),
+            "tags": rows[i].get("tags"),
+            "similarity": float(similarities[i]),
+        }
+        for i in best
+    ]
+
+
+def _terms(text: str) -> List[str]:
+    return [word.rstrip("s") for word in re.findall(r"[a-z0-9]+", (text or "").lower())]
+
+
+def hybrid_search_rag_documents(
+    db: FakeSupabase,
+    query_text: str,
+    query_embedding: List[float],
+    match_count: int = 5,
+    filter_category: Optional[str] = None,
+    filter_tags: Optional[List[str]] = None,
+    full_text_weight: float = 1.0,
+    semantic_weight: float = 1.0,
+    rrf_k: int = 50,
+) -> List[Dict[str, Any]]:
+    """
+    Python version of the hybrid_search_rag_documents SQL function.
+
+    Full-text rank is approximated by query-term counts, with title matches weighted up.
+    """
+    candidates = match_count * 2
+    semantic = match_rag_documents(db, query_embedding, candidates, filter_category, filter_tags)
+
+    query_terms = set(_terms(query_text))
+    lexical = []
+    for row in db.tables["rag_documents"]:
+        if filter_category is not None and row.get("category") != filter_category:
+            continue
+        if filter_tags and not set(filter_tags) & set(row.get("tags") or []):
+            continue
+        rank = (
+            4 * sum(term in query_terms for term in _terms(row.get("title")))
+            + sum(term in query_terms for term in _terms(row.get("content")))
+        )
+        if rank:
+            lexical.append((rank, row))
+    lexical.sort(key=lambda item: -item[0])
+
+    rows: Dict[Any, Dict[str, Any]] = {}
+    scores: Dict[Any, float] = defaultdict(float)
+    for rank_ix, (_, row) in enumerate(lexical[:candidates], start=1):
+        rows[row["id"]] = {
+            key: row.get(key) for key in ("id", "title", "content", "url", "category", "tags")
+        }
+        rows[row["id"]]["similarity"] = None
+        scores[row["id"]] += full_text_weight / (rrf_k + rank_ix)
+    for rank_ix, row in enumerate(semantic, start=1):
+        rows[row["id"]] = row
+        scores[row["id"]] += semantic_weight / (rrf_k + rank_ix)
+
+    best = sorted(scores, key=lambda id_: -scores[id_])[:match_count]
+    return [dict(rows[id_], score=scores[id_]) for id_ in best]
+
+
+def hybrid_search_rag_documents_batch(
+    db: FakeSupabase,
+    query_texts: List[str],
+    query_embeddings: List[List[float]],
+    **params: Any,
+) -> List[Dict[str, Any]]:
+    return [
+        dict(row, query_index=index)
+        for index, (query_text, query_embedding) in enumerate(zip(query_texts, query_embeddings))
+        for row in hybrid_search_rag_documents(db, query_text, query_embedding, **params)
+    ]
+
+
+def bulk_import_rag_documents(db: FakeSupabase, documents: List[Dict[str, Any]]) -> int:
+    """
+    Python version of the bulk_import_rag_documents SQL function
+    """
+    urls = {row.get("url") for row in db.tables["rag_documents"]} - {None}
+    hashes = {
+        row.get("text_hash") or hashlib.sha256(row["content"].encode("utf-8")).hexdigest()
+        for row in db.tables["rag_documents"]
+    }
+    inserted = 0
+    for document in documents:
+        if document.get("url") in urls or document["text_hash"] in hashes:
+            continue
+        db.add_row("rag_documents", dict(document, embedding=None))
+        if document.get("url") is not None:
+            urls.add(document["url"])
+        hashes.add(document["text_hash"])
+        inserted += 1
+    return inserted
+
+
+def bulk_update_rag_document_embeddings(db: FakeSupabase, updates: List[Dict[str, Any]]) -> int:
+    """
+    Python version of the bulk_update_rag_document_embeddings SQL function
+    """
+    rows = {row["id"]: row for row in db.tables["rag_documents"]}
+    written = 0
+    for update in updates:
+        row = rows.get(update["id"])
+        if row is None or hashlib.sha256(row["content"].encode("utf-8")).hexdigest() != update["content_hash"]:
+            continue
+        row.update(embedding=update["embedding"], content_hash=update["content_hash"])
+        written += 1
+    return written
+
+
+def hashed_embedding(text: str, dim: int) -> List[float]:
+    """
+    Deterministic bag-of-words embedding: similar texts get similar vectors
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dim] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm > 0 else vector).tolist()
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    Deterministic embedding model with configurable per-batch latency
+    """
+    dim: int = 1536
+    latency: float = 0.0
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return hashed_embedding(query, self.dim)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_query_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [hashed_embedding(text, self.dim) for text in texts]
+
+
+class FakeLLM(CustomLLM):
+    """
+    Deterministic LLM: waits ``latency`` seconds, then returns ``num_tokens`` words
+    """
+    latency: float = 0.5
+    num_tokens: int = 32
+    time_to_first_token: float = 0.1
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=8192, num_output=256, model_name="fake-llm")
+
+    def _words(self, prompt: str) -> List[str]:
+        seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return [f"{seed[i % 60:i % 60 + 4]} " for i in range(self.num_tokens)]
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.latency)
+        return CompletionResponse(text="".join(self._words(prompt)))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        words = self._words(prompt)
+        delay = max(0.0, self.latency - self.time_to_first_token) / max(1, len(words))
+
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.time_to_first_token)
+            text = ""
+            for word in words:
+                text += word
+                yield CompletionResponse(text=text, delta=word)
+                time.sleep(delay)
+
+        return gen()
+
+
+class StaticSite:
+    """
+    Local web server serving ``pages`` generated patient-information pages with ETags
+    """
+
+    def __init__(self, pages: int = 10, paragraphs: int = 20):
+        self.pages = {
+            f"/page/{i}": _page_html(i, paragraphs).encode("utf-8")
+            for i in range(pages)
+        }
+        site = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = site.pages.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self, count: Optional[int] = None) -> List[str]:
+        paths = sorted(self.pages)[:count]
+        return [self.base_url + path for path in paths]
+
+    def __enter__(self) -> "StaticSite":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _page_html(index: int, paragraphs: int) -> str:
+    body = "\n".join(
+        f"<p>Section {n} of condition {index}: patients commonly ask about symptoms, "
+        f"treatment options, medication dosage and side effects. Paragraph {n}.</p>"
+        for n in range(paragraphs)
+    )
+    return (
+        f"<html><head><title>Condition {index}</title></head>"
+        f"<body><nav>Home | Conditions</nav><h1>Condition {index}</h1>{body}"
+        f"<footer>Patient information leaflet</footer></body></html>"
+    )
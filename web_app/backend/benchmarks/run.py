@@ -0,0 +1,240 @@
+"""
+Offline load test for the FastAPI backend.
+
+Supabase, the LLM, the embedding model and the web pages are replaced by local
+stand-ins (see fakes.py) with configurable latency, so results are reproducible
+and no network or API keys are needed. Run from the backend directory:
+
+    python -m benchmarks.run --concurrency 16 --requests 200
+    python -m benchmarks.run --scenarios browser-rag --llm-latency 1.0 --max-p95-ms 2500
+
+Exits with status 1 when a scenario exceeds --max-p95-ms or has errors.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+# The backend reads its configuration at import time
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-of-sufficient-length")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("DOCUMENT_CACHE_DIR", tempfile.mkdtemp(prefix="kyra-bench-"))
+os.environ.setdefault("VECTOR_STORE_DIR", tempfile.mkdtemp(prefix="kyra-bench-vectors-"))
+
+import httpx
+
+from benchmarks.fakes import FakeEmbedding, FakeLLM, FakeSupabase, StaticSite, hashed_embedding
+
+SCENARIOS = ["token", "me", "browser-rag", "database-rag"]
+
+BENCH_USER = {"username": "bench", "email": "bench@example.com", "password": "bench-password"}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    completed = len(latencies)
+    return {
+        "scenario": name,
+        "requests": completed + errors,
+        "errors": errors,
+        "throughput_rps": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def run_scenario(
+    name: str,
+    send: Callable[[int], Awaitable[httpx.Response]],
+    total: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    """
+    Issue ``total`` requests with at most ``concurrency`` in flight
+    """
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal errors, next_index
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await send(index)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, time.perf_counter() - started)
+
+
+@contextmanager
+def offline_backend(args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    """
+    Point the backend at local fakes and seed them; restores the real clients on exit
+    """
+    from llama_index.core import Settings
+
+    import agent
+    import app as app_module
+    import clients
+    import routing
+
+    db = FakeSupabase(latency=args.db_latency)
+    hashed_password = app_module.get_password_hash(BENCH_USER["password"])
+    user = db.add_row("users", {
+        "username": BENCH_USER["username"],
+        "email": BENCH_USER["email"],
+        "hashed_password": hashed_password,
+    })
+    for i in range(args.documents):
+        content = (
+            f"Document {i} covers condition {i % 25}: symptoms, treatment, "
+            f"dosage guidance and common side effects of medication {i % 40}."
+        )
+        db.add_row("rag_documents", {
+            "title": f"Document {i}",
+            "content": content,
+            "source_type": "benchmark",
+            "category": "general",
+            "tags": [f"condition-{i % 25}"],
+            "embedding": hashed_embedding(content, 1536),
+        })
+
+    previous = {
+        "client": clients._supabase_client,
+        "llm": Settings._llm,
+        "fast_llm": clients._llms.get(routing.LLM_FAST_MODEL),
+        "embed_model": Settings._embed_model,
+        "threshold": agent.semantic_cache.threshold,
+    }
+    clients.set_supabase_client(db)
+    Settings.llm = FakeLLM(latency=args.llm_latency, num_tokens=args.llm_tokens)
+    clients.set_llm(routing.LLM_FAST_MODEL, FakeLLM(latency=args.fast_llm_latency, num_tokens=args.llm_tokens))
+    Settings.embed_model = FakeEmbedding(latency=args.embed_latency)
+    if not args.semantic_cache:
+        agent.semantic_cache.threshold = float("inf")
+    agent.semantic_cache.invalidate()
+
+    try:
+        with StaticSite(pages=args.pages) as site:
+            yield {"app": app_module.app, "app_module": app_module, "user": user, "site": site}
+    finally:
+        clients.set_supabase_client(previous["client"])
+        Settings._llm = previous["llm"]
+        clients.set_llm(routing.LLM_FAST_MODEL, previous["fast_llm"])
+        Settings._embed_model = previous["embed_model"]
+        agent.semantic_cache.threshold = previous["threshold"]
+        agent.semantic_cache.invalidate()
+
+
+async def run_benchmarks(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = []
+    with offline_backend(args) as backend:
+        app_module = backend["app_module"]
+        token = app_module.create_access_token(
+            data=app_module.user_claims(backend["user"]), expires_delta=timedelta(hours=1)
+        )
+        headers = {"Authorization": f"Bearer {token}"}
+        urls = backend["site"].urls(args.urls_per_request)
+
+        senders: Dict[str, Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]] = {
+            "token": lambda client, i: client.post(
+                "/token", data={"username": BENCH_USER["username"], "password": BENCH_USER["password"]}
+            ),
+            "me": lambda client, i: client.get("/me", headers=headers),
+            "browser-rag": lambda client, i: client.post(
+                "/browser-rag", json={"query": f"What are the side effects, question {i}?", "urls": urls}, headers=headers
+            ),
+            "database-rag": lambda client, i: client.post(
+                "/database-rag", json={"query": f"What is the dosage, question {i}?"}, headers=headers
+            ),
+        }
+
+        transport = httpx.ASGITransport(app=backend["app"])
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name in args.scenarios:
+                # One untimed request warms caches and lazy initialisation
+                await senders[name](client, -1)
+                results.append(await run_scenario(
+                    name, lambda i, name=name: senders[name](client, i), args.requests, args.concurrency
+                ))
+    return results
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    columns = ["scenario", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    print("  ".join(f"{column:>14}" for column in columns))
+    for result in results:
+        print("  ".join(f"{result[column]:>14}" for column in columns))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test for the Kyra backend")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake LLM call")
+    parser.add_argument("--fast-llm-latency", type=float, default=0.2, help="Seconds per fake call to LLM_FAST_MODEL")
+    parser.add_argument("--llm-tokens", type=int, default=32)
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per fake embedding call")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="Seconds per fake Supabase call")
+    parser.add_argument("--pages", type=int, default=10, help="Pages served by the local web server")
+    parser.add_argument("--urls-per-request", type=int, default=5)
+    parser.add_argument("--documents", type=int, default=1000, help="Seeded rag_documents rows")
+    parser.add_argument("--semantic-cache", action="store_true", help="Leave the semantic answer cache enabled")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail if any scenario's p95 exceeds this")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmarks(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+    failed = [
+        result["scenario"] for result in results
+        if result["errors"] or (args.max_p95_ms is not None and result["p95_ms"] > args.max_p95_ms)
+    ]
+    if failed:
+        print(f"Performance budget exceeded: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
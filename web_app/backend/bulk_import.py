@@ -0,0 +1,397 @@
+"""
+Streaming bulk import of rag_documents from NDJSON or CSV uploads.
+
+The upload is parsed as it arrives: bytes are decoded incrementally, split into
+records (an NDJSON line, or a CSV record, which may span lines inside quotes)
+and validated one at a time, so memory holds one record and at most two
+batches whatever the file size:
+
+    records = parse(iter_lines(request.stream()))   # incremental decode and split
+    batch = [validate(record) ...]                  # IMPORT_BATCH_SIZE rows, deduplicated
+    bulk_import_rag_documents(batch)                # one insert, skipping stored URLs / texts
+
+The next batch is parsed while the previous one is being inserted. Progress is
+kept per import and mirrored to the rag_imports table after each batch, so it
+can be polled from any worker while the upload runs. Imported rows have no
+embedding; the incremental ingestion job embeds them, queued in the background
+after each import, and reports the rows it wrote so cached answers can be dropped.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+import os
+
+from pydantic import ValidationError
+
+from cache import content_hash
+from clients import get_supabase_client
+from metrics import span, record_import_rows
+from models import ImportDocument
+import executor
+
+# Rows inserted per database call
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Longest record accepted; a longer one fails the import rather than filling memory
+IMPORT_MAX_RECORD_BYTES = int(os.getenv("IMPORT_MAX_RECORD_BYTES", str(1024 * 1024)))
+# Invalid rows reported individually (all are counted)
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "50"))
+# source_type for rows that do not set one
+IMPORT_SOURCE_TYPE = os.getenv("IMPORT_SOURCE_TYPE", "import")
+# Finished imports kept for polling
+IMPORT_HISTORY = int(os.getenv("IMPORT_HISTORY", "20"))
+# Run the ingestion job after each import to embed the new rows
+IMPORT_EMBED_AFTER = os.getenv("IMPORT_EMBED_AFTER", "true").lower() == "true"
+
+FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+
+class ImportFormatError(ValueError):
+    """
+    The upload cannot be parsed any further
+    """
+
+
+def import_format(content_type: str) -> Optional[str]:
+    return FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_bytes: int = IMPORT_MAX_RECORD_BYTES) -> AsyncIterator[str]:
+    """
+    Lines of a UTF-8 byte stream (a leading BOM is dropped), without their line endings
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+        if len(buffer) > max_bytes:
+            raise ImportFormatError(f"A record is longer than {max_bytes} bytes")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+Record = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+async def iter_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[Record]:
+    """
+    (line number, object, error) for each non-blank line
+    """
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if isinstance(value, dict):
+            yield number, value, None
+        else:
+            yield number, None, "Expected a JSON object"
+
+
+async def iter_csv(lines: AsyncIterator[str], max_bytes: int = IMPORT_MAX_RECORD_BYTES) -> AsyncIterator[Record]:
+    """
+    (line number, row, error) for each record after the header row.
+
+    A record continues over line breaks while a quoted field is open, which is
+    the case while it has an odd number of quote characters.
+    """
+    header: Optional[List[str]] = None
+    pending: List[str] = []
+    quotes = 0
+    number = start = 0
+    async for line in lines:
+        number += 1
+        if not pending:
+            start = number
+            if not line.strip():
+                continue
+        pending.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            if sum(len(part) for part in pending) > max_bytes:
+                raise ImportFormatError(f"Unterminated quoted field starting on line {start}")
+            continue
+        values = next(csv.reader(["\n".join(pending)]))
+        pending, quotes = [], 0
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            missing = {"title", "content"} - set(header)
+            if missing:
+                raise ImportFormatError(f"CSV header is missing {', '.join(sorted(missing))}")
+            continue
+        if len(values) != len(header):
+            yield start, None, f"Expected {len(header)} fields, found {len(values)}"
+            continue
+        yield start, dict(zip(header, values)), None
+    if pending:
+        raise ImportFormatError(f"Unterminated quoted field starting on line {start}")
+
+
+def parse(fmt: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    lines = iter_lines(chunks)
+    return iter_csv(lines) if fmt == "csv" else iter_ndjson(lines)
+
+
+@dataclass
+class ImportProgress:
+    id: str
+    user_id: str
+    format: str
+    status: str = "running"
+    # Records read, and what became of them
+    rows: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    batches: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+    # "queued" for the background ingestion run, "pending" for the next `python ingest.py`
+    embeddings: str = "pending"
+    started_at: str = field(default_factory=_now)
+    finished_at: Optional[str] = None
+
+    def reject(self, line: int, detail: Any) -> None:
+        self.invalid += 1
+        record_import_rows("invalid", 1)
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "detail": detail})
+
+    def view(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "format": self.format,
+            "status": self.status,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "batches": self.batches,
+            "errors": list(self.errors),
+            "error": self.error,
+            "embeddings": self.embeddings,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _row(document: ImportDocument, source_type: str) -> Dict[str, Any]:
+    row = document.model_dump(mode="json")
+    row["source_type"] = row["source_type"] or source_type
+    row["text_hash"] = content_hash(document.content)
+    return row
+
+
+class EmbeddingQueue:
+    """
+    Runs the ingestion job in the background, one run at a time.
+
+    A request made while a run is in progress starts one more run after it, so
+    rows imported during a run are not left unembedded.
+    """
+
+    def __init__(self, on_written: Optional[Callable[[List[Any]], None]] = None):
+        # Called with the ids of each batch of rows given an embedding
+        self.on_written = on_written
+        self._task: Optional[asyncio.Task] = None
+        self._again = False
+
+    def request(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._again = True
+            return
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            self._again = False
+            try:
+                await executor.run_io(_embed_pending, self.on_written)
+            except Exception:
+                # Rows stay without an embedding until the next run or `python ingest.py`
+                pass
+            if not self._again:
+                return
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+def _embed_pending(on_written: Optional[Callable[[List[Any]], None]] = None) -> Dict[str, int]:
+    from clients import get_database_embed_model
+    from ingest import INGEST_REQUESTS_PER_MINUTE, INGEST_TOKENS_PER_MINUTE, RateLimiter, ingest
+
+    with span("import_embed"):
+        return ingest(
+            get_supabase_client(),
+            get_database_embed_model().get_text_embedding_batch,
+            limiter=RateLimiter(INGEST_REQUESTS_PER_MINUTE, INGEST_TOKENS_PER_MINUTE),
+            on_written=on_written,
+        )
+
+
+def _persist(progress: ImportProgress) -> None:
+    """
+    Mirror the import to rag_imports; a failed write never fails the import itself
+    """
+    try:
+        get_supabase_client().table("rag_imports").upsert({**progress.view(), "user_id": progress.user_id}).execute()
+    except Exception:
+        pass
+
+
+def fetch_imports(client: Any, import_id: Optional[str] = None, limit: int = IMPORT_HISTORY) -> List[Dict[str, Any]]:
+    """
+    Imports stored by any worker, newest first
+    """
+    query = client.table("rag_imports").select(
+        "id, format, status, rows, inserted, duplicates, invalid, batches, errors, error, embeddings, started_at, finished_at"
+    )
+    if import_id is not None:
+        query = query.eq("id", import_id)
+    return query.order("started_at", desc=True).limit(limit).execute().data or []
+
+
+class BulkImporter:
+    """
+    Imports uploads into rag_documents and keeps their progress for polling
+    """
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE, history: int = IMPORT_HISTORY,
+                 embeddings: Optional[EmbeddingQueue] = None):
+        self.batch_size = batch_size
+        self.history = history
+        self.embeddings = embeddings
+        self._imports: "OrderedDict[str, ImportProgress]" = OrderedDict()
+
+    def get(self, import_id: str) -> Optional[ImportProgress]:
+        return self._imports.get(import_id)
+
+    def views(self, stored: Sequence[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+        """
+        Imports tracked here and, behind them, those stored by other workers, newest first
+        """
+        views = {progress.id: progress.view() for progress in self._imports.values()}
+        for row in stored:
+            views.setdefault(row["id"], row)
+        return sorted(views.values(), key=lambda view: view["started_at"], reverse=True)
+
+    def _track(self, progress: ImportProgress) -> None:
+        self._imports[progress.id] = progress
+        finished = [key for key, value in self._imports.items() if value.status != "running"]
+        for key in finished[:max(0, len(self._imports) - self.history)]:
+            del self._imports[key]
+
+    async def _insert(self, batch: List[Dict[str, Any]], progress: ImportProgress) -> None:
+        with span("import_insert"):
+            response = await executor.run_io(
+                get_supabase_client().rpc("bulk_import_rag_documents", {"documents": batch}).execute
+            )
+        inserted = response.data or 0
+        progress.batches += 1
+        progress.inserted += inserted
+        progress.duplicates += len(batch) - inserted
+        record_import_rows("inserted", inserted)
+        record_import_rows("duplicate", len(batch) - inserted)
+        await executor.run_io(_persist, progress)
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str, user_id: str,
+                  source_type: str = IMPORT_SOURCE_TYPE) -> ImportProgress:
+        """
+        Import an upload; the returned progress says how it ended.
+
+        Rows already inserted stay when the upload turns out to be malformed.
+        """
+        progress = ImportProgress(id=str(uuid.uuid4()), user_id=user_id, format=fmt)
+        self._track(progress)
+        await executor.run_io(_persist, progress)
+
+        batch: List[Dict[str, Any]] = []
+        seen: set = set()
+        inserting: Optional[asyncio.Future] = None
+
+        async def flush() -> None:
+            nonlocal batch, seen, inserting
+            if inserting is not None:
+                await inserting
+            inserting = asyncio.ensure_future(self._insert(batch, progress)) if batch else None
+            batch, seen = [], set()
+
+        try:
+            async for line, fields, error in parse(fmt, chunks):
+                progress.rows += 1
+                if error is not None:
+                    progress.reject(line, error)
+                    continue
+                try:
+                    row = _row(ImportDocument.model_validate(fields), source_type)
+                except ValidationError as e:
+                    progress.reject(line, [
+                        {"loc": list(detail["loc"]), "msg": detail["msg"]} for detail in e.errors()
+                    ])
+                    continue
+                # Duplicates within a batch; the database skips those already stored
+                keys = {("url", row["url"]), ("text", row["text_hash"])} - {("url", None)}
+                if keys & seen:
+                    progress.duplicates += 1
+                    record_import_rows("duplicate", 1)
+                    continue
+                seen |= keys
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    await flush()
+            await flush()
+            if inserting is not None:
+                await inserting
+            progress.status = "succeeded"
+        except Exception as e:
+            if inserting is not None:
+                await asyncio.gather(inserting, return_exceptions=True)
+            progress.status = "failed"
+            progress.error = str(e)
+        except asyncio.CancelledError:
+            # The client went away mid-upload; the rows inserted so far stay
+            progress.status, progress.error = "failed", "Import cancelled"
+            progress.finished_at = _now()
+            await executor.run_io(_persist, progress)
+            raise
+        finally:
+            progress.finished_at = _now()
+            self._track(progress)
+
+        if not progress.inserted:
+            progress.embeddings = "none"
+        elif self.embeddings is not None:
+            self.embeddings.request()
+            progress.embeddings = "queued"
+        await executor.run_io(_persist, progress)
+        return progress
+
+
+embedding_queue = EmbeddingQueue()
+bulk_importer = BulkImporter(embeddings=embedding_queue if IMPORT_EMBED_AFTER else None)
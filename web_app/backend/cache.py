@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+def content_hash(text: str) -> str:
+    """
+    Stable hash of a piece of text, used to detect changed content
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with LRU eviction and optional per-entry expiry
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass
+class CachedDocument:
+    """
+    A fetched web page together with its chunk texts and embeddings
+    """
+    url: str
+    content_hash: str
+    text: str
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = field(default_factory=time.time)
+    embedding_model: Optional[str] = None
+
+
+class DocumentCache:
+    """
+    Per-URL cache of parsed pages and chunk embeddings, persisted to disk.
+
+    Entries younger than ``ttl`` seconds are served without touching the network;
+    older entries are kept for conditional revalidation (ETag / Last-Modified).
+    Both the in-memory layer and the on-disk directory are bounded with LRU eviction.
+    """
+
+    def __init__(self, directory: Optional[str], ttl: float = 3600, maxsize: int = 256, max_disk_entries: int = 2048):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url: str) -> Optional[CachedDocument]:
+        entry = self._memory.get(url)
+        if entry is not None or not self.directory:
+            return entry
+
+        path = self._path(url)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = CachedDocument(**json.load(f))
+            os.utime(path)
+        except (OSError, ValueError, TypeError):
+            return None
+
+        self._memory.set(url, entry)
+        return entry
+
+    def put(self, entry: CachedDocument) -> None:
+        self._memory.set(entry.url, entry)
+        if not self.directory:
+            return
+
+        path = self._path(entry.url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(entry), f)
+        os.replace(tmp_path, path)
+        self._prune_disk()
+
+    def touch(self, entry: CachedDocument) -> None:
+        """
+        Mark an entry as freshly validated without changing its content
+        """
+        entry.fetched_at = time.time()
+        self.put(entry)
+
+    def is_fresh(self, entry: CachedDocument) -> bool:
+        return time.time() - entry.fetched_at < self.ttl
+
+    def invalidate(self, url: str) -> None:
+        self._memory.invalidate(url)
+        if self.directory:
+            try:
+                os.remove(self._path(url))
+            except OSError:
+                pass
+
+    def _prune_disk(self) -> None:
+        with self._lock:
+            try:
+                files = [
+                    os.path.join(self.directory, name)
+                    for name in os.listdir(self.directory)
+                    if name.endswith(".json")
+                ]
+            except OSError:
+                return
+            if len(files) <= self.max_disk_entries:
+                return
+
+            files.sort(key=lambda path: os.path.getmtime(path))
+            for path in files[:len(files) - self.max_disk_entries]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by query similarity within a scope (a URL set or collection).
+
+    A lookup hits when a stored query in the same scope has cosine similarity of at
+    least ``threshold`` with the new one. Entries expire after ``ttl`` seconds, each
+    scope keeps at most ``max_entries`` (LRU), and entries stored for an older
+    ``version`` of the scope's documents are dropped on lookup.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 256, max_scopes: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self.hits = 0
+        self.misses = 0
+        self._scopes: "OrderedDict[Hashable, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(embedding: List[float]) -> "np.ndarray":
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, scope: Hashable, embedding: List[float], version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        query = self._normalise(embedding)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries:
+                entries[:] = [
+                    entry for entry in entries
+                    if entry["expires_at"] > now and entry["version"] == version
+                ]
+            if not entries:
+                self.misses += 1
+                return None
+
+            self._scopes.move_to_end(scope)
+            similarities = np.stack([entry["vector"] for entry in entries]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entries[best]["last_used"] = now
+            return entries[best]["value"]
+
+    def store(
+        self,
+        scope: Hashable,
+        embedding: List[float],
+        value: Dict[str, Any],
+        version: Optional[str] = None,
+    ) -> None:
+        now = time.monotonic()
+        entry = {
+            "vector": self._normalise(embedding),
+            "value": value,
+            "version": version,
+            "expires_at": now + self.ttl,
+            "last_used": now,
+        }
+        with self._lock:
+            entries = self._scopes.setdefault(scope, [])
+            entries.append(entry)
+            if len(entries) > self.max_entries:
+                entries.remove(min(entries, key=lambda item: item["last_used"]))
+            self._scopes.move_to_end(scope)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+
+    def invalidate(self, scope: Optional[Hashable] = None) -> None:
+        """
+        Drop one scope, or everything when no scope is given
+        """
+        with self._lock:
+            if scope is None:
+                self._scopes.clear()
+            else:
+                self._scopes.pop(scope, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Drop every scope the predicate accepts
+        """
+        with self._lock:
+            for scope in [scope for scope in self._scopes if predicate(scope)]:
+                del self._scopes[scope]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": sum(len(entries) for entries in self._scopes.values()),
+            }
@@ -0,0 +1,288 @@
+"""
+Streaming, token-aware chunking for fetched pages and stored documents.
+
+Each stage is a generator, so a large page is parsed, split, deduplicated and
+handed to the embedder a piece at a time, and work stops as soon as the token
+budget is spent:
+
+    blocks = iter_text_blocks(html)               # boilerplate-free text blocks
+    chunks = iter_chunks(blocks, 512, 64)         # token-sized, overlapping chunks
+    chunks = dedupe_chunks(chunks)                # near-identical chunks dropped
+    chunks = limit_tokens(chunks, budget)         # stop at the token cap
+"""
+import re
+from html.parser import HTMLParser
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+import hashlib
+import os
+
+import numpy as np
+
+# Chunking settings
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+# Most tokens embedded for one page, and for all new pages of one request
+CHUNK_MAX_TOKENS_PER_DOCUMENT = int(os.getenv("CHUNK_MAX_TOKENS_PER_DOCUMENT", "50000"))
+CHUNK_MAX_TOKENS_PER_REQUEST = int(os.getenv("CHUNK_MAX_TOKENS_PER_REQUEST", "200000"))
+# Chunks whose SimHash fingerprints differ in at most this many bits are duplicates
+CHUNK_DUPLICATE_BITS = int(os.getenv("CHUNK_DUPLICATE_BITS", "3"))
+
+# Elements whose content is navigation, chrome or code rather than page text
+SKIPPED_TAGS = frozenset({
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+    "head", "nav", "header", "footer", "aside", "button", "select", "menu",
+})
+BLOCK_TAGS = frozenset({
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd",
+    "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr", "tr", "td", "th", "table",
+    "blockquote", "pre", "figcaption", "caption", "title", "body",
+})
+
+FEED_SIZE = 64 * 1024
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WHITESPACE = re.compile(r"\s+")
+_SHINGLE_WORD = re.compile(r"\w+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens in the text under the embedding / LLM tokenizer
+    """
+    from llama_index.core.utils import get_tokenizer
+
+    return len(get_tokenizer()(text)) if text else 0
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Incremental HTML-to-text parser collecting completed text blocks
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: List[str] = []
+        self._current: List[str] = []
+        self._skip_depth = 0
+
+    def _end_block(self) -> None:
+        text = _WHITESPACE.sub(" ", "".join(self._current)).strip()
+        self._current = []
+        if text:
+            self.blocks.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS and not self._skip_depth:
+            self._end_block()
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS and not self._skip_depth:
+            self._end_block()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def close(self):
+        super().close()
+        self._end_block()
+
+
+def _looks_like_html(text: str) -> bool:
+    head = text[:2048].lower()
+    return "<html" in head or "<!doctype" in head or "<body" in head or "<p>" in head or "<div" in head
+
+
+def iter_text_blocks(text: str, feed_size: int = FEED_SIZE) -> Iterator[str]:
+    """
+    Text blocks (paragraphs, headings, list items) of a page, without markup or boilerplate.
+
+    HTML is parsed ``feed_size`` characters at a time and blocks are yielded as soon as
+    they close; plain text is split on blank lines.
+    """
+    if not _looks_like_html(text):
+        for block in re.split(r"\n\s*\n", text):
+            block = _WHITESPACE.sub(" ", block).strip()
+            if block:
+                yield block
+        return
+
+    parser = _TextExtractor()
+    for start in range(0, len(text), feed_size):
+        parser.feed(text[start:start + feed_size])
+        if parser.blocks:
+            yield from parser.blocks
+            parser.blocks = []
+    parser.close()
+    yield from parser.blocks
+
+
+def _split_oversized(unit: str, max_tokens: int) -> Iterator[str]:
+    """
+    Split a block longer than a chunk into sentences, then into word runs
+    """
+    for sentence in _SENTENCE_END.split(unit):
+        if count_tokens(sentence) <= max_tokens:
+            yield sentence
+            continue
+        words: List[str] = []
+        used = 0
+        for word in sentence.split():
+            tokens = count_tokens(" " + word)
+            if words and used + tokens > max_tokens:
+                yield " ".join(words)
+                words, used = [], 0
+            words.append(word)
+            used += tokens
+        if words:
+            yield " ".join(words)
+
+
+def iter_chunks(
+    blocks: Iterable[str],
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Tuple[str, int]]:
+    """
+    Pack text blocks into chunks of at most ``chunk_tokens`` tokens.
+
+    Yields (chunk, token count). Consecutive chunks share up to ``overlap_tokens``
+    tokens of whole sentences or blocks, so context is not cut at chunk edges.
+    """
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+    units: List[Tuple[str, int]] = []
+    used = 0
+    new_units = 0
+
+    def pieces() -> Iterator[Tuple[str, int]]:
+        for block in blocks:
+            tokens = count_tokens(" " + block)
+            if tokens <= chunk_tokens:
+                yield block, tokens
+            else:
+                for piece in _split_oversized(block, chunk_tokens):
+                    yield piece, count_tokens(" " + piece)
+
+    for piece, tokens in pieces():
+        if units and used + tokens > chunk_tokens:
+            yield " ".join(text for text, _ in units), used
+            # Carry the tail of the chunk over as overlap
+            carried: List[Tuple[str, int]] = []
+            carried_tokens = 0
+            for unit in reversed(units):
+                if carried_tokens + unit[1] > overlap_tokens or carried_tokens + unit[1] + tokens > chunk_tokens:
+                    break
+                carried.insert(0, unit)
+                carried_tokens += unit[1]
+            units, used, new_units = carried, carried_tokens, 0
+        units.append((piece, tokens))
+        used += tokens
+        new_units += 1
+
+    if new_units:
+        yield " ".join(text for text, _ in units), used
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of the text's word 3-shingles
+    """
+    words = _SHINGLE_WORD.findall(text.lower())
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), 64)
+    # Majority vote per bit position across shingles
+    votes = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+
+class DuplicateFilter:
+    """
+    Remembers chunk fingerprints and recognises exact and near-identical repeats
+    """
+
+    def __init__(self, max_distance: int = CHUNK_DUPLICATE_BITS):
+        self.max_distance = max_distance
+        self._exact: Set[str] = set()
+        self._fingerprints: List[int] = []
+
+    def seen(self, text: str) -> bool:
+        """
+        True if the text repeats an earlier one; otherwise remember it
+        """
+        normalised = _WHITESPACE.sub(" ", text.lower()).strip()
+        digest = hashlib.sha1(normalised.encode("utf-8")).hexdigest()
+        if digest in self._exact:
+            return True
+        fingerprint = simhash(normalised)
+        if any(bin(fingerprint ^ other).count("1") <= self.max_distance for other in self._fingerprints):
+            return True
+        self._exact.add(digest)
+        self._fingerprints.append(fingerprint)
+        return False
+
+
+def dedupe_chunks(
+    chunks: Iterable[Tuple[str, int]], duplicates: Optional[DuplicateFilter] = None
+) -> Iterator[Tuple[str, int]]:
+    """
+    Drop chunks that repeat an earlier chunk of the stream
+    """
+    duplicates = duplicates or DuplicateFilter()
+    for chunk, tokens in chunks:
+        if not duplicates.seen(chunk):
+            yield chunk, tokens
+
+
+class TokenBudget:
+    """
+    Token allowance shared by the chunk streams of one request
+    """
+
+    def __init__(self, max_tokens: Optional[int]):
+        self.remaining = max_tokens
+        self.exhausted = False
+
+    def take(self, tokens: int) -> bool:
+        if self.remaining is None:
+            return True
+        if tokens > self.remaining:
+            self.exhausted = True
+            return False
+        self.remaining -= tokens
+        return True
+
+
+def limit_tokens(chunks: Iterable[Tuple[str, int]], budget: TokenBudget) -> Iterator[Tuple[str, int]]:
+    """
+    Pass chunks through until the budget runs out; the rest of the input is never read
+    """
+    for chunk, tokens in chunks:
+        if not budget.take(tokens):
+            return
+        yield chunk, tokens
+
+
+def chunk_text(
+    text: str,
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    max_tokens: Optional[int] = CHUNK_MAX_TOKENS_PER_DOCUMENT,
+    budget: Optional[TokenBudget] = None,
+) -> Iterator[Tuple[str, int]]:
+    """
+    The full pipeline for one document: extract, chunk, dedupe and cap.
+
+    ``max_tokens`` caps this document; ``budget`` is an optional allowance shared
+    with other documents of the same request.
+    """
+    chunks = dedupe_chunks(iter_chunks(iter_text_blocks(text), chunk_tokens, overlap_tokens))
+    if max_tokens is not None:
+        chunks = limit_tokens(chunks, TokenBudget(max_tokens))
+    if budget is not None:
+        chunks = limit_tokens(chunks, budget)
+    return chunks
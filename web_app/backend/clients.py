@@ -0,0 +1,165 @@
+"""
+Lazily created, process-wide clients for the LLM, embedding model and Supabase.
+
+Nothing here runs at import time: heavy libraries (llama_index, supabase) are
+imported on first use, and a missing setting only fails the code path that needs it.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Model settings
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.1"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# "openai" calls the embedding API; "local" runs a sentence model on CPU (see embeddings.py)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+
+_lock = threading.RLock()
+_supabase_client: Optional[Any] = None
+_database_embed_model: Optional[Any] = None
+# LLMs other than LLM_MODEL, by model name
+_llms: Dict[str, Any] = {}
+_llama_index_configured = False
+
+# Readiness of this worker, reported by /readyz
+warmup_state: Dict[str, Any] = {"ready": False, "error": None, "seconds": None}
+
+
+def get_supabase_client() -> Any:
+    global _supabase_client
+    if _supabase_client is None:
+        with _lock:
+            if _supabase_client is None:
+                supabase_url = os.getenv("SUPABASE_URL")
+                supabase_key = os.getenv("SUPABASE_KEY")
+                if not supabase_url or not supabase_key:
+                    raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+
+                import supabase
+                _supabase_client = supabase.create_client(supabase_url, supabase_key)
+    return _supabase_client
+
+
+def set_supabase_client(client: Optional[Any]) -> None:
+    """
+    Replace the shared Supabase client (used by the offline benchmarks)
+    """
+    global _supabase_client
+    with _lock:
+        _supabase_client = client
+
+
+def set_llm(model: str, llm: Optional[Any]) -> None:
+    """
+    Replace the client used for an LLM other than LLM_MODEL (used by the offline benchmarks)
+    """
+    with _lock:
+        if llm is None:
+            _llms.pop(model, None)
+        else:
+            _llms[model] = llm
+
+
+def configure_llama_index() -> None:
+    """
+    Install the LLM, embedding model and token accounting on llama_index Settings once
+    """
+    global _llama_index_configured
+    if _llama_index_configured:
+        return
+    with _lock:
+        if _llama_index_configured:
+            return
+
+        from llama_index.core import Settings
+        from llama_index.core.callbacks import CallbackManager
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        from llama_index.llms.openai import OpenAI
+        from metrics import token_usage_handler
+
+        if Settings._llm is None:
+            Settings.llm = OpenAI(model=LLM_MODEL, temperature=LLM_TEMPERATURE)
+        if Settings._embed_model is None:
+            if EMBEDDING_PROVIDER == "local":
+                from embeddings import LocalEmbedding
+                Settings.embed_model = LocalEmbedding()
+            else:
+                Settings.embed_model = OpenAIEmbedding(model=EMBEDDING_MODEL)
+        Settings.callback_manager = CallbackManager([token_usage_handler()])
+        _llama_index_configured = True
+
+
+def get_llm(model: Optional[str] = None) -> Any:
+    """
+    The shared LLM, or a client for another OpenAI ``model`` with the same settings
+    """
+    from llama_index.core import Settings
+    configure_llama_index()
+    if model is None or model == LLM_MODEL:
+        return Settings.llm
+    if model not in _llms:
+        with _lock:
+            if model not in _llms:
+                from llama_index.llms.openai import OpenAI
+                _llms[model] = OpenAI(
+                    model=model, temperature=LLM_TEMPERATURE, callback_manager=Settings.callback_manager
+                )
+    return _llms[model]
+
+
+def get_embed_model() -> Any:
+    from llama_index.core import Settings
+    configure_llama_index()
+    return Settings.embed_model
+
+
+def get_database_embed_model() -> Any:
+    """
+    Embedding model for rag_documents queries and ingestion.
+
+    Stored document embeddings come from EMBEDDING_MODEL, so database search keeps
+    using it even when pages are embedded by the local provider.
+    """
+    global _database_embed_model
+    if EMBEDDING_PROVIDER != "local":
+        return get_embed_model()
+    if _database_embed_model is None:
+        with _lock:
+            if _database_embed_model is None:
+                from llama_index.embeddings.openai import OpenAIEmbedding
+                _database_embed_model = OpenAIEmbedding(model=EMBEDDING_MODEL)
+    return _database_embed_model
+
+
+def embedding_model_id() -> str:
+    """
+    Identifies the model behind get_embed_model(), so vectors from another one are not reused
+    """
+    if EMBEDDING_PROVIDER == "local":
+        from embeddings import LOCAL_EMBEDDING_MODEL
+        return f"local:{LOCAL_EMBEDDING_MODEL}"
+    return f"openai:{EMBEDDING_MODEL}"
+
+
+def warm_up(ping: bool = False) -> None:
+    """
+    Import and construct every client ahead of the first request.
+
+    With ``ping`` the embedding model is called once so connection pools are open too.
+    """
+    started = time.perf_counter()
+    try:
+        configure_llama_index()
+        # Import the modules used on the request path
+        import llama_index.core.response_synthesizers  # noqa: F401
+        from llama_index.core import VectorStoreIndex  # noqa: F401
+        get_supabase_client()
+        if ping:
+            get_embed_model().get_query_embedding("warm up")
+        warmup_state.update(ready=True, error=None)
+    except Exception as e:
+        warmup_state.update(ready=False, error=str(e))
+    finally:
+        warmup_state["seconds"] = round(time.perf_counter() - started, 3)
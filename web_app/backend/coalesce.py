@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from metrics import record_coalesced, span
+
+
+class SingleFlight:
+    """
+    Share one in-flight computation between concurrent callers with the same key.
+
+    The first caller starts the work as a task; callers arriving while it runs await
+    the same task and receive its result (or exception). Nothing is kept once the
+    task finishes, so this deduplicates concurrent work only; caching is separate.
+    The shared task is shielded, so a caller that disconnects does not cancel it
+    for the others. Its stage timings go to the first caller's request; later
+    callers report their wait as one ``coalesced`` stage.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        # Futures belong to one event loop, so keys are kept per loop
+        flight_key = (id(asyncio.get_running_loop()), key)
+        task = self._in_flight.get(flight_key)
+        if task is not None:
+            record_coalesced(self.name)
+            with span("coalesced"):
+                return await asyncio.shield(task)
+        else:
+            task = asyncio.ensure_future(compute())
+            self._in_flight[flight_key] = task
+            task.add_done_callback(lambda done: self._finish(flight_key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, flight_key: Tuple[int, Hashable], task: asyncio.Future) -> None:
+        self._in_flight.pop(flight_key, None)
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
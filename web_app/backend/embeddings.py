@@ -0,0 +1,279 @@
+"""
+Local CPU embedding provider (EMBEDDING_PROVIDER=local).
+
+A small sentence-transformers model runs in-process instead of calling the
+embedding API. Three things keep it fast under load:
+
+- Dynamic batching: texts from concurrent requests are queued and encoded
+  together in one model call, waiting at most a few milliseconds for company.
+- Vectorised post-processing: the batch is L2-normalised as one NumPy matrix.
+- A persistent on-disk cache keyed by model and text hash, shared by all
+  workers, so unchanged chunks are never encoded twice.
+
+sentence-transformers is an optional dependency, imported when the model is first used.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from metrics import span
+import executor
+
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Most texts encoded in one model call, and how long the first caller waits for others
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+LOCAL_EMBEDDING_BATCH_WAIT_MS = float(os.getenv("LOCAL_EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+Encoder = Callable[[List[str]], np.ndarray]
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """
+    Scale each row to unit length; all-zero rows are left as they are
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def sentence_transformer_encoder(model_name: str = LOCAL_EMBEDDING_MODEL, batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE) -> Encoder:
+    """
+    Encoder running a sentence-transformers model on CPU, loaded on first call
+    """
+    lock = threading.Lock()
+    model: List[Any] = []
+
+    def encode(texts: List[str]) -> np.ndarray:
+        if not model:
+            with lock:
+                if not model:
+                    from sentence_transformers import SentenceTransformer
+                    model.append(SentenceTransformer(model_name, device="cpu"))
+        return model[0].encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=False)
+
+    return encode
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding store keyed by a hash of model name and text.
+
+    Backed by SQLite in WAL mode so every worker process can read and write it;
+    once it holds more than ``max_entries`` vectors the oldest are dropped.
+    """
+
+    def __init__(self, path: Optional[str], max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("pragma journal_mode=wal")
+            connection.execute("pragma synchronous=normal")
+            connection.execute("create table if not exists embeddings (key text primary key, vector blob not null)")
+            self._connection = connection
+        return self._connection
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        if not self.path or not keys:
+            return {}
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            connection = self._connect()
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = connection.execute(
+                    f"select key, vector from embeddings where key in ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        if not self.path or not items:
+            return
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "insert or replace into embeddings (key, vector) values (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+                )
+            self._writes += len(items)
+            if self._writes >= max(1, self.max_entries // 100):
+                self._writes = 0
+                self._prune(connection)
+
+    def _prune(self, connection: sqlite3.Connection) -> None:
+        with connection:
+            connection.execute(
+                "delete from embeddings where rowid <= (select max(rowid) from embeddings) - ?", (self.max_entries,)
+            )
+
+    def __len__(self) -> int:
+        if not self.path:
+            return 0
+        with self._lock:
+            return self._connect().execute("select count(*) from embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class _Pending:
+    __slots__ = ("texts", "done", "result", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class DynamicBatcher:
+    """
+    Coalesces encode calls from concurrent threads into shared model calls.
+
+    A background thread takes the oldest waiting call, gathers others that
+    arrive within ``max_wait`` seconds (up to ``max_batch_size`` texts), encodes
+    the distinct texts once and hands every caller its own rows.
+    """
+
+    def __init__(self, encode: Encoder, max_batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+                 max_wait: float = LOCAL_EMBEDDING_BATCH_WAIT_MS / 1000):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self._queue: Deque[_Pending] = deque()
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        pending = _Pending(list(texts))
+        with self._condition:
+            self._queue.append(pending)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _next_batch(self) -> List[_Pending]:
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            batch = [self._queue.popleft()]
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                if not self._queue:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                    continue
+                if size + len(self._queue[0].texts) > self.max_batch_size:
+                    break
+                batch.append(self._queue.popleft())
+                size += len(batch[-1].texts)
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                # Texts requested by several callers are encoded once
+                unique = list(dict.fromkeys(text for pending in batch for text in pending.texts))
+                with span("embed_local"):
+                    matrix = normalize(self.encode(unique))
+                self.batches += 1
+                rows = {text: row for text, row in zip(unique, matrix)}
+                for pending in batch:
+                    pending.result = np.stack([rows[text] for text in pending.texts])
+            except BaseException as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+
+class LocalEmbedding(BaseEmbedding):
+    """
+    llama_index embedding model backed by a local encoder, a dynamic batcher and the disk cache
+    """
+
+    _batcher: DynamicBatcher = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL, encoder: Optional[Encoder] = None,
+                 cache: Optional[EmbeddingCache] = None, batcher: Optional[DynamicBatcher] = None, **kwargs: Any):
+        kwargs.setdefault("embed_batch_size", LOCAL_EMBEDDING_BATCH_SIZE)
+        super().__init__(model_name=model_name, **kwargs)
+        self._batcher = batcher or DynamicBatcher(encoder or sentence_transformer_encoder(model_name))
+        self._cache = cache if cache is not None else EmbeddingCache(EMBEDDING_CACHE_PATH)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalEmbedding"
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(self.model_name, text) for text in texts]
+        vectors = self._cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            encoded = dict(zip(missing, self._batcher.embed(list(missing.values()))))
+            self._cache.put_many(encoded)
+            vectors.update(encoded)
+        return [vectors[key].tolist() for key in keys]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        # Waiting on the batcher and the disk cache blocks, so it happens off the event loop
+        return (await executor.run_io(self._embed, [query]))[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await executor.run_io(self._embed, [text]))[0]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await executor.run_io(self._embed, texts)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
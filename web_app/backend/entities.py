@@ -0,0 +1,280 @@
+"""
+In-process matcher for condition and medication mentions.
+
+The medical_conditions and medications reference tables are loaded once into a
+word-level Aho-Corasick automaton, so every mention in a query is found in a single
+pass. Words are lower-cased and reduced to a crude stem on both sides, which makes
+matching case- and plural-insensitive ("Statins" matches "statin"). A version row
+bumped by a trigger on either table tells the backend when to rebuild.
+"""
+import asyncio
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import os
+
+from metrics import span
+import executor
+
+ENTITY_REFRESH_INTERVAL_SECONDS = float(os.getenv("ENTITY_REFRESH_INTERVAL_SECONDS", "60"))
+ENTITY_PAGE_SIZE = int(os.getenv("ENTITY_PAGE_SIZE", "1000"))
+# Most entities attached to one query
+ENTITY_MAX_MATCHES = int(os.getenv("ENTITY_MAX_MATCHES", "5"))
+
+REFERENCE_TABLES = {
+    "medical_conditions": "id, name, description, symptoms, treatments",
+    "medications": "id, name, description, dosage_info, side_effects",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _stem(word: str) -> str:
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    stem = word
+    while len(stem) > 3 and stem[-1] in "se":
+        stem = stem[:-1]
+    return stem
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased, stemmed words of the text
+    """
+    return [_stem(word) for word in _WORD.findall(text.lower().replace("'s", ""))]
+
+
+# Words that, besides entity names, make a query a plain reference lookup
+LOOKUP_WORDS = frozenset(tokenize(
+    "what is are was the a an of for on about tell me give show explain describe define definition "
+    "meaning mean does do can could you please my i should how much often many when take taking "
+    "side effect effects dosage dose doses dosing symptom symptoms sign signs treatment treatments "
+    "treat treated usual typical common normal recommended info information and or with"
+))
+
+
+@dataclass
+class Entity:
+    """
+    A condition or medication from the reference tables
+    """
+    kind: str
+    id: Any
+    name: str
+    description: str
+    details: Dict[str, Any] = field(default_factory=dict)
+
+    def context(self) -> str:
+        lines = [f"{self.kind.capitalize()}: {self.name}", f"Description: {self.description}"]
+        for label, value in self.details.items():
+            if value:
+                lines.append(f"{label}: {', '.join(value) if isinstance(value, list) else value}")
+        return "\n".join(lines)
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over word sequences.
+
+    States are dict transitions keyed by word; each state stores the patterns ending
+    there (including those reached through failure links) as (length, value) pairs.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[List[str], Any]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        for words, value in patterns:
+            if words:
+                self._add(words, value)
+        self._build()
+
+    def _add(self, words: List[str], value: Any) -> None:
+        state = 0
+        for word in words:
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][word] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((len(words), value))
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(word, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._out[next_state].extend(self._out[self._fail[next_state]])
+
+    def iter_matches(self, words: List[str]) -> Iterator[Tuple[int, int, Any]]:
+        """
+        Yield (start, end, value) for every pattern occurrence in the words
+        """
+        state = 0
+        for position, word in enumerate(words):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            for length, value in self._out[state]:
+                yield position - length + 1, position + 1, value
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+
+class EntityMatcher:
+    """
+    Finds reference entities mentioned in free text
+    """
+
+    def __init__(self, entities: Iterable[Entity]):
+        self.entities = list(entities)
+        self._automaton = AhoCorasick((tokenize(entity.name), entity) for entity in self.entities)
+
+    def find(self, text: str, limit: int = ENTITY_MAX_MATCHES) -> Tuple[List[Entity], List[str]]:
+        """
+        Entities mentioned in the text and the words not covered by any mention.
+
+        Overlapping mentions resolve to the longest, leftmost one.
+        """
+        words = tokenize(text)
+        matches = sorted(self._automaton.iter_matches(words), key=lambda match: (match[0], -(match[1] - match[0])))
+        found: List[Entity] = []
+        covered = [False] * len(words)
+        end_of_last = 0
+        for start, end, entity in matches:
+            if start < end_of_last:
+                continue
+            end_of_last = end
+            covered[start:end] = [True] * (end - start)
+            if entity not in found:
+                found.append(entity)
+        return found[:limit], [word for word, hit in zip(words, covered) if not hit]
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+
+def is_simple_lookup(entities: List[Entity], other_words: List[str]) -> bool:
+    """
+    True when the query only asks about the named entities ("side effects of ibuprofen?")
+    """
+    return bool(entities) and all(word in LOOKUP_WORDS for word in other_words)
+
+
+def _fetch_all(client: Any, table: str, columns: str, page_size: int) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    last_id = None
+    while True:
+        query = client.table(table).select(columns)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        page = query.order("id").limit(page_size).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        last_id = page[-1]["id"]
+
+
+def _to_entity(table: str, row: Dict[str, Any]) -> Entity:
+    if table == "medications":
+        details = {"Dosage": row.get("dosage_info"), "Side effects": row.get("side_effects")}
+        return Entity("medication", row["id"], row["name"], row["description"], details)
+    details = {"Symptoms": row.get("symptoms"), "Treatments": row.get("treatments")}
+    return Entity("condition", row["id"], row["name"], row["description"], details)
+
+
+class EntityIndex:
+    """
+    Process-wide matcher over the reference tables, loaded on first use.
+
+    ``refresh`` compares the tables' version counters with the loaded ones and
+    rebuilds only when they changed; ``run`` does so periodically. ``on_change``
+    is called after a rebuild that replaced earlier data.
+    """
+
+    def __init__(self, client_factory: Callable[[], Any], page_size: int = ENTITY_PAGE_SIZE,
+                 on_change: Optional[Callable[[], None]] = None):
+        self.client_factory = client_factory
+        self.page_size = page_size
+        self.on_change = on_change
+        self.versions: Optional[Dict[str, int]] = None
+        self._matcher: Optional[EntityMatcher] = None
+        self._lock = threading.RLock()
+
+    def _versions(self, client: Any) -> Dict[str, int]:
+        response = client.table("reference_data_versions").select("name, version").execute()
+        return {row["name"]: row["version"] for row in response.data or []}
+
+    def load(self) -> EntityMatcher:
+        with self._lock:
+            client = self.client_factory()
+            with span("entity_load"):
+                versions = self._versions(client)
+                entities = [
+                    _to_entity(table, row)
+                    for table, columns in REFERENCE_TABLES.items()
+                    for row in _fetch_all(client, table, columns, self.page_size)
+                ]
+                matcher = EntityMatcher(entities)
+            replaced = self._matcher is not None
+            self._matcher, self.versions = matcher, versions
+        if replaced and self.on_change is not None:
+            self.on_change()
+        return matcher
+
+    def refresh(self) -> bool:
+        """
+        Rebuild if either table changed since the last load
+        """
+        if self._matcher is not None and self._versions(self.client_factory()) == self.versions:
+            return False
+        self.load()
+        return True
+
+    def ensure_loaded(self) -> EntityMatcher:
+        """
+        The matcher, loading the reference tables first if needed (blocking; call from a thread)
+        """
+        with self._lock:
+            return self._matcher if self._matcher is not None else self.load()
+
+    async def matcher(self) -> EntityMatcher:
+        if self._matcher is None:
+            await executor.run_io(self.ensure_loaded)
+        return self._matcher
+
+    async def match(self, text: str) -> Tuple[List[Entity], List[str]]:
+        """
+        Entities in the text; nothing when the reference data cannot be loaded
+        """
+        try:
+            matcher = await self.matcher()
+        except Exception:
+            # Serve without entities; the periodic refresh retries the load
+            if self._matcher is None:
+                self._matcher = EntityMatcher([])
+            return [], []
+        return matcher.find(text)
+
+    async def run(self, interval: float = ENTITY_REFRESH_INTERVAL_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await executor.run_io(self.refresh)
+            except Exception:
+                pass
@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+# Pool sizes
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "32"))
+CPU_POOL_SIZE = int(os.getenv("CPU_POOL_SIZE", str(os.cpu_count() or 2)))
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def _get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    with _lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="kyra-io")
+        return _io_pool
+
+
+def _get_cpu_pool() -> ThreadPoolExecutor:
+    global _cpu_pool
+    with _lock:
+        if _cpu_pool is None:
+            _cpu_pool = ThreadPoolExecutor(max_workers=CPU_POOL_SIZE, thread_name_prefix="kyra-cpu")
+        return _cpu_pool
+
+
+async def _run(pool: ThreadPoolExecutor, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(pool, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+async def run_io(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run blocking network work (Supabase, LLM and embedding calls) off the event loop
+    """
+    return await _run(_get_io_pool(), func, *args, **kwargs)
+
+
+async def run_cpu(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run CPU-bound work (password hashing) on a pool sized to the machine.
+
+    bcrypt releases the GIL, so threads are enough to use every core.
+    """
+    return await _run(_get_cpu_pool(), func, *args, **kwargs)
+
+
+async def iterate_io(iterator: Iterator[Any]) -> AsyncIterator[Any]:
+    """
+    Consume a blocking iterator (e.g. an LLM token stream) without blocking the event loop
+    """
+    done = object()
+    while True:
+        item = await run_io(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def shutdown(wait: bool = True) -> None:
+    global _io_pool, _cpu_pool
+    with _lock:
+        for pool in (_io_pool, _cpu_pool):
+            if pool is not None:
+                pool.shutdown(wait=wait)
+        _io_pool = _cpu_pool = None
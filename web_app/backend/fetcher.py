@@ -0,0 +1,140 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+
+@dataclass
+class FetchResult:
+    """
+    Outcome of fetching a single URL
+    """
+    url: str
+    status_code: Optional[int] = None
+    text: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+    error: Optional[str] = None
+
+
+class PageTooLarge(Exception):
+    pass
+
+
+class PageFetcher:
+    """
+    Non-blocking page fetcher built on a pooled httpx client.
+
+    Concurrency is capped globally by the connection pool and per host by a
+    semaphore, kept only while the host has requests in flight, so arbitrary
+    user-supplied hosts do not accumulate; each URL gets an overall timeout and a
+    response size cap. Failures are reported per URL instead of failing the whole batch.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        per_host_limit: int = 4,
+        timeout: float = 15.0,
+        max_bytes: int = 5 * 1024 * 1024,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        # Per-host semaphore and the number of requests holding or waiting for it
+        self._host_limits: Dict[str, Tuple[asyncio.Semaphore, List[int]]] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                transport=self.transport,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    @asynccontextmanager
+    async def _host_limit(self, host: str) -> AsyncIterator[None]:
+        if host not in self._host_limits:
+            self._host_limits[host] = (asyncio.Semaphore(self.per_host_limit), [0])
+        semaphore, users = self._host_limits[host]
+        users[0] += 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            users[0] -= 1
+            if not users[0]:
+                del self._host_limits[host]
+
+    async def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        """
+        Fetch one URL, sending conditional headers when validators are known
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        try:
+            host = httpx.URL(url).host
+            async with self._host_limit(host):
+                return await asyncio.wait_for(self._fetch(url, headers), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return FetchResult(url=url, error=f"Timed out after {self.timeout:g}s")
+        except PageTooLarge:
+            return FetchResult(url=url, error=f"Response larger than {self.max_bytes} bytes")
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+            return FetchResult(url=url, error=str(e) or e.__class__.__name__)
+
+    async def _fetch(self, url: str, headers: Dict[str, str]) -> FetchResult:
+        async with self._get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                return FetchResult(url=url, status_code=304, not_modified=True)
+            response.raise_for_status()
+
+            content_length = response.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                raise PageTooLarge()
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    raise PageTooLarge()
+
+            try:
+                text = body.decode(response.charset_encoding or "utf-8", errors="replace")
+            except LookupError:
+                text = body.decode("utf-8", errors="replace")
+
+            return FetchResult(
+                url=url,
+                status_code=response.status_code,
+                text=text,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+
+    async def fetch_all(self, targets: Sequence[Tuple[str, Optional[str], Optional[str]]]) -> List[FetchResult]:
+        """
+        Fetch ``(url, etag, last_modified)`` targets concurrently, preserving order
+        """
+        return await asyncio.gather(*(self.fetch(*target) for target in targets))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
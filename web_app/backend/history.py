@@ -0,0 +1,347 @@
+"""
+Conversation history for the chat endpoints.
+
+Turns are buffered in memory and written to public.messages in batches, read back
+with keyset pagination on (user_id, inserted_at, id), and turned into a prompt
+context that stays under a fixed token budget: the most recent turns verbatim,
+older ones folded into a rolling per-user summary in public.conversation_summaries.
+"""
+import asyncio
+import base64
+import threading
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import os
+
+from cache import TTLCache
+from chunking import count_tokens
+from clients import get_llm, get_supabase_client
+from coalesce import SingleFlight
+from metrics import span, record_cache
+import executor
+
+HISTORY_FLUSH_SIZE = int(os.getenv("HISTORY_FLUSH_SIZE", "50"))
+HISTORY_FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", "1.0"))
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "5000"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+# Prompt budget for history: recent turns plus the rolling summary
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+# Unsummarized messages read per request; anything older is covered by the summary
+HISTORY_CONTEXT_MESSAGES = int(os.getenv("HISTORY_CONTEXT_MESSAGES", "40"))
+
+MESSAGE_COLUMNS = "id, inserted_at, message, is_ai_response"
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a patient and a medical "
+    "assistant. Update the summary with the new turns, keeping symptoms, conditions, "
+    "medications, questions asked and advice given. Reply with the summary only, in "
+    "under {max_tokens} tokens.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New turns:\n{turns}\n\n"
+    "Updated summary:"
+)
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """
+    Opaque keyset cursor pointing just below the given message
+    """
+    raw = f"{row['inserted_at']}|{row['id']}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        inserted_at, message_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return inserted_at, int(message_id)
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def fetch_messages(
+    client: Any,
+    user_id: str,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    after_id: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of a user's messages, newest first, and the cursor for the next page.
+
+    Served by the (user_id, inserted_at desc, id desc) index: the cursor continues
+    strictly below the last row returned, so pages never skip or repeat rows.
+    """
+    query = client.table("messages").select(MESSAGE_COLUMNS).eq("user_id", user_id)
+    if cursor:
+        inserted_at, message_id = decode_cursor(cursor)
+        # Quoted, so the timestamp's "+00:00" and ":" survive the PostgREST filter syntax
+        inserted_at = '"' + inserted_at.replace('"', "") + '"'
+        query = query.or_(f"inserted_at.lt.{inserted_at},and(inserted_at.eq.{inserted_at},id.lt.{message_id})")
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    response = (
+        query.order("inserted_at", desc=True)
+        .order("id", desc=True)
+        .limit(limit + 1)
+        .execute()
+    )
+    rows = response.data or []
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Longest whole-word prefix of the text within ``max_tokens``
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+class MessageWriter:
+    """
+    Buffers chat turns and inserts them into public.messages in batches.
+
+    A batch is written when ``flush_size`` turns are pending or every
+    ``flush_interval`` seconds while running. Turns keep the time they were
+    recorded, so batching does not change their order.
+    """
+
+    def __init__(self, flush_size: int = HISTORY_FLUSH_SIZE, flush_interval: float = HISTORY_FLUSH_INTERVAL_SECONDS,
+                 max_pending: int = HISTORY_MAX_PENDING):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: List[Dict[str, Any]] = []
+        self._writing: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, user_id: str, message: str, is_ai_response: bool) -> Dict[str, Any]:
+        row = {
+            "user_id": user_id,
+            "message": message,
+            "is_ai_response": is_ai_response,
+            "inserted_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self._spawn(self.flush())
+        return row
+
+    def record_turn(self, user_id: str, query: str, response: str) -> None:
+        self.add(user_id, query, False)
+        self.add(user_id, response, True)
+
+    def pending(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Turns of the user not yet written, newest first
+        """
+        with self._lock:
+            return [row for row in reversed(self._writing + self._pending) if row["user_id"] == user_id]
+
+    async def flush(self) -> int:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._writing = batch
+            if not batch:
+                return 0
+            try:
+                with span("history_write"):
+                    await executor.run_io(get_supabase_client().table("messages").insert(batch).execute)
+            except Exception:
+                # Keep the turns for the next attempt, dropping the oldest beyond the cap
+                with self._lock:
+                    self._pending = (batch + self._pending)[-self.max_pending:]
+                raise
+            finally:
+                with self._lock:
+                    self._writing = []
+            return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+
+    def _spawn(self, coroutine) -> None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No running loop (called from a worker thread): the periodic flush picks it up
+            coroutine.close()
+            return
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+message_writer = MessageWriter()
+
+# Rolling summaries by user; refreshed in the background, at most one at a time per user
+summary_cache = TTLCache(maxsize=10000, ttl=float(os.getenv("HISTORY_SUMMARY_CACHE_TTL_SECONDS", "300")))
+summary_flights = SingleFlight("summary")
+_summary_tasks: Set[asyncio.Task] = set()
+
+
+def _load_summary(user_id: str) -> Dict[str, Any]:
+    cached = summary_cache.get(user_id)
+    record_cache("summary", "miss" if cached is None else "hit")
+    if cached is not None:
+        return cached
+    response = (
+        get_supabase_client().table("conversation_summaries")
+        .select("summary, summarized_through_id")
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+    )
+    row = response.data[0] if response.data else {"summary": "", "summarized_through_id": None}
+    summary_cache.set(user_id, row)
+    return row
+
+
+def _format_turn(row: Dict[str, Any]) -> str:
+    return f"{'Assistant' if row['is_ai_response'] else 'Patient'}: {row['message']}"
+
+
+def _older_turns(user_id: str, summary: Dict[str, Any], cursor: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Unsummarized turns older than the ones read for the prompt, paged back to the summary cursor
+    """
+    rows: List[Dict[str, Any]] = []
+    while cursor is not None:
+        page, cursor = fetch_messages(
+            get_supabase_client(), user_id, HISTORY_PAGE_SIZE, cursor, summary["summarized_through_id"]
+        )
+        rows.extend(page)
+    return rows
+
+
+def _summarize(user_id: str, summary: Dict[str, Any], overflow: List[Dict[str, Any]], cursor: Optional[str]) -> None:
+    """
+    Fold turns that no longer fit the budget into the user's rolling summary.
+
+    Turns older than those read for the prompt (from ``cursor`` back) are folded
+    in first, a page at a time, so everything behind the new cursor is part of
+    the summary.
+    """
+    turns = sorted(_older_turns(user_id, summary, cursor) + overflow, key=lambda row: row["id"])
+    if not turns:
+        return
+    text = summary["summary"]
+    for start in range(0, len(turns), HISTORY_PAGE_SIZE):
+        prompt = SUMMARY_PROMPT.format(
+            max_tokens=HISTORY_SUMMARY_TOKENS,
+            summary=text or "(none)",
+            turns="\n".join(_format_turn(row) for row in turns[start:start + HISTORY_PAGE_SIZE]),
+        )
+        with span("history_summary"):
+            text = truncate_tokens(str(get_llm().complete(prompt)).strip(), HISTORY_SUMMARY_TOKENS)
+    row = {
+        "user_id": user_id,
+        "summary": text,
+        "summarized_through_id": turns[-1]["id"],
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    get_supabase_client().table("conversation_summaries").upsert(row, on_conflict="user_id").execute()
+    summary_cache.set(user_id, {"summary": text, "summarized_through_id": row["summarized_through_id"]})
+
+
+def _schedule_summary(user_id: str, summary: Dict[str, Any], overflow: List[Dict[str, Any]],
+                      cursor: Optional[str]) -> None:
+    task = asyncio.ensure_future(
+        summary_flights.do(user_id, lambda: executor.run_io(_summarize, user_id, summary, overflow, cursor))
+    )
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
+
+
+async def conversation_context(user_id: str, budget: int = HISTORY_TOKEN_BUDGET) -> str:
+    """
+    The conversation so far as prompt text, within ``budget`` tokens.
+
+    Keeps the newest turns that fit after the rolling summary; older unsummarized
+    turns, including any beyond the HISTORY_CONTEXT_MESSAGES read, are summarized
+    in the background so later prompts stay the same size.
+    """
+    with span("history_read"):
+        summary = await executor.run_io(_load_summary, user_id)
+        rows, older = await executor.run_io(
+            fetch_messages,
+            get_supabase_client(),
+            user_id,
+            HISTORY_CONTEXT_MESSAGES,
+            None,
+            summary["summarized_through_id"],
+        )
+    turns = message_writer.pending(user_id) + rows
+
+    remaining = budget - count_tokens(summary["summary"])
+    kept = []
+    for row in turns:
+        tokens = count_tokens(_format_turn(row))
+        if tokens > remaining:
+            break
+        kept.append(row)
+        remaining -= tokens
+
+    # Turns that did not fit, and any behind the rows read, go into the summary
+    overflow = [row for row in turns[len(kept):] if row.get("id") is not None]
+    if overflow or older is not None:
+        _schedule_summary(user_id, summary, overflow, older)
+
+    parts = []
+    if summary["summary"]:
+        parts.append(f"Summary of the earlier conversation:\n{summary['summary']}")
+    if kept:
+        parts.append("Recent conversation:\n" + "\n".join(_format_turn(row) for row in reversed(kept)))
+    return "\n\n".join(parts)
+
+
+async def record_stream(
+    events: AsyncIterator[Tuple[str, Any]], user_id: str, query: str
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Pass streamed RAG events through and record the completed turn
+    """
+    tokens = []
+    async for event, data in events:
+        if event == "token":
+            tokens.append(data)
+        yield event, data
+    message_writer.record_turn(user_id, query, "".join(tokens))
@@ -0,0 +1,238 @@
+"""
+Incremental embedding ingestion for rag_documents.
+
+Run from the backend directory:
+
+    python ingest.py                  # documents changed since the last run
+    python ingest.py --since 2024-01-01T00:00:00Z
+    python ingest.py --all            # re-check every document by content hash
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from cache import content_hash
+from chunking import count_tokens, iter_chunks, iter_text_blocks
+
+# Ingestion settings
+INGEST_PAGE_SIZE = int(os.getenv("INGEST_PAGE_SIZE", "500"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+INGEST_REQUESTS_PER_MINUTE = float(os.getenv("INGEST_REQUESTS_PER_MINUTE", "500"))
+INGEST_TOKENS_PER_MINUTE = float(os.getenv("INGEST_TOKENS_PER_MINUTE", "1000000"))
+INGEST_STATE_FILE = os.getenv("INGEST_STATE_FILE", ".cache/ingest_state.json")
+
+# Documents longer than this are embedded in chunks and the chunk vectors averaged
+EMBED_CHUNK_TOKENS = int(os.getenv("EMBED_CHUNK_TOKENS", "2048"))
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for embedding requests and tokens per minute
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._updated = now
+                self._requests = min(self.request_rate * 60, self._requests + elapsed * self.request_rate)
+                self._tokens = min(self.token_rate * 60, self._tokens + elapsed * self.token_rate)
+
+                # A single oversized request may borrow up to a full minute of tokens
+                tokens = min(tokens, self.token_rate * 60)
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+
+                wait = max(
+                    (1 - self._requests) / self.request_rate if self._requests < 1 else 0,
+                    (tokens - self._tokens) / self.token_rate if self._tokens < tokens else 0,
+                )
+            time.sleep(wait)
+
+
+def chunk_for_embedding(text: str, chunk_tokens: int = EMBED_CHUNK_TOKENS) -> List[str]:
+    """
+    Split a document into pieces that fit the embedding model's input limit
+    """
+    if count_tokens(text) <= chunk_tokens:
+        return [text]
+    return [chunk for chunk, _ in iter_chunks(iter_text_blocks(text), chunk_tokens, overlap_tokens=0)]
+
+
+def combine_embeddings(embeddings: List[List[float]], weights: List[int]) -> List[float]:
+    """
+    Length-weighted average of chunk embeddings, re-normalised to unit length
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    combined = np.average(matrix, axis=0, weights=np.asarray(weights, dtype=np.float32))
+    norm = np.linalg.norm(combined)
+    if norm > 0:
+        combined = combined / norm
+    return combined.tolist()
+
+
+def embed_with_retry(
+    embed: Callable[[List[str]], List[List[float]]],
+    texts: List[str],
+    limiter: Optional[RateLimiter] = None,
+    max_retries: int = INGEST_MAX_RETRIES,
+) -> List[List[float]]:
+    """
+    Embed a batch, backing off exponentially (with jitter) on failures
+    """
+    if limiter is not None:
+        limiter.acquire(sum(count_tokens(text) for text in texts))
+
+    for attempt in range(max_retries + 1):
+        try:
+            return embed(texts)
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(min(60.0, 2 ** attempt) * (0.5 + random.random() / 2))
+
+
+def iter_candidate_rows(
+    client: Any,
+    since: Optional[str] = None,
+    scan_all: bool = False,
+    page_size: int = INGEST_PAGE_SIZE,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Page through documents that may need embedding, using keyset pagination on id
+    """
+    last_id = 0
+    while True:
+        query = client.table("rag_documents").select("id,content,content_hash")
+        if not scan_all:
+            filters = ["embedding.is.null", "content_hash.is.null"]
+            if since:
+                filters.append(f"last_updated.gte.{since}")
+            query = query.or_(",".join(filters))
+        response = query.gt("id", last_id).order("id").limit(page_size).execute()
+
+        rows = response.data or []
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+        if len(rows) < page_size:
+            return
+
+
+def ingest(
+    client: Any,
+    embed: Callable[[List[str]], List[List[float]]],
+    since: Optional[str] = None,
+    scan_all: bool = False,
+    batch_size: int = INGEST_BATCH_SIZE,
+    page_size: int = INGEST_PAGE_SIZE,
+    limiter: Optional[RateLimiter] = None,
+    on_written: Optional[Callable[[List[Any]], None]] = None,
+) -> Dict[str, int]:
+    """
+    Embed new or changed rag_documents and write the vectors back in bulk.
+
+    ``on_written`` is called with the ids of each written batch, so caches of
+    answers built from the old content can drop them.
+    """
+    stats = {"scanned": 0, "skipped": 0, "embedded": 0, "written": 0}
+
+    for rows in iter_candidate_rows(client, since=since, scan_all=scan_all, page_size=page_size):
+        stats["scanned"] += len(rows)
+
+        # Skip documents whose embedding was computed from the current content
+        pending = []
+        for row in rows:
+            digest = content_hash(row["content"])
+            if row.get("content_hash") == digest:
+                stats["skipped"] += 1
+                continue
+            pending.append((row["id"], digest, chunk_for_embedding(row["content"])))
+        if not pending:
+            continue
+
+        texts = [chunk for _, _, chunks in pending for chunk in chunks]
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(embed_with_retry(embed, texts[start:start + batch_size], limiter))
+
+        updates = []
+        offset = 0
+        for doc_id, digest, chunks in pending:
+            doc_vectors = vectors[offset:offset + len(chunks)]
+            offset += len(chunks)
+            embedding = doc_vectors[0] if len(chunks) == 1 else combine_embeddings(
+                doc_vectors, [len(chunk) for chunk in chunks]
+            )
+            updates.append({"id": doc_id, "embedding": embedding, "content_hash": digest})
+
+        stats["embedded"] += len(updates)
+        response = client.rpc("bulk_update_rag_document_embeddings", {"updates": updates}).execute()
+        stats["written"] += response.data or 0
+        if on_written is not None:
+            on_written([update["id"] for update in updates])
+
+    return stats
+
+
+def _load_watermark(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("since")
+    except (OSError, ValueError):
+        return None
+
+
+def _save_watermark(path: str, since: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"since": since}, f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embed new or changed rag_documents")
+    parser.add_argument("--since", help="Only consider documents updated at or after this ISO timestamp")
+    parser.add_argument("--all", action="store_true", help="Re-check every document by content hash")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--page-size", type=int, default=INGEST_PAGE_SIZE)
+    args = parser.parse_args()
+
+    from clients import get_database_embed_model, get_supabase_client
+
+    started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    since = args.since or _load_watermark(INGEST_STATE_FILE)
+    stats = ingest(
+        get_supabase_client(),
+        get_database_embed_model().get_text_embedding_batch,
+        since=since,
+        scan_all=args.all,
+        batch_size=args.batch_size,
+        page_size=args.page_size,
+        limiter=RateLimiter(INGEST_REQUESTS_PER_MINUTE, INGEST_TOKENS_PER_MINUTE),
+    )
+    _save_watermark(INGEST_STATE_FILE, started)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
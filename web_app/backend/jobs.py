@@ -0,0 +1,304 @@
+"""
+Background jobs for long RAG requests.
+
+Submitting a job returns at once with its id; a bounded pool of worker tasks
+runs queued jobs, and clients poll the job or follow its progress events.
+Admission control keeps overload from turning into timeouts: a full queue, or
+a user already at their concurrency quota, rejects the submission with a
+suggested retry delay instead of accepting work that cannot start soon.
+
+Jobs run in the process that accepted them and are mirrored to the rag_jobs
+table, so their status and result can be read from any worker.
+"""
+import asyncio
+import math
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import os
+
+from clients import get_supabase_client
+from metrics import span, record_job, record_job_rejected
+import executor
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Most jobs waiting for a worker, and most unfinished jobs per user
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "64"))
+JOB_USER_CONCURRENCY = int(os.getenv("JOB_USER_CONCURRENCY", "2"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+# How long finished jobs stay in memory for polling
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "900"))
+
+FINISHED = ("succeeded", "failed")
+
+EventSource = Callable[[], AsyncIterator[Tuple[str, Any]]]
+
+
+class JobRejected(Exception):
+    """
+    The job was not accepted; try again after ``retry_after`` seconds
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@dataclass
+class Job:
+    id: str
+    user_id: str
+    kind: str
+    events: EventSource
+    status: str = "queued"
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=_now)
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    # Progress events so far, replayed to late subscribers
+    history: List[Tuple[str, Any]] = field(default_factory=list)
+    finished_monotonic: Optional[float] = None
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def emit(self, event: str, data: Any) -> None:
+        self.history.append((event, data))
+        # Wake subscribers waiting for the next event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def view(self) -> Dict[str, Any]:
+        """
+        The job as returned by the API and stored in rag_jobs
+        """
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    async def follow(self) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Every event of the job, from the first, until it finishes
+        """
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.history):
+                yield self.history[position]
+                position += 1
+            if self.status in FINISHED:
+                return
+            await changed.wait()
+
+
+def _persist(job: Job, insert: bool = False) -> None:
+    """
+    Mirror the job to rag_jobs; a failed write never fails the job itself
+    """
+    row = job.view()
+    try:
+        table = get_supabase_client().table("rag_jobs")
+        if insert:
+            table.insert({**row, "user_id": job.user_id}).execute()
+        else:
+            table.update({key: row[key] for key in ("status", "result", "error", "started_at", "finished_at")}) \
+                .eq("id", job.id).execute()
+    except Exception:
+        pass
+
+
+def fetch_job(client: Any, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    A job accepted by another worker, from rag_jobs
+    """
+    response = client.table("rag_jobs") \
+        .select("id, kind, status, result, error, created_at, started_at, finished_at") \
+        .eq("id", job_id).eq("user_id", user_id).limit(1).execute()
+    return response.data[0] if response.data else None
+
+
+class JobQueue:
+    """
+    Bounded queue of jobs served by a fixed number of worker tasks.
+
+    ``submit`` raises JobRejected when ``queue_limit`` jobs are already waiting
+    or the user has ``user_limit`` unfinished jobs. Retry-After suggestions come
+    from a moving average of recent job durations.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_limit: int = JOB_QUEUE_LIMIT,
+                 user_limit: int = JOB_USER_CONCURRENCY, timeout: float = JOB_TIMEOUT_SECONDS,
+                 result_ttl: float = JOB_RESULT_TTL_SECONDS):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.user_limit = user_limit
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.jobs: Dict[str, Job] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: "asyncio.Queue[Job]" = asyncio.Queue()
+        self._active: Dict[str, int] = {}
+        # Accepted jobs not yet on the queue (their rag_jobs row is being written)
+        self._reserved = 0
+        self._tasks: List[asyncio.Task] = []
+        self._average_seconds: Optional[float] = None
+
+    def _bind(self) -> None:
+        # Queue and workers belong to one event loop; start afresh on a new one
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._active, self._tasks = {}, []
+            self._reserved = 0
+
+    def _estimate(self, jobs_ahead: int) -> int:
+        per_job = self._average_seconds or 10.0
+        return max(1, math.ceil(per_job * max(1, jobs_ahead) / self.workers))
+
+    def queued(self) -> int:
+        return self._queue.qsize() + self._reserved
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.result_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished_monotonic is not None and job.finished_monotonic < cutoff]:
+            del self.jobs[job_id]
+
+    async def submit(self, user_id: str, kind: str, events: EventSource) -> Job:
+        self._bind()
+        self._prune()
+        if self._active.get(user_id, 0) >= self.user_limit:
+            record_job_rejected("user_limit")
+            raise JobRejected("Too many unfinished jobs for this user", self._estimate(1))
+        if self.queued() >= self.queue_limit:
+            record_job_rejected("queue_full")
+            raise JobRejected("Job queue is full", self._estimate(self.queued()))
+
+        # Counted before the first await, so concurrent submissions see this one
+        job = Job(id=str(uuid.uuid4()), user_id=user_id, kind=kind, events=events)
+        self.jobs[job.id] = job
+        self._active[user_id] = self._active.get(user_id, 0) + 1
+        self._reserved += 1
+        try:
+            # Stored before a worker can pick it up, so status updates find the row
+            await executor.run_io(_persist, job, True)
+        except BaseException:
+            self._release(job)
+            del self.jobs[job.id]
+            raise
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait(job)
+        record_job("queued", 1)
+        job.emit("status", {"status": "queued", "position": self._queue.qsize()})
+        self.start()
+        return job
+
+    def get(self, job_id: str, user_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def _release(self, job: Job) -> None:
+        self._active[job.user_id] -= 1
+        if not self._active[job.user_id]:
+            del self._active[job.user_id]
+
+    async def _finish(self, job: Job) -> None:
+        job.finished_at, job.finished_monotonic = _now(), time.monotonic()
+        self._release(job)
+        job.emit("status", {"status": job.status})
+        if job.status == "succeeded":
+            job.emit("result", job.result)
+        else:
+            job.emit("error", {"detail": job.error})
+        await executor.run_io(_persist, job)
+
+    async def _cancel(self, job: Job) -> None:
+        job.status, job.error = "failed", "Job cancelled: the server is shutting down"
+        await self._finish(job)
+
+    async def _run(self, job: Job) -> None:
+        started = time.perf_counter()
+        try:
+            await self._execute(job)
+        except asyncio.CancelledError:
+            # Stopped mid-run: record the job as failed rather than leave it running, then stop
+            await self._cancel(job)
+            raise
+        elapsed = time.perf_counter() - started
+        self._average_seconds = elapsed if self._average_seconds is None else 0.8 * self._average_seconds + 0.2 * elapsed
+        await self._finish(job)
+
+    async def _execute(self, job: Job) -> None:
+        job.status, job.started_at = "running", _now()
+        job.emit("status", {"status": "running"})
+        await executor.run_io(_persist, job)
+        tokens: List[str] = []
+        extra: Dict[str, Any] = {}
+
+        async def consume():
+            async for event, data in job.events():
+                job.emit(event, data)
+                if event == "token":
+                    tokens.append(data)
+                elif isinstance(data, dict):
+                    extra.update(data)
+
+        try:
+            with span("job"):
+                await asyncio.wait_for(consume(), self.timeout)
+            job.status, job.result = "succeeded", {"response": "".join(tokens), **extra}
+        except asyncio.TimeoutError:
+            job.status, job.error = "failed", f"Job timed out after {self.timeout:g} seconds"
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            record_job("queued", -1)
+            record_job("running", 1)
+            try:
+                await self._run(job)
+            finally:
+                record_job("running", -1)
+                self._queue.task_done()
+
+    def start(self) -> None:
+        """
+        Start the worker tasks on the running loop (idempotent)
+        """
+        self._bind()
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(asyncio.ensure_future(self._worker()))
+
+    async def stop(self) -> None:
+        """
+        Cancel the workers; running and still queued jobs end as failed
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            record_job("queued", -1)
+            await self._cancel(job)
+
+
+job_queue = JobQueue()
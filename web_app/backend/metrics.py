@@ -0,0 +1,246 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from starlette.datastructures import MutableHeaders
+
+STAGE_SECONDS = Histogram(
+    "kyra_stage_duration_seconds",
+    "Time spent in each stage of request handling",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUEST_SECONDS = Histogram(
+    "kyra_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+IN_FLIGHT = Gauge(
+    "kyra_requests_in_flight",
+    "HTTP requests currently being handled",
+    multiprocess_mode="livesum",
+)
+CACHE_EVENTS = Counter(
+    "kyra_cache_events_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+TOKENS = Counter(
+    "kyra_tokens_total",
+    "LLM and embedding token usage",
+    ["kind"],
+)
+COALESCED = Counter(
+    "kyra_coalesced_calls_total",
+    "Calls that joined an identical in-flight computation instead of starting their own",
+    ["operation"],
+)
+JOBS = Gauge(
+    "kyra_jobs",
+    "Background jobs by state",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+JOBS_REJECTED = Counter(
+    "kyra_jobs_rejected_total",
+    "Job submissions turned away by admission control",
+    ["reason"],
+)
+CONTEXT_TOKENS = Histogram(
+    "kyra_context_tokens",
+    "Retrieved context tokens per answer: sent to the LLM, or saved by reranking and compression",
+    ["kind"],
+    buckets=(0, 50, 100, 250, 500, 1000, 1500, 2000, 4000, 8000, 16000),
+)
+LLM_ROUTES = Counter(
+    "kyra_llm_routes_total",
+    "LLM answers by routed tier and the rule that chose it; fallback counts fast answers redone by the large model",
+    ["tier", "reason"],
+)
+WEBSOCKETS = Gauge(
+    "kyra_websocket_connections",
+    "Open chat WebSocket connections",
+    multiprocess_mode="livesum",
+)
+IMPORT_ROWS = Counter(
+    "kyra_import_rows_total",
+    "Rows read by the rag_documents bulk import: inserted, duplicate or invalid",
+    ["outcome"],
+)
+
+# Stage timings of the current request, used for the Server-Timing header
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a stage: observed in the stage histogram and added to the request's Server-Timing
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def record_cache(cache: str, result: str) -> None:
+    CACHE_EVENTS.labels(cache, result).inc()
+
+
+def record_tokens(kind: str, count: int) -> None:
+    if count:
+        TOKENS.labels(kind).inc(count)
+
+
+def record_coalesced(operation: str) -> None:
+    COALESCED.labels(operation).inc()
+
+
+def record_job(state: str, change: int) -> None:
+    JOBS.labels(state).inc(change)
+
+
+def record_job_rejected(reason: str) -> None:
+    JOBS_REJECTED.labels(reason).inc()
+
+
+def record_context_tokens(sent: int, saved: int) -> None:
+    CONTEXT_TOKENS.labels("sent").observe(sent)
+    CONTEXT_TOKENS.labels("saved").observe(saved)
+
+
+def record_route(tier: str, reason: str) -> None:
+    LLM_ROUTES.labels(tier, reason).inc()
+
+
+def record_websocket(change: int) -> None:
+    WEBSOCKETS.inc(change)
+
+
+def record_import_rows(outcome: str, count: int) -> None:
+    if count:
+        IMPORT_ROWS.labels(outcome).inc(count)
+
+
+def _totals(timings: List[Tuple[str, float]]) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for stage, elapsed in timings:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return totals
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """
+    Format stage timings as a Server-Timing header value, summing repeated stages
+    """
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in _totals(timings).items())
+
+
+def stage_timings() -> Dict[str, float]:
+    """
+    Milliseconds per stage of the current request so far, for streamed responses
+    whose Server-Timing header was sent before most stages ran
+    """
+    return {stage: round(elapsed * 1000, 1) for stage, elapsed in _totals(_timings.get() or []).items()}
+
+
+def render() -> Tuple[bytes, str]:
+    """
+    Prometheus exposition of all metrics, aggregated across workers in multiprocess mode
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware tracking in-flight requests and latency, and emitting Server-Timing.
+
+    The header is written when the response starts, so for streamed responses it
+    only covers the stages before the first byte; the SSE endpoints end their
+    stream with a ``timing`` event carrying every stage instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    ", ".join(filter(None, [
+                        server_timing(timings),
+                        f"total;dur={(time.perf_counter() - started) * 1000:.1f}",
+                    ]))
+                )
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status_code)).observe(time.perf_counter() - started)
+            _timings.reset(token)
+
+
+def token_usage_handler():
+    """
+    LlamaIndex callback handler that exports LLM and embedding token counts
+    """
+    from llama_index.core.callbacks import TokenCountingHandler
+
+    class PrometheusTokenCountingHandler(TokenCountingHandler):
+        def on_event_end(self, *args, **kwargs) -> None:
+            super().on_event_end(*args, **kwargs)
+            # Drain the per-event counts so they do not accumulate in memory
+            while True:
+                try:
+                    event = self.llm_token_counts.pop()
+                except IndexError:
+                    break
+                record_tokens("prompt", event.prompt_token_count)
+                record_tokens("completion", event.completion_token_count)
+            while True:
+                try:
+                    event = self.embedding_token_counts.pop()
+                except IndexError:
+                    break
+                record_tokens("embedding", event.total_token_count)
+
+    return PrometheusTokenCountingHandler()
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+from datetime import date
 from typing import List, Optional, Dict, Any
+import json
 
 # User models
 class User(BaseModel):
@@ -22,7 +24,71 @@ class TokenData(BaseModel):
 class QueryRequest(BaseModel):
     query: str
     urls: Optional[List[str]] = None
+    # Answer in the context of the user's conversation and record the turn
+    use_history: bool = False
 
 class DatabaseQueryRequest(BaseModel):
     query: str
-    collection_name: Optional[str] = None
\ No newline at end of file
+    collection_name: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[List[str]] = None
+    top_k: Optional[int] = Field(default=None, ge=1, le=50)
+    use_history: bool = False
+
+# Batch variants: several questions over one URL set or collection
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(min_length=1, max_length=20)
+    urls: Optional[List[str]] = None
+
+class BatchDatabaseQueryRequest(BaseModel):
+    queries: List[str] = Field(min_length=1, max_length=20)
+    collection_name: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[List[str]] = None
+    top_k: Optional[int] = Field(default=None, ge=1, le=50)
+
+# One chat turn sent over the WebSocket; pages when urls are given, else the database
+class ChatMessage(BaseModel):
+    id: Optional[str] = None
+    query: str
+    urls: Optional[List[str]] = None
+    collection_name: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[List[str]] = None
+    top_k: Optional[int] = Field(default=None, ge=1, le=50)
+    use_history: bool = True
+
+# One rag_documents row from a bulk import (an NDJSON object or a CSV record)
+class ImportDocument(BaseModel):
+    title: str = Field(min_length=1)
+    content: str = Field(min_length=1)
+    url: Optional[str] = None
+    source_type: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[List[str]] = None
+    author: Optional[str] = None
+    publication_date: Optional[date] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def blank_as_missing(cls, value):
+        # Empty CSV cells
+        if isinstance(value, str) and not value.strip():
+            return None
+        return value
+
+    @field_validator("tags", mode="before")
+    @classmethod
+    def split_tags(cls, value):
+        # CSV cells hold a JSON array or comma-separated tags
+        if isinstance(value, str):
+            if value.lstrip().startswith("["):
+                return json.loads(value)
+            return [tag.strip() for tag in value.split(",") if tag.strip()]
+        return value
+
+    @field_validator("metadata", mode="before")
+    @classmethod
+    def parse_metadata(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
@@ -0,0 +1,194 @@
+"""
+Per-patient context bundles, pre-warmed at login.
+
+A patient's questions are mostly about the diagnosis and prescription on their
+users row. When they log in, a background task matches those against the
+reference tables, retrieves the best rag_documents chunks for each in one
+search, and keeps the result as the patient's bundle. A question the bundle
+covers is then answered from it without an embedding call or a search.
+
+Bundles expire after PATIENT_CONTEXT_TTL_SECONDS, are dropped as soon as the
+patient's users row changes (from the Supabase realtime feed on public.users),
+and are all dropped when the reference tables are reloaded.
+"""
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import os
+
+from cache import TTLCache
+from clients import get_database_embed_model, get_supabase_client
+from coalesce import SingleFlight
+from entities import Entity, EntityIndex
+from metrics import span
+from rerank import terms
+from retrieval import search_rag_documents_batch
+import executor
+
+PATIENT_CONTEXT_ENABLED = os.getenv("PATIENT_CONTEXT_ENABLED", "true").lower() == "true"
+PATIENT_CONTEXT_TTL_SECONDS = float(os.getenv("PATIENT_CONTEXT_TTL_SECONDS", "3600"))
+PATIENT_CONTEXT_MAX_ENTRIES = int(os.getenv("PATIENT_CONTEXT_MAX_ENTRIES", "10000"))
+# rag_documents rows retrieved for the diagnosis and for the prescription
+PATIENT_CONTEXT_DOCUMENTS = int(os.getenv("PATIENT_CONTEXT_DOCUMENTS", "8"))
+# Fraction of a question's terms the bundle must cover to answer from it alone
+PATIENT_CONTEXT_MIN_COVERAGE = float(os.getenv("PATIENT_CONTEXT_MIN_COVERAGE", "0.5"))
+# Subscribe to changes of public.users, and how long to wait before reconnecting
+PATIENT_CONTEXT_REALTIME = os.getenv("PATIENT_CONTEXT_REALTIME", "true").lower() == "true"
+PATIENT_CONTEXT_RECONNECT_SECONDS = float(os.getenv("PATIENT_CONTEXT_RECONNECT_SECONDS", "30"))
+
+# Words with which patients refer to their own record; the bundle covers them by definition
+SELF_REFERENCE_WORDS = frozenset({
+    "diagnosis", "diagnosed", "prescription", "prescribed", "condition", "conditions",
+    "medication", "medications", "medicine", "medicines", "meds", "illness", "treatment",
+})
+
+
+@dataclass
+class PatientContext:
+    """
+    Reference entities and rag_documents rows about one patient's diagnosis and prescription
+    """
+    user_id: str
+    entities: List[Entity]
+    documents: List[Dict[str, Any]]
+    _terms: Set[str] = field(default_factory=set, repr=False)
+
+    def __post_init__(self):
+        for text in [entity.context() for entity in self.entities] + [row["content"] for row in self.documents]:
+            self._terms.update(terms(text))
+
+    def entity_keys(self) -> Set[Tuple[str, Any]]:
+        return {(entity.kind, entity.id) for entity in self.entities}
+
+    def covers(self, query: str, entity_keys: Sequence[Tuple[str, Any]] = ()) -> bool:
+        """
+        True if every entity the question names is in the bundle and the bundle contains most of its terms
+        """
+        if not set(entity_keys) <= self.entity_keys():
+            return False
+        query_terms = set(terms(query)) - SELF_REFERENCE_WORDS
+        if not query_terms:
+            return True
+        return len(query_terms & self._terms) / len(query_terms) >= PATIENT_CONTEXT_MIN_COVERAGE
+
+
+def build_patient_context(user: Dict[str, Any], entity_index: EntityIndex,
+                          documents: int = PATIENT_CONTEXT_DOCUMENTS) -> Optional[PatientContext]:
+    """
+    Retrieve the bundle for a users row; None when it has no diagnosis or prescription
+    """
+    topics = [text.strip() for text in (user.get("diagnosis"), user.get("prescription")) if text and text.strip()]
+    if not topics:
+        return None
+    with span("patient_context_build"):
+        matcher = entity_index.ensure_loaded()
+        entities: List[Entity] = []
+        for topic in topics:
+            entities.extend(entity for entity in matcher.find(topic)[0] if entity not in entities)
+
+        embeddings = get_database_embed_model().get_text_embedding_batch(topics)
+        rows: Dict[Any, Dict[str, Any]] = {}
+        for results in search_rag_documents_batch(get_supabase_client(), embeddings, topics, documents):
+            for row in results:
+                rows.setdefault(row.get("id", len(rows)), row)
+    return PatientContext(user_id=str(user["id"]), entities=entities, documents=list(rows.values()))
+
+
+class PatientContextCache:
+    """
+    Bundles by user id, built in the background and invalidated on change.
+
+    A build that was running when its user was invalidated is not stored, so a
+    bundle never outlives the row it was built from.
+    """
+
+    def __init__(self, entity_index: EntityIndex, ttl: float = PATIENT_CONTEXT_TTL_SECONDS,
+                 maxsize: int = PATIENT_CONTEXT_MAX_ENTRIES):
+        self.entity_index = entity_index
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flights = SingleFlight("patient_context")
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: Optional[str]) -> Optional[PatientContext]:
+        return self._cache.get(str(user_id)) if user_id is not None else None
+
+    def _generation(self, user_id: str) -> Tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._generations.get(user_id, 0)
+
+    async def warm(self, user: Dict[str, Any]) -> Optional[PatientContext]:
+        """
+        Build and store the bundle for a users row (identical concurrent calls share one build).
+
+        A failed build leaves the patient on normal retrieval.
+        """
+        user_id = str(user["id"])
+        generation = self._generation(user_id)
+        try:
+            # Keyed by generation too, so a warm after an invalidation never joins an older build
+            context = await self._flights.do(
+                (user_id, generation), lambda: executor.run_io(build_patient_context, user, self.entity_index)
+            )
+        except Exception:
+            return None
+        if context is not None and self._generation(user_id) == generation:
+            self._cache.set(user_id, context)
+        return context
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """
+        Drop one patient's bundle, or every bundle
+        """
+        with self._lock:
+            if user_id is None:
+                self._epoch += 1
+                self._generations.clear()
+            else:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.invalidate(user_id)
+
+    def on_users_change(self, payload: Dict[str, Any]) -> None:
+        """
+        Realtime callback for INSERT / UPDATE / DELETE on public.users
+        """
+        data = payload.get("data", payload)
+        for record in (data.get("record"), data.get("old_record")):
+            if record and record.get("id") is not None:
+                self.invalidate(str(record["id"]))
+
+    async def run(self, reconnect: float = PATIENT_CONTEXT_RECONNECT_SECONDS) -> None:
+        """
+        Follow changes to public.users over Supabase realtime, reconnecting when the feed drops
+        """
+        url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            return
+        from realtime import AsyncRealtimeClient
+
+        while True:
+            client = AsyncRealtimeClient(f"{url.rstrip('/')}/realtime/v1", token=key, auto_reconnect=False)
+            try:
+                channel = client.channel("patient-context")
+                channel.on_postgres_changes("*", schema="public", table="users", callback=self.on_users_change)
+                await channel.subscribe()
+                # Changes made while the feed was down were missed
+                self.invalidate()
+                while client.is_connected:
+                    await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            finally:
+                try:
+                    await client.close()
+                except Exception:
+                    pass
+            self.invalidate()
+            await asyncio.sleep(reconnect)
@@ -0,0 +1,180 @@
+"""
+Post-retrieval reranking and context compression.
+
+Retrieval over-fetches candidates, and this stage picks what goes into the
+prompt:
+
+    ranked = rerank(query, texts, scores)           # BM25 over the candidates + retrieval score
+    kept = drop_redundant(ranked)                   # chunks mostly repeating a better one
+    context = fit_budget(query, kept, budget)       # most relevant sentences, within the budget
+
+So the retrieved context has a fixed upper size, whatever the retrieval returned,
+and the tokens it saves are reported per answer.
+"""
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Set
+import os
+
+from chunking import count_tokens
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+# Candidates retrieved per context chunk kept
+RERANK_OVERFETCH = int(os.getenv("RERANK_OVERFETCH", "4"))
+# Weight of the lexical score against the retrieval score, both scaled to [0, 1]
+RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.5"))
+# A chunk whose words are mostly in a better-ranked chunk is dropped
+RERANK_REDUNDANCY_THRESHOLD = float(os.getenv("RERANK_REDUNDANCY_THRESHOLD", "0.8"))
+# Most tokens of retrieved context sent to the LLM per answer
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Smallest remainder of the budget worth filling with a trimmed chunk
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "32"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOP_WORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "should", "that", "the",
+    "this", "to", "was", "what", "when", "which", "who", "why", "with", "you", "your",
+})
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def terms(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def candidate_count(top_n: int) -> int:
+    """
+    How many candidates to retrieve for ``top_n`` context chunks
+    """
+    return top_n * RERANK_OVERFETCH if RERANK_ENABLED else top_n
+
+
+def _scaled(values: Sequence[float]) -> List[float]:
+    low, high = min(values), max(values)
+    if high == low:
+        return [1.0 if high > 0 else 0.0] * len(values)
+    return [(value - low) / (high - low) for value in values]
+
+
+def bm25_scores(query_terms: Sequence[str], documents: Sequence[Sequence[str]]) -> List[float]:
+    """
+    BM25 score of each document for the query, with statistics from the documents themselves
+    """
+    if not documents:
+        return []
+    average_length = sum(len(document) for document in documents) / len(documents) or 1.0
+    frequencies = [Counter(document) for document in documents]
+    scores = []
+    for document, frequency in zip(documents, frequencies):
+        score = 0.0
+        for term in set(query_terms):
+            if term not in frequency:
+                continue
+            containing = sum(1 for other in frequencies if term in other)
+            idf = math.log(1 + (len(documents) - containing + 0.5) / (containing + 0.5))
+            count = frequency[term]
+            score += idf * count * (BM25_K1 + 1) / (
+                count + BM25_K1 * (1 - BM25_B + BM25_B * len(document) / average_length)
+            )
+        scores.append(score)
+    return scores
+
+
+def rerank(query: str, texts: Sequence[str], scores: Sequence[Optional[float]]) -> List[int]:
+    """
+    Indices of the candidates, best first, by lexical and retrieval score
+    """
+    lexical = _scaled(bm25_scores(terms(query), [terms(text) for text in texts]))
+    retrieval = _scaled([score or 0.0 for score in scores])
+    combined = [
+        RERANK_LEXICAL_WEIGHT * lexical_score + (1 - RERANK_LEXICAL_WEIGHT) * retrieval_score
+        for lexical_score, retrieval_score in zip(lexical, retrieval)
+    ]
+    return sorted(range(len(texts)), key=lambda i: (-combined[i], i))
+
+
+def is_redundant(words: Set[str], kept: List[Set[str]], threshold: float = RERANK_REDUNDANCY_THRESHOLD) -> bool:
+    return bool(words) and any(len(words & other) / len(words) >= threshold for other in kept)
+
+
+def trim_sentences(query_terms: Set[str], text: str, max_tokens: int) -> str:
+    """
+    The text's sentences most relevant to the query that fit in ``max_tokens``, in their original order
+    """
+    sentences = split_sentences(text)
+    overlap = [len(query_terms & set(terms(sentence))) for sentence in sentences]
+    chosen, used = [], 0
+    for i in sorted(range(len(sentences)), key=lambda i: (-overlap[i], i)):
+        tokens = count_tokens(sentences[i])
+        if used + tokens <= max_tokens:
+            chosen.append(i)
+            used += tokens
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+@dataclass
+class Compression:
+    # Candidate indices kept, best first, and their (possibly trimmed) texts
+    indices: List[int]
+    texts: List[str]
+    # Tokens the top candidates would have used without this stage, and the tokens sent
+    baseline_tokens: int
+    context_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.baseline_tokens - self.context_tokens)
+
+
+def compress(
+    query: str,
+    texts: Sequence[str],
+    scores: Sequence[Optional[float]],
+    top_n: int,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> Compression:
+    """
+    Pick at most ``top_n`` of the retrieved candidates and fit them into ``budget`` tokens.
+
+    Candidates are reranked, those repeating a better one are dropped, and chunks
+    are kept whole while they fit; the chunk that would overflow the budget is cut
+    down to its most relevant sentences.
+    """
+    tokens = [count_tokens(text) for text in texts]
+    baseline = sum(tokens[:top_n])
+    query_terms = set(terms(query))
+
+    indices: List[int] = []
+    kept_texts: List[str] = []
+    kept_words: List[Set[str]] = []
+    remaining = budget
+    for i in rerank(query, texts, scores):
+        if len(indices) >= top_n or remaining <= 0 or remaining < CONTEXT_MIN_CHUNK_TOKENS:
+            break
+        words = set(terms(texts[i]))
+        if is_redundant(words, kept_words):
+            continue
+        text = texts[i] if tokens[i] <= remaining else trim_sentences(query_terms, texts[i], remaining)
+        if not text:
+            continue
+        cost = tokens[i] if text is texts[i] else count_tokens(text)
+        # Joined sentences can count a token or two more than their parts
+        if cost > remaining:
+            continue
+        indices.append(i)
+        kept_texts.append(text)
+        kept_words.append(words)
+        remaining -= cost
+
+    return Compression(indices, kept_texts, baseline, budget - remaining)
@@ -0,0 +1,77 @@
+import os
+from typing import Any, Dict, List, Optional
+
+# Retrieval settings
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+# Full-text + vector search merged by reciprocal rank fusion
+RAG_HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "true").lower() == "true"
+RAG_FULL_TEXT_WEIGHT = float(os.getenv("RAG_FULL_TEXT_WEIGHT", "1.0"))
+RAG_SEMANTIC_WEIGHT = float(os.getenv("RAG_SEMANTIC_WEIGHT", "1.0"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "50"))
+
+
+def _search_params(top_k: int, category: Optional[str], tags: Optional[List[str]]) -> Dict[str, Any]:
+    return {"match_count": top_k, "filter_category": category, "filter_tags": tags or None}
+
+
+def _fusion_params() -> Dict[str, Any]:
+    return {"full_text_weight": RAG_FULL_TEXT_WEIGHT, "semantic_weight": RAG_SEMANTIC_WEIGHT, "rrf_k": RAG_RRF_K}
+
+
+def search_rag_documents(
+    client: Any,
+    query_embedding: List[float],
+    top_k: int = RAG_TOP_K,
+    category: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    query_text: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Top-k search over rag_documents, executed in Postgres in one round trip.
+
+    With ``query_text`` (and hybrid search enabled) full-text and pgvector rankings
+    are fused; otherwise it is a pure similarity search.
+    """
+    params = {"query_embedding": query_embedding, **_search_params(top_k, category, tags)}
+    if query_text and RAG_HYBRID_SEARCH:
+        response = client.rpc("hybrid_search_rag_documents", {
+            "query_text": query_text,
+            **params,
+            **_fusion_params(),
+        }).execute()
+    else:
+        response = client.rpc("match_rag_documents", params).execute()
+    return response.data or []
+
+
+def search_rag_documents_batch(
+    client: Any,
+    query_embeddings: List[List[float]],
+    query_texts: List[str],
+    top_k: int = RAG_TOP_K,
+    category: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Hybrid search for several queries over the same filters, in one round trip.
+
+    Returns the rows for each query, in query order.
+    """
+    if not query_texts:
+        return []
+    if not RAG_HYBRID_SEARCH:
+        return [
+            search_rag_documents(client, embedding, top_k, category, tags)
+            for embedding in query_embeddings
+        ]
+    response = client.rpc("hybrid_search_rag_documents_batch", {
+        "query_texts": query_texts,
+        "query_embeddings": query_embeddings,
+        **_search_params(top_k, category, tags),
+        **_fusion_params(),
+    }).execute()
+    results: List[List[Dict[str, Any]]] = [[] for _ in query_texts]
+    for row in response.data or []:
+        row = dict(row)
+        results[row.pop("query_index")].append(row)
+    return results
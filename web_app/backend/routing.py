@@ -0,0 +1,94 @@
+"""
+Query-complexity routing between a fast and a large LLM.
+
+Each question is classified with cheap heuristics before the LLM call: short,
+single questions whose context covers their terms (or that are answered from
+the reference tables) go to LLM_FAST_MODEL, everything else to LLM_MODEL. An
+answer from the fast model that hedges or comes back empty is redone by the
+large model. The rules are plain settings, so routing can be tuned without a
+code change.
+"""
+from dataclasses import dataclass
+from typing import Sequence
+import os
+
+from clients import LLM_MODEL
+from rerank import terms
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "gpt-4o-mini")
+# Longer questions go to the large model
+ROUTER_MAX_SIMPLE_WORDS = int(os.getenv("ROUTER_MAX_SIMPLE_WORDS", "20"))
+# Fraction of the question's terms the retrieved context must contain for the fast model
+ROUTER_MIN_TERM_COVERAGE = float(os.getenv("ROUTER_MIN_TERM_COVERAGE", "0.6"))
+# Phrases (comma separated, matched in the lower-cased question) that call for reasoning
+ROUTER_COMPLEX_MARKERS = [marker.strip() for marker in os.getenv(
+    "ROUTER_COMPLEX_MARKERS",
+    "why,compare,comparison,versus, vs ,difference between,interact,contraindicat,"
+    "pregnan,instead of,should i,is it safe,risk of,what if,explain how"
+).lower().split(",") if marker.strip()]
+# Phrases in a fast-model answer that trigger the large-model fallback
+ROUTER_LOW_CONFIDENCE_PHRASES = [phrase.strip() for phrase in os.getenv(
+    "ROUTER_LOW_CONFIDENCE_PHRASES",
+    "i don't know,i do not know,not sure,i'm unable,i am unable,cannot determine,can't determine,"
+    "cannot answer,can't answer,does not provide,doesn't provide,does not contain,doesn't contain,"
+    "does not mention,doesn't mention,no information,not enough information,unclear from"
+).lower().split(",") if phrase.strip()]
+# Characters of a streamed fast-model answer checked before any of it is sent
+ROUTER_PROBE_CHARS = int(os.getenv("ROUTER_PROBE_CHARS", "200"))
+
+
+@dataclass
+class Route:
+    model: str
+    # "fast" or "large", and the rule that decided it
+    tier: str
+    reason: str
+
+    @property
+    def can_fall_back(self) -> bool:
+        return self.model != LLM_MODEL
+
+
+def term_coverage(query: str, contexts: Sequence[str]) -> float:
+    """
+    Fraction of the question's terms that appear in the context
+    """
+    query_terms = set(terms(query))
+    if not query_terms:
+        return 1.0
+    context_terms = set()
+    for context in contexts:
+        context_terms.update(terms(context))
+    return len(query_terms & context_terms) / len(query_terms)
+
+
+def route_query(query: str, contexts: Sequence[str], grounded: bool = False) -> Route:
+    """
+    Pick the model for a question and its context.
+
+    ``grounded`` marks context taken from the reference tables for exactly the
+    entities asked about, which the fast model can always answer from.
+    """
+    if not ROUTER_ENABLED:
+        return Route(LLM_MODEL, "large", "disabled")
+    lowered = f" {query.lower()} "
+    if any(marker in lowered for marker in ROUTER_COMPLEX_MARKERS):
+        return Route(LLM_MODEL, "large", "complex_marker")
+    if len(query.split()) > ROUTER_MAX_SIMPLE_WORDS:
+        return Route(LLM_MODEL, "large", "long_query")
+    if query.count("?") > 1:
+        return Route(LLM_MODEL, "large", "multiple_questions")
+    if grounded:
+        return Route(LLM_FAST_MODEL, "fast", "grounded")
+    if term_coverage(query, contexts) < ROUTER_MIN_TERM_COVERAGE:
+        return Route(LLM_MODEL, "large", "weak_grounding")
+    return Route(LLM_FAST_MODEL, "fast", "covered")
+
+
+def is_low_confidence(answer: str) -> bool:
+    """
+    True for an empty answer or one that says the context was not enough
+    """
+    text = answer.strip().lower().replace("’", "'")
+    return not text or any(phrase in text for phrase in ROUTER_LOW_CONFIDENCE_PHRASES)
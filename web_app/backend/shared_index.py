@@ -0,0 +1,56 @@
+"""
+llama_index view over the shared memory-mapped vector store.
+
+A ``VectorStoreIndex`` built on ``SharedVectorStoreView`` retrieves from the
+pages' rows in the mapped files, so building an index per request copies
+nothing and holds no vectors of its own.
+"""
+from typing import Any, List, Sequence, Tuple
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, TextNode
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryResult
+
+from vectorstore import MmapVectorStore
+
+
+class SharedVectorStoreView(BasePydanticVectorStore):
+    """
+    Read-only vector store over the given (key, version) documents of a MmapVectorStore
+    """
+
+    stores_text: bool = True
+    _store: MmapVectorStore = PrivateAttr()
+    _documents: List[Tuple[str, str]] = PrivateAttr()
+
+    def __init__(self, store: MmapVectorStore, documents: Sequence[Tuple[str, str]], **kwargs: Any):
+        super().__init__(**kwargs)
+        self._store = store
+        self._documents = list(documents)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SharedVectorStoreView"
+
+    @property
+    def client(self) -> MmapVectorStore:
+        return self._store
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[str]:
+        raise NotImplementedError("Documents are written with MmapVectorStore.put")
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        raise NotImplementedError("Documents are removed with MmapVectorStore.delete")
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        matches = self._store.search(self._documents, query.query_embedding, query.similarity_top_k)
+        nodes, similarities, ids = [], [], []
+        texts = {}
+        for segment, index, score in matches:
+            if segment.key not in texts:
+                texts[segment.key] = self._store.texts(segment)
+            node_id = f"{segment.key}#{segment.version}:{index}"
+            nodes.append(TextNode(id_=node_id, text=texts[segment.key][index], metadata=dict(segment.metadata)))
+            similarities.append(score)
+            ids.append(node_id)
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
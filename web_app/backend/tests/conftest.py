@@ -8,8 +8,12 @@ from unittest.mock import patch, MagicMock
 # Import your application
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app import app, SECRET_KEY, ALGORITHM
-from agent import RAGAgent, supabase_client
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+os.environ.setdefault("PATIENT_CONTEXT_REALTIME", "false")
+from app import app, SECRET_KEY, ALGORITHM, user_cache
+from agent import RAGAgent, semantic_cache, entity_index, patient_contexts
+from cache import CachedDocument
+from entities import EntityMatcher
 
 @pytest.fixture
 def test_client():
@@ -24,7 +28,8 @@ def mock_supabase():
     """
     Mock the Supabase client for testing
     """
-    with patch('agent.supabase_client') as mock:
+    with patch('clients._supabase_client', new=MagicMock()) as mock:
+        user_cache.clear()
         yield mock
 
 @pytest.fixture
@@ -32,18 +37,32 @@ def mock_llama_index():
     """
     Mock LlamaIndex components for testing
     """
-    with patch('agent.VectorStoreIndex') as mock_index, \
-         patch('agent.SimpleWebPageReader') as mock_reader:
+    with patch('llama_index.core.VectorStoreIndex') as mock_index, \
+         patch('agent._load_documents') as mock_loader, \
+         patch('llama_index.core.get_response_synthesizer') as mock_synthesizer, \
+         patch('agent.get_embed_model') as mock_embed_model, \
+         patch('agent.get_database_embed_model') as mock_database_embed_model, \
+         patch.object(entity_index, '_matcher', EntityMatcher([])):
         
         # Configure the mocks
-        mock_query_engine = MagicMock()
-        mock_query_engine.query.return_value = "This is a test response"
+        mock_index.from_vector_store.return_value.as_retriever.return_value.retrieve.return_value = []
+        mock_synthesizer.return_value.synthesize.return_value = "This is a test response"
+        mock_embed_model.return_value.get_query_embedding.return_value = [0.1, 0.2]
+        mock_database_embed_model.return_value = mock_embed_model.return_value
+        semantic_cache.invalidate()
+        patient_contexts.invalidate()
         
-        mock_index.from_documents.return_value.as_query_engine.return_value = mock_query_engine
+        mock_loader.side_effect = lambda urls: ([
+            CachedDocument(
+                url=url,
+                content_hash="hash",
+                text="Document",
+                chunks=[{"text": "Document 1", "embedding": [0.1, 0.2]}]
+            )
+            for url in urls
+        ], {})
         
-        mock_reader.return_value.load_data.return_value = ["Document 1", "Document 2"]
-        
-        yield mock_index, mock_reader
+        yield mock_index, mock_loader
 
 @pytest.fixture
 def test_user():
@@ -6,6 +6,9 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from agent import RAGAgent
+from clients import LLM_MODEL
+from rerank import candidate_count
+from routing import LLM_FAST_MODEL
 
 @pytest.mark.asyncio
 async def test_browser_rag(mock_llama_index):
@@ -24,9 +27,9 @@ async def test_browser_rag(mock_llama_index):
     assert result["source_urls"] == urls
     
     # Verify the mocks were called correctly
-    mock_index, mock_reader = mock_llama_index
-    mock_reader.return_value.load_data.assert_called_once_with(urls)
-    mock_index.from_documents.assert_called_once()
+    mock_index, mock_loader = mock_llama_index
+    mock_loader.assert_called_once_with(urls)
+    mock_index.from_vector_store.assert_called_once()
 
 @pytest.mark.asyncio
 async def test_database_rag_with_documents(mock_llama_index, mock_supabase):
@@ -38,12 +41,12 @@ async def test_database_rag_with_documents(mock_llama_index, mock_supabase):
     
     # Mock Supabase response with documents
     mock_docs = [
-        {"title": "Doc 1", "content": "Content 1"},
-        {"title": "Doc 2", "content": "Content 2"}
+        {"title": "Doc 1", "content": "Content 1", "similarity": 0.9},
+        {"title": "Doc 2", "content": "Content 2", "similarity": 0.8}
     ]
     mock_response = MagicMock()
     mock_response.data = mock_docs
-    mock_supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.return_value = mock_response
+    mock_supabase.rpc.return_value.execute.return_value = mock_response
     
     # Call the function
     result = await RAGAgent.database_rag(query, user_id, collection_name)
@@ -54,13 +57,18 @@ async def test_database_rag_with_documents(mock_llama_index, mock_supabase):
     assert result["response"] == "This is a test response"
     assert result["sources"] == ["Doc 1", "Doc 2"]
     
-    # Verify the mocks were called correctly
+    # Verify only the query was embedded and the search ran in the database
     mock_index, _ = mock_llama_index
-    mock_supabase.table.assert_called_with("documents")
-    mock_index.from_documents.assert_called_once()
+    mock_supabase.rpc.assert_called_once()
+    function_name, params = mock_supabase.rpc.call_args.args
+    assert function_name == "hybrid_search_rag_documents"
+    assert params["query_text"] == query
+    assert params["query_embedding"] == [0.1, 0.2]
+    assert params["filter_category"] == collection_name
+    mock_index.from_documents.assert_not_called()
 
 @pytest.mark.asyncio
-async def test_database_rag_no_documents(mock_supabase):
+async def test_database_rag_no_documents(mock_llama_index, mock_supabase):
     """Test database RAG with no documents"""
     # Test data
     query = "What is in my documents?"
@@ -70,7 +78,7 @@ async def test_database_rag_no_documents(mock_supabase):
     # Mock empty Supabase response
     mock_response = MagicMock()
     mock_response.data = []
-    mock_supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.return_value = mock_response
+    mock_supabase.rpc.return_value.execute.return_value = mock_response
     
     # Call the function
     result = await RAGAgent.database_rag(query, user_id, collection_name)
@@ -79,4 +87,134 @@ async def test_database_rag_no_documents(mock_supabase):
     assert "response" in result
     assert "sources" in result
     assert "No documents found" in result["response"]
-    assert result["sources"] == []
\ No newline at end of file
+    assert result["sources"] == []
+
+@pytest.mark.asyncio
+async def test_database_rag_metadata_filters(mock_llama_index, mock_supabase):
+    """Test that category and tag filters are passed to the similarity search, which over-fetches for reranking"""
+    mock_response = MagicMock()
+    mock_response.data = [{"title": "Doc 1", "content": "Content 1", "similarity": 0.9}]
+    mock_supabase.rpc.return_value.execute.return_value = mock_response
+    
+    await RAGAgent.database_rag("Side effects?", "test-user-id", category="cardiology", tags=["statins"], top_k=3)
+    
+    _, params = mock_supabase.rpc.call_args.args
+    assert params["match_count"] == candidate_count(3)
+    assert params["filter_category"] == "cardiology"
+    assert params["filter_tags"] == ["statins"]
+
+@pytest.mark.asyncio
+async def test_browser_rag_stream(mock_llama_index):
+    """Test that browser RAG streams tokens before the sources event"""
+    mock_index, _ = mock_llama_index
+    
+    urls = ["https://example.com/france"]
+    with patch('llama_index.core.get_response_synthesizer') as mock_synthesizer:
+        mock_synthesizer.return_value.synthesize.return_value = MagicMock(response_gen=iter(["Paris ", "is ", "the capital."]))
+        events = [event async for event in RAGAgent.browser_rag_stream("What is the capital of France?", urls)]
+    
+    assert events == [
+        ("token", "Paris "),
+        ("token", "is "),
+        ("token", "the capital."),
+        ("sources", {"source_urls": urls, "model": LLM_MODEL}),
+    ]
+    mock_index.from_vector_store.return_value.as_retriever.return_value.retrieve.assert_called_once()
+    mock_synthesizer.assert_called_once()
+    assert mock_synthesizer.call_args.kwargs["streaming"] is True
+
+@pytest.mark.asyncio
+async def test_database_rag_stream(mock_llama_index, mock_supabase):
+    """Test that database RAG streams tokens from the response synthesizer"""
+    mock_response = MagicMock()
+    mock_response.data = [{"title": "Doc 1", "content": "Content 1", "similarity": 0.9}]
+    mock_supabase.rpc.return_value.execute.return_value = mock_response
+    
+    with patch('llama_index.core.get_response_synthesizer') as mock_synthesizer:
+        mock_synthesizer.return_value.synthesize.return_value.response_gen = iter(["Hello", " world"])
+        events = [event async for event in RAGAgent.database_rag_stream("Hi?", "test-user-id")]
+    
+    assert events == [("token", "Hello"), ("token", " world"), ("sources", {"sources": ["Doc 1"], "model": LLM_MODEL})]
+    mock_synthesizer.assert_called_once()
+    assert mock_synthesizer.call_args.kwargs["streaming"] is True
+
+
+@pytest.mark.asyncio
+async def test_database_rag_semantic_cache_hit(mock_llama_index, mock_supabase):
+    """Test that a repeated question is answered without retrieval or the LLM"""
+    mock_response = MagicMock()
+    mock_response.data = [{"id": 1, "title": "Doc 1", "content": "Content 1", "similarity": 0.9}]
+    mock_supabase.rpc.return_value.execute.return_value = mock_response
+    
+    with patch('llama_index.core.get_response_synthesizer') as mock_synthesizer:
+        mock_synthesizer.return_value.synthesize.return_value = "Cached answer"
+        first = await RAGAgent.database_rag("What is asthma?", "test-user-id", "respiratory")
+        second = await RAGAgent.database_rag("What is asthma?", "test-user-id", "respiratory")
+    
+    assert first == second == {"response": "Cached answer", "sources": ["Doc 1"], "model": LLM_MODEL}
+    mock_supabase.rpc.assert_called_once()
+    mock_synthesizer.return_value.synthesize.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_concurrent_browser_rag_is_coalesced(mock_llama_index):
+    """Test that identical concurrent browser RAG requests load and index the pages once"""
+    import asyncio
+    mock_index, mock_loader = mock_llama_index
+    urls = ["https://example.com/b", "https://example.com/a"]
+    
+    results = await asyncio.gather(
+        RAGAgent.browser_rag("What is this?", urls),
+        RAGAgent.browser_rag("What is this?", list(reversed(urls))),
+        RAGAgent.browser_rag("Something else?", urls),
+    )
+    
+    assert all(result["response"] == "This is a test response" for result in results)
+    mock_loader.assert_called_once()
+    mock_index.from_vector_store.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_browser_rag_batch_shares_one_index(mock_llama_index):
+    """Test that a batch of questions about the same pages loads, indexes and embeds once"""
+    import agent
+    mock_index, mock_loader = mock_llama_index
+    embed = agent.get_embed_model.return_value.get_text_embedding_batch
+    embed.side_effect = lambda texts: [[1.0 if i == j else 0.0 for j in range(3)] for i in range(len(texts))]
+    queries = ["What is it?", "What is this?", "What is that?"]
+    
+    with patch('llama_index.core.get_response_synthesizer') as mock_synthesizer:
+        mock_synthesizer.return_value.synthesize.side_effect = lambda query, nodes: f"Answer to {query}"
+        result = await RAGAgent.browser_rag_batch(queries, ["https://example.com"])
+    
+    assert result["results"] == [{"query": q, "response": f"Answer to {q}", "model": LLM_FAST_MODEL} for q in queries]
+    assert result["source_urls"] == ["https://example.com"]
+    mock_loader.assert_called_once()
+    mock_index.from_vector_store.assert_called_once()
+    embed.assert_called_once_with(queries)
+
+@pytest.mark.asyncio
+async def test_database_rag_batch_is_one_search(mock_llama_index, mock_supabase):
+    """Test that a batch of database questions runs one search and keeps per-question errors"""
+    import agent
+    agent.get_embed_model.return_value.get_text_embedding_batch.return_value = [[1.0, 0.0], [0.0, 1.0]]
+    mock_supabase.rpc.return_value.execute.return_value.data = [
+        {"query_index": 1, "id": 2, "title": "Doc B", "content": "Content B", "similarity": 0.8},
+        {"query_index": 0, "id": 1, "title": "Doc A", "content": "Content A", "similarity": 0.9},
+    ]
+    
+    def synthesize(query, nodes):
+        if query == "Second?":
+            raise RuntimeError("LLM unavailable")
+        return "First answer"
+    
+    with patch('llama_index.core.get_response_synthesizer') as mock_synthesizer:
+        mock_synthesizer.return_value.synthesize.side_effect = synthesize
+        result = await RAGAgent.database_rag_batch(["First?", "Second?"], "test-user-id", "respiratory")
+    
+    assert result["results"] == [
+        {"query": "First?", "response": "First answer", "sources": ["Doc A"], "model": LLM_MODEL},
+        {"query": "Second?", "error": "LLM unavailable"},
+    ]
+    mock_supabase.rpc.assert_called_once()
+    function_name, params = mock_supabase.rpc.call_args.args
+    assert function_name == "hybrid_search_rag_documents_batch"
+    assert params["query_texts"] == ["First?", "Second?"]
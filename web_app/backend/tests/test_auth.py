@@ -6,7 +6,8 @@ from unittest.mock import patch, MagicMock
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app import verify_password, get_password_hash, create_access_token, get_current_user
+import jwt
+from app import verify_password, get_password_hash, create_access_token, get_current_user, SECRET_KEY, ALGORITHM, user_claims, invalidate_user
 
 def test_verify_password():
     """Test password verification"""
@@ -77,4 +78,39 @@ async def test_get_current_user_user_not_found(test_token, mock_supabase):
         await get_current_user(test_token)
     
     assert excinfo.value.status_code == 401
-    assert "Could not validate credentials" in excinfo.value.detail
\ No newline at end of file
+    assert "Could not validate credentials" in excinfo.value.detail
+
+@pytest.mark.asyncio
+async def test_get_current_user_from_token_claims(mock_supabase, test_user):
+    """Test that tokens carrying profile claims skip the database"""
+    token = create_access_token(user_claims(test_user))
+    
+    user = await get_current_user(token)
+    
+    assert user == {"id": test_user["id"], "username": test_user["username"], "email": test_user["email"]}
+    mock_supabase.table.assert_not_called()
+
+def test_user_claims_exclude_password(test_user):
+    """Test that the password hash never ends up in a token"""
+    token = create_access_token(user_claims(test_user))
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    
+    assert payload["sub"] == test_user["username"]
+    assert payload["uid"] == test_user["id"]
+    assert "hashed_password" not in payload
+
+@pytest.mark.asyncio
+async def test_get_current_user_caches_lookup(test_token, mock_supabase, test_user):
+    """Test that repeated lookups are served from the user cache until invalidated"""
+    mock_response = MagicMock()
+    mock_response.data = [test_user]
+    mock_execute = mock_supabase.table.return_value.select.return_value.eq.return_value.execute
+    mock_execute.return_value = mock_response
+    
+    await get_current_user(test_token)
+    await get_current_user(test_token)
+    assert mock_execute.call_count == 1
+    
+    invalidate_user(test_user["username"])
+    await get_current_user(test_token)
+    assert mock_execute.call_count == 2
@@ -0,0 +1,37 @@
+import pytest
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.run import main, percentile
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    values = [float(i) for i in range(1, 101)]
+    
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 50) == 0.0
+
+def test_benchmark_smoke(capsys):
+    """Test that the offline benchmark runs end to end against the fakes"""
+    exit_code = main([
+        "--scenarios", "me", "browser-rag", "database-rag",
+        "--requests", "4",
+        "--concurrency", "2",
+        "--llm-latency", "0",
+        "--fast-llm-latency", "0",
+        "--embed-latency", "0",
+        "--db-latency", "0",
+        "--pages", "2",
+        "--urls-per-request", "2",
+        "--documents", "20",
+        "--json",
+    ])
+    
+    output = capsys.readouterr().out
+    assert exit_code == 0
+    assert '"scenario": "browser-rag"' in output
+    assert '"errors": 0' in output
@@ -0,0 +1,150 @@
+import json
+import pytest
+from unittest.mock import patch
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent import on_documents_written, semantic_cache
+from app import create_access_token, user_claims
+from benchmarks.fakes import FakeEmbedding, FakeSupabase
+from bulk_import import BulkImporter, EmbeddingQueue, iter_lines, parse
+
+async def chunked(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+def ndjson(*rows):
+    return "".join((row if isinstance(row, str) else json.dumps(row)) + "\n" for row in rows).encode("utf-8")
+
+@pytest.fixture
+def fake_db():
+    db = FakeSupabase()
+    with patch('clients._supabase_client', new=db):
+        yield db
+
+@pytest.mark.asyncio
+async def test_iter_lines_decodes_across_chunks():
+    """Test that multi-byte characters and CRLF endings split across chunks decode intact"""
+    data = "﻿café\r\nnaïve\nlast".encode("utf-8")
+
+    lines = [line async for line in iter_lines(chunked(data, 3))]
+
+    assert lines == ["café", "naïve", "last"]
+
+@pytest.mark.asyncio
+async def test_csv_records_span_quoted_line_breaks():
+    """Test that quoted fields keep their line breaks and escaped quotes"""
+    data = b'Title,Content,Tags\nAsthma,"Use your inhaler.\nSee a ""doctor""",lungs\nBad,row\n'
+
+    records = [record async for record in parse("csv", chunked(data))]
+
+    assert records == [
+        (2, {"title": "Asthma", "content": 'Use your inhaler.\nSee a "doctor"', "tags": "lungs"}, None),
+        (4, None, "Expected 3 fields, found 2"),
+    ]
+
+@pytest.mark.asyncio
+async def test_import_validates_dedupes_and_batches(fake_db):
+    """Test that rows are validated, duplicates skipped in and across batches, and inserted in batches"""
+    fake_db.add_row("rag_documents", {"title": "Old", "content": "Stored text", "url": "https://a.example/old"})
+    data = ndjson(
+        {"title": "Statins", "content": "Atorvastatin lowers cholesterol.", "url": "https://a.example/1", "tags": ["heart"]},
+        {"title": "Statins again", "content": "Different text", "url": "https://a.example/1"},
+        "{not json",
+        {"title": "No content"},
+        {"title": "Copy", "content": "Stored text"},
+        {"title": "Old page", "content": "New text", "url": "https://a.example/old"},
+        {"title": "Asthma", "content": "Inhalers open the airways.", "publication_date": "2024-05-01"},
+    )
+    importer = BulkImporter(batch_size=2)
+
+    with patch.object(fake_db, 'rpc', wraps=fake_db.rpc) as rpc:
+        progress = await importer.run(chunked(data), "ndjson", "admin-id")
+
+    assert progress.status == "succeeded"
+    assert (progress.rows, progress.inserted, progress.duplicates, progress.invalid) == (7, 2, 3, 2)
+    assert [error["line"] for error in progress.errors] == [3, 4]
+    assert progress.errors[1]["detail"][0]["loc"] == ["content"]
+    assert rpc.call_count == progress.batches == 2
+    imported = fake_db.tables["rag_documents"][1:]
+    assert [row["title"] for row in imported] == ["Statins", "Asthma"]
+    assert imported[0]["source_type"] == "import" and imported[0]["tags"] == ["heart"]
+    assert imported[1]["publication_date"] == "2024-05-01"
+    assert importer.get(progress.id) is progress
+    assert fake_db.tables["rag_imports"][0] == {**progress.view(), "user_id": "admin-id"}
+
+@pytest.mark.asyncio
+async def test_malformed_upload_fails_after_inserted_batches(fake_db):
+    """Test that an unparseable upload stops the import and keeps the rows already inserted"""
+    data = b'title,content\nOne,First\nTwo,"never closed\n'
+    embeddings = EmbeddingQueue()
+    importer = BulkImporter(batch_size=1, embeddings=embeddings)
+
+    with patch.object(embeddings, 'request') as request:
+        progress = await importer.run(chunked(data), "csv", "admin-id")
+
+    assert progress.status == "failed"
+    assert progress.error == "Unterminated quoted field starting on line 3"
+    assert progress.inserted == 1
+    request.assert_called_once()
+    assert (await BulkImporter().run(chunked(b"name,text\n"), "csv", "admin-id")).error == "CSV header is missing content, title"
+
+@pytest.mark.asyncio
+async def test_embedding_imported_rows_drops_database_answers(fake_db):
+    """Test that embedding freshly imported rows drops cached database answers but not browser ones"""
+    database_scope = ("collection", "rag_documents", (), 5)
+    browser_scope = ("urls", "https://example.com")
+    semantic_cache.store(database_scope, [1.0, 0.0], {"response": "Nothing on asthma."})
+    semantic_cache.store(browser_scope, [1.0, 0.0], {"response": "From the page."})
+    queue = EmbeddingQueue(on_written=on_documents_written)
+    importer = BulkImporter(embeddings=queue)
+
+    with patch('clients.get_database_embed_model', return_value=FakeEmbedding()):
+        await importer.run(chunked(ndjson({"title": "Asthma", "content": "Inhalers open the airways."})), "ndjson", "admin-id")
+        await queue._task
+
+    assert fake_db.tables["rag_documents"][0]["embedding"] is not None
+    assert semantic_cache.lookup(database_scope, [1.0, 0.0]) is None
+    assert semantic_cache.lookup(browser_scope, [1.0, 0.0]) == {"response": "From the page."}
+    semantic_cache.invalidate()
+
+def test_import_endpoint_requires_admin(test_client, test_user, fake_db):
+    """Test that only admins can import, and an admin's NDJSON upload is imported"""
+    headers = {
+        "Authorization": f"Bearer {create_access_token(user_claims(test_user))}",
+        "Content-Type": "application/x-ndjson",
+    }
+    body = ndjson({"title": "Asthma", "content": "Inhalers open the airways."})
+
+    forbidden = test_client.post("/admin/rag-documents/import", content=body, headers=headers)
+    fake_db.add_row("user_roles", {"user_id": test_user["id"], "role": "admin"})
+    with patch('app.bulk_importer.embeddings') as embeddings:
+        response = test_client.post("/admin/rag-documents/import", content=body, headers=headers)
+        unsupported = test_client.post("/admin/rag-documents/import", content=body, headers={**headers, "Content-Type": "text/plain"})
+    listed = test_client.get("/admin/rag-documents/imports", headers=headers)
+
+    assert forbidden.status_code == 403
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 1 and response.json()["embeddings"] == "queued"
+    embeddings.request.assert_called_once()
+    assert unsupported.status_code == 415
+    assert listed.json()["imports"][0]["id"] == response.json()["id"]
+    assert fake_db.tables["rag_documents"][0]["embedding"] is None
+
+def test_import_from_another_worker(test_client, test_user, fake_db):
+    """Test that an import stored by another worker is listed and can be polled"""
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+    fake_db.add_row("user_roles", {"user_id": test_user["id"], "role": "admin"})
+    fake_db.add_row("rag_imports", {
+        "id": "import-elsewhere", "user_id": test_user["id"], "format": "csv", "status": "running",
+        "rows": 1000, "inserted": 500, "started_at": "2026-10-18T09:00:00+00:00",
+    })
+
+    listed = test_client.get("/admin/rag-documents/imports", headers=headers)
+    polled = test_client.get("/admin/rag-documents/imports/import-elsewhere", headers=headers)
+
+    assert "import-elsewhere" in [view["id"] for view in listed.json()["imports"]]
+    assert polled.json()["inserted"] == 500
+    assert test_client.get("/admin/rag-documents/imports/unknown", headers=headers).status_code == 404
@@ -0,0 +1,98 @@
+import pytest
+from unittest.mock import patch
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import TTLCache, DocumentCache, CachedDocument, SemanticCache, content_hash
+
+def test_ttl_cache_lru_eviction():
+    """Test that the least recently used entry is evicted first"""
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    
+    # Touch "a" so "b" becomes the eviction candidate
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_ttl_cache_expiry():
+    """Test that expired entries are not returned"""
+    cache = TTLCache(maxsize=10, ttl=60)
+    
+    with patch('cache.time.monotonic', return_value=1000.0):
+        cache.set("key", "value")
+    with patch('cache.time.monotonic', return_value=1030.0):
+        assert cache.get("key") == "value"
+    with patch('cache.time.monotonic', return_value=1061.0):
+        assert cache.get("key") is None
+
+def test_document_cache_persists_to_disk(tmp_path):
+    """Test that cached documents survive a new cache instance"""
+    document = CachedDocument(
+        url="https://example.com/page",
+        content_hash=content_hash("Page text"),
+        text="Page text",
+        chunks=[{"text": "Page text", "embedding": [0.1, 0.2, 0.3]}],
+        etag='"abc"'
+    )
+    DocumentCache(directory=str(tmp_path)).put(document)
+    
+    # A fresh instance has an empty memory layer and must read from disk
+    loaded = DocumentCache(directory=str(tmp_path)).get(document.url)
+    
+    assert loaded == document
+
+def test_document_cache_freshness(tmp_path):
+    """Test that entries older than the TTL need revalidation"""
+    cache = DocumentCache(directory=str(tmp_path), ttl=60)
+    document = CachedDocument(url="https://example.com", content_hash="hash", text="text")
+    cache.put(document)
+    
+    assert cache.is_fresh(document) is True
+    
+    document.fetched_at -= 120
+    assert cache.is_fresh(document) is False
+
+def test_document_cache_disk_limit(tmp_path):
+    """Test that the on-disk cache is bounded"""
+    cache = DocumentCache(directory=str(tmp_path), max_disk_entries=2)
+    for i in range(4):
+        cache.put(CachedDocument(url=f"https://example.com/{i}", content_hash="hash", text="text"))
+    
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_semantic_cache_hits_similar_queries():
+    """Test that a near-identical query in the same scope is a hit"""
+    cache = SemanticCache(threshold=0.9)
+    cache.store("scope", [1.0, 0.0], {"response": "cached"})
+    
+    assert cache.lookup("scope", [0.99, 0.05]) == {"response": "cached"}
+    assert cache.lookup("scope", [0.0, 1.0]) is None
+    assert cache.lookup("other-scope", [1.0, 0.0]) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 1}
+
+def test_semantic_cache_version_change_invalidates():
+    """Test that answers built from older source content are not served"""
+    cache = SemanticCache(threshold=0.9)
+    cache.store("scope", [1.0, 0.0], {"response": "old"}, version="v1")
+    
+    assert cache.lookup("scope", [1.0, 0.0], version="v2") is None
+    assert cache.lookup("scope", [1.0, 0.0], version="v1") is None
+
+def test_semantic_cache_expiry_and_lru():
+    """Test TTL expiry and per-scope entry limits"""
+    cache = SemanticCache(threshold=0.9, ttl=60, max_entries=1)
+    with patch('cache.time.monotonic', return_value=1000.0):
+        cache.store("scope", [1.0, 0.0], {"response": "a"})
+        cache.store("scope", [0.0, 1.0], {"response": "b"})
+        assert cache.lookup("scope", [1.0, 0.0]) is None
+        assert cache.lookup("scope", [0.0, 1.0]) == {"response": "b"}
+    with patch('cache.time.monotonic', return_value=1061.0):
+        assert cache.lookup("scope", [0.0, 1.0]) is None
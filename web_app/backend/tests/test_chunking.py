@@ -0,0 +1,117 @@
+import pytest
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chunking import (
+    DuplicateFilter,
+    TokenBudget,
+    chunk_text,
+    count_tokens,
+    dedupe_chunks,
+    iter_chunks,
+    iter_text_blocks,
+    limit_tokens,
+)
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Statins</title><script>var tracking = "pixel";</script></head>
+<body>
+  <nav><a href="/">Home</a> <a href="/drugs">Drugs</a></nav>
+  <main>
+    <h1>Statins</h1>
+    <p>Statins lower cholesterol &amp; reduce the risk of heart attack.</p>
+    <p>Common side effects include muscle pain.</p>
+  </main>
+  <footer>Copyright 2026. Cookie settings.</footer>
+</body></html>"""
+
+def paragraphs(count):
+    return [f"Paragraph {i} covers topic number {i} with several distinct words of its own." for i in range(count)]
+
+def test_text_blocks_strip_boilerplate():
+    """Test that markup, scripts, navigation and footers are dropped"""
+    blocks = list(iter_text_blocks(PAGE))
+
+    assert blocks == [
+        "Statins",
+        "Statins lower cholesterol & reduce the risk of heart attack.",
+        "Common side effects include muscle pain.",
+    ]
+
+def test_text_blocks_parse_incrementally():
+    """Test that small feeds yield the same blocks as one large feed"""
+    assert list(iter_text_blocks(PAGE, feed_size=7)) == list(iter_text_blocks(PAGE))
+
+def test_plain_text_splits_on_blank_lines():
+    """Test that plain text is split into paragraphs"""
+    assert list(iter_text_blocks("First  paragraph.\n\nSecond\nparagraph.")) == ["First paragraph.", "Second paragraph."]
+
+def test_chunks_fit_token_limit_and_overlap():
+    """Test that chunks stay within the limit and share their edges"""
+    chunks = list(iter_chunks(paragraphs(40), chunk_tokens=60, overlap_tokens=20))
+
+    assert len(chunks) > 1
+    for text, tokens in chunks:
+        assert tokens <= 60
+        assert count_tokens(text) <= 60
+    for (previous, _), (current, _) in zip(chunks, chunks[1:]):
+        assert current.split(".")[0] + "." in previous
+
+def test_oversized_block_is_split():
+    """Test that a block longer than a chunk is split rather than kept whole"""
+    block = " ".join(f"word{i}" for i in range(500))
+
+    chunks = list(iter_chunks([block], chunk_tokens=50, overlap_tokens=0))
+
+    assert len(chunks) > 1
+    assert all(tokens <= 50 for _, tokens in chunks)
+    assert " ".join(text for text, _ in chunks) == block
+
+def test_near_duplicate_chunks_are_dropped():
+    """Test that repeated and almost repeated chunks are embedded once"""
+    text = " ".join(paragraphs(10))
+    chunks = [(text, 200), (text.upper(), 200), (text.replace("Paragraph 3 ", "Section 3 "), 200), ("Store below 25C.", 5)]
+
+    kept = [chunk for chunk, _ in dedupe_chunks(chunks)]
+
+    assert kept == [text, "Store below 25C."]
+    assert DuplicateFilter().seen("unique text") is False
+
+def test_budget_stops_reading_input():
+    """Test that chunks past the token budget are never produced"""
+    produced = []
+
+    def source():
+        for i in range(100):
+            produced.append(i)
+            yield f"chunk {i}", 10
+
+    budget = TokenBudget(35)
+    kept = list(limit_tokens(source(), budget))
+
+    assert len(kept) == 3
+    assert len(produced) == 4
+    assert budget.exhausted
+
+def test_budget_is_shared_across_documents():
+    """Test that one request budget caps the total over several pages"""
+    budget = TokenBudget(100)
+    text = "\n\n".join(paragraphs(40))
+
+    first = list(chunk_text(text, chunk_tokens=40, overlap_tokens=0, budget=budget))
+    second = list(chunk_text(text, chunk_tokens=40, overlap_tokens=0, budget=budget))
+
+    assert sum(tokens for _, tokens in first + second) <= 100
+    assert second == []
+    assert budget.exhausted
+
+def test_document_cap():
+    """Test that a single page is cut at its own token cap"""
+    text = "\n\n".join(paragraphs(200))
+
+    chunks = list(chunk_text(text, chunk_tokens=40, overlap_tokens=0, max_tokens=200))
+
+    assert 0 < sum(tokens for _, tokens in chunks) <= 200
+    assert chunks[0][0].startswith("Paragraph 0 ")
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coalesce import SingleFlight
+from metrics import COALESCED, _timings, span
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_computation():
+    """Test that identical in-flight calls run the work once and all get its result"""
+    flights = SingleFlight("test_share")
+    calls = 0
+    
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "answer"
+    
+    before = COALESCED.labels("test_share")._value.get()
+    results = await asyncio.gather(*(flights.do("key", compute) for _ in range(5)))
+    
+    assert results == ["answer"] * 5
+    assert calls == 1
+    assert COALESCED.labels("test_share")._value.get() - before == 4
+    assert len(flights) == 0
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    """Test that calls with different keys are not coalesced"""
+    flights = SingleFlight("test_keys")
+    
+    async def compute(value):
+        await asyncio.sleep(0.01)
+        return value
+    
+    results = await asyncio.gather(flights.do("a", lambda: compute("a")), flights.do("b", lambda: compute("b")))
+    
+    assert results == ["a", "b"]
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    """Test that a failed computation raises in every coalesced caller"""
+    flights = SingleFlight("test_errors")
+    
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+    
+    results = await asyncio.gather(*(flights.do("key", compute) for _ in range(3)), return_exceptions=True)
+    
+    assert all(isinstance(result, ValueError) for result in results)
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_work():
+    """Test that one caller going away leaves the computation running for the rest"""
+    flights = SingleFlight("test_cancel")
+    
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "done"
+    
+    first = asyncio.ensure_future(flights.do("key", compute))
+    second = asyncio.ensure_future(flights.do("key", compute))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    
+    assert await second == "done"
+
+@pytest.mark.asyncio
+async def test_completed_work_is_not_reused():
+    """Test that a call after completion starts fresh work"""
+    flights = SingleFlight("test_fresh")
+    calls = 0
+    
+    async def compute():
+        nonlocal calls
+        calls += 1
+        return calls
+    
+    assert await flights.do("key", compute) == 1
+    assert await flights.do("key", compute) == 2
+
+@pytest.mark.asyncio
+async def test_waiting_callers_report_coalesced_stage():
+    """Test that a caller sharing another's computation records its wait in its own timings"""
+    flights = SingleFlight("test_timing")
+    
+    async def compute():
+        with span("work"):
+            await asyncio.sleep(0.02)
+        return "answer"
+    
+    async def request():
+        timings = []
+        _timings.set(timings)
+        await flights.do("key", compute)
+        return [stage for stage, _ in timings]
+    
+    first, second = await asyncio.gather(request(), request())
+    
+    assert first == ["work"]
+    assert second == ["coalesced"]
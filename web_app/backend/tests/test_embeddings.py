@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import clients
+from embeddings import DynamicBatcher, EmbeddingCache, LocalEmbedding, normalize
+
+class FakeEncoder:
+    """Deterministic encoder that records the batches it was given"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+def test_normalize():
+    """Test that rows are scaled to unit length and zero rows are kept"""
+    matrix = normalize(np.array([[3.0, 4.0], [0.0, 0.0]]))
+
+    assert np.allclose(matrix, [[0.6, 0.8], [0.0, 0.0]])
+    assert matrix.dtype == np.float32
+
+def test_batcher_combines_concurrent_calls():
+    """Test that calls from concurrent threads share model calls and get their own rows"""
+    encoder = FakeEncoder()
+    batcher = DynamicBatcher(encoder, max_batch_size=64, max_wait=0.2)
+    results = {}
+    start = threading.Barrier(8)
+
+    def worker(i):
+        start.wait()
+        results[i] = batcher.embed(["x" * (i + 1), "shared"])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(encoder.calls) < 8
+    # Texts requested by several callers are encoded once per batch
+    assert all(call.count("shared") == 1 for call in encoder.calls)
+    for i, rows in results.items():
+        assert np.allclose(rows[0], normalize(np.array([[i + 1, 1.0, 0.0]]))[0])
+
+def test_batcher_respects_batch_size():
+    """Test that queued calls are split so no model call exceeds the batch size"""
+    encoder = FakeEncoder()
+    batcher = DynamicBatcher(encoder, max_batch_size=4, max_wait=0.05)
+    threads = [threading.Thread(target=batcher.embed, args=([f"text {i}", f"more {i}"],)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(len(call) <= 4 for call in encoder.calls)
+    assert sum(len(call) for call in encoder.calls) == 12
+
+def test_batcher_raises_encoder_errors():
+    """Test that a failing model call fails its callers"""
+    def broken(texts):
+        raise RuntimeError("model failed")
+
+    with pytest.raises(RuntimeError):
+        DynamicBatcher(broken, max_wait=0).embed(["text"])
+
+def test_embedding_cache_round_trip_and_prune(tmp_path):
+    """Test that vectors persist across cache instances and old entries are dropped"""
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path, max_entries=10)
+    cache.put_many({f"key{i}": np.array([i, 1.0], dtype=np.float32) for i in range(25)})
+
+    reopened = EmbeddingCache(path, max_entries=10)
+    found = reopened.get_many(["key0", "key24"])
+
+    assert len(reopened) == 10
+    assert "key0" not in found
+    assert np.allclose(found["key24"], [24, 1.0])
+
+def test_local_embedding_uses_cache(tmp_path):
+    """Test that previously embedded texts are served from disk without the model"""
+    path = str(tmp_path / "embeddings.sqlite3")
+    encoder = FakeEncoder()
+    model = LocalEmbedding(encoder=encoder, cache=EmbeddingCache(path))
+
+    first = model.get_text_embedding_batch(["alpha", "beta", "alpha"])
+    restarted = LocalEmbedding(encoder=encoder, cache=EmbeddingCache(path))
+    second = restarted.get_text_embedding_batch(["beta", "alpha"])
+    query = restarted.get_query_embedding("gamma")
+
+    assert encoder.calls == [["alpha", "beta"], ["gamma"]]
+    assert second == [first[1], first[0]]
+    assert np.isclose(np.linalg.norm(query), 1.0)
+
+@pytest.mark.asyncio
+async def test_async_query_embedding_does_not_block_the_loop():
+    """Test that an async query embedding waits for the model off the event loop"""
+    def slow_encoder(texts):
+        time.sleep(0.2)
+        return np.ones((len(texts), 3), dtype=np.float32)
+
+    model = LocalEmbedding(encoder=slow_encoder, cache=EmbeddingCache(None))
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.ensure_future(tick())
+    embedding = await model.aget_query_embedding("gamma")
+    ticker.cancel()
+
+    assert ticks >= 5
+    assert np.isclose(np.linalg.norm(embedding), 1.0)
+
+def test_local_provider_keeps_database_model():
+    """Test that rag_documents are still searched with the model that embedded them"""
+    with patch('clients.EMBEDDING_PROVIDER', 'local'), patch('clients._database_embed_model', None):
+        model = clients.get_database_embed_model()
+
+        assert type(model).__name__ == "OpenAIEmbedding"
+        assert clients.embedding_model_id().startswith("local:")
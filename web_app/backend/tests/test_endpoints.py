@@ -1,3 +1,4 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
@@ -6,7 +7,8 @@ from unittest.mock import patch, MagicMock
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app import app
+from app import app, create_access_token, user_claims
+from metrics import span
 
 def test_register_user(test_client, mock_supabase):
     """Test user registration endpoint"""
@@ -16,7 +18,9 @@ def test_register_user(test_client, mock_supabase):
     mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value = mock_response
     
     # Mock successful insert
-    mock_supabase.table.return_value.insert.return_value.execute.return_value = MagicMock()
+    mock_insert = MagicMock()
+    mock_insert.data = [{"id": "new-user-id", "username": "newuser", "email": "new@example.com"}]
+    mock_supabase.table.return_value.insert.return_value.execute.return_value = mock_insert
     
     # Test data
     user_data = {
@@ -166,4 +170,67 @@ def test_me_endpoint(test_client, test_token, test_user):
         # Check response
         assert response.status_code == 200
         assert response.json()["username"] == test_user["username"]
-        assert response.json()["email"] == test_user["email"]
\ No newline at end of file
+        assert response.json()["email"] == test_user["email"]
+
+def test_browser_rag_stream_endpoint(test_client, test_user):
+    """Test that the streaming endpoint emits server-sent events"""
+    async def fake_stream(query, urls, history=None):
+        with span("llm"):
+            yield "token", "Hello"
+        yield "sources", {"source_urls": urls}
+    
+    token = create_access_token(user_claims(test_user))
+    with patch('app.RAGAgent.browser_rag_stream', side_effect=fake_stream):
+        response = test_client.post(
+            "/browser-rag/stream",
+            json={"query": "Hi?", "urls": ["https://example.com"]},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = response.text.split("\n\n")
+    assert events[:2] == [
+        'event: token\ndata: "Hello"',
+        'event: sources\ndata: {"source_urls": ["https://example.com"]}',
+    ]
+    # Stage timings arrive after the stream, since the header was sent before they ran
+    assert events[2].startswith("event: timing\ndata: ")
+    assert "llm" in json.loads(events[2].split("data: ", 1)[1])
+
+def test_database_rag_stream_endpoint_reports_errors(test_client, test_user):
+    """Test that failures after the stream started are sent as an error event"""
+    async def failing_stream(**kwargs):
+        raise RuntimeError("LLM unavailable")
+        yield
+    
+    token = create_access_token(user_claims(test_user))
+    with patch('app.RAGAgent.database_rag_stream', side_effect=failing_stream):
+        response = test_client.post(
+            "/database-rag/stream",
+            json={"query": "Hi?"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    
+    assert response.status_code == 200
+    assert 'event: error\ndata: {"detail": "LLM unavailable"}' in response.text
+
+def test_browser_rag_batch_endpoint(test_client, test_user):
+    """Test browser RAG batch endpoint"""
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+    mock_result = {
+        "results": [{"query": "A?", "response": "A."}, {"query": "B?", "error": "LLM unavailable"}],
+        "source_urls": ["https://example.com"]
+    }
+    with patch('app.RAGAgent.browser_rag_batch', return_value=mock_result) as mock_batch:
+        response = test_client.post(
+            "/browser-rag/batch",
+            json={"queries": ["A?", "B?"], "urls": ["https://example.com"]},
+            headers=headers
+        )
+    
+    assert response.status_code == 200
+    assert response.json() == mock_result
+    mock_batch.assert_called_once_with(["A?", "B?"], ["https://example.com"])
+    assert test_client.post("/browser-rag/batch", json={"queries": ["A?"], "urls": []}, headers=headers).status_code == 400
+    assert test_client.post("/browser-rag/batch", json={"queries": [], "urls": ["https://example.com"]}, headers=headers).status_code == 422
@@ -0,0 +1,127 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent import RAGAgent, entity_index
+from benchmarks.fakes import FakeSupabase
+from entities import AhoCorasick, Entity, EntityIndex, EntityMatcher, is_simple_lookup, tokenize
+from routing import LLM_FAST_MODEL
+
+def reference_db():
+    db = FakeSupabase()
+    db.add_row("medications", {
+        "name": "Atorvastatin",
+        "description": "A statin that lowers cholesterol.",
+        "dosage_info": "10-80 mg once daily.",
+        "side_effects": ["muscle pain", "headache"],
+    })
+    db.add_row("medical_conditions", {
+        "name": "Diabetes",
+        "description": "High blood sugar.",
+        "symptoms": ["thirst"],
+        "treatments": ["insulin"],
+    })
+    db.add_row("medical_conditions", {
+        "name": "Type 2 Diabetes",
+        "description": "Insulin resistance.",
+        "symptoms": ["fatigue"],
+        "treatments": ["metformin"],
+    })
+    db.add_row("reference_data_versions", {"name": "medications", "version": 1})
+    db.add_row("reference_data_versions", {"name": "medical_conditions", "version": 1})
+    return db
+
+def test_tokenize_ignores_case_and_plurals():
+    """Test that singular and plural, upper and lower case forms normalise alike"""
+    assert tokenize("Statins") == tokenize("statin")
+    assert tokenize("Allergies") == tokenize("allergy")
+    assert tokenize("doses") == tokenize("dose")
+    assert tokenize("Atorvastatin's") == tokenize("atorvastatin")
+
+def test_automaton_finds_overlapping_patterns():
+    """Test that every occurrence is reported, including patterns inside longer ones"""
+    automaton = AhoCorasick([(["type", "2", "diabete"], "t2"), (["diabete"], "d"), (["2"], "two")])
+    
+    matches = sorted(automaton.iter_matches(["i", "have", "type", "2", "diabete"]))
+    
+    assert matches == [(2, 5, "t2"), (3, 4, "two"), (4, 5, "d")]
+
+def test_matcher_prefers_longest_mention():
+    """Test that overlapping mentions resolve to the longest one"""
+    matcher = EntityMatcher([
+        Entity("condition", 1, "Diabetes", "High blood sugar."),
+        Entity("condition", 2, "Type 2 Diabetes", "Insulin resistance."),
+        Entity("medication", 3, "Metformin", "First-line treatment."),
+    ])
+    
+    entities, other_words = matcher.find("Is METFORMIN used for type 2 diabetes?")
+    
+    assert [entity.id for entity in entities] == [3, 2]
+    assert other_words == tokenize("Is used for")
+
+def test_simple_lookup_detection():
+    """Test that only questions about the named entities count as plain lookups"""
+    matcher = EntityMatcher([Entity("medication", 1, "Ibuprofen", "An NSAID.")])
+    
+    assert is_simple_lookup(*matcher.find("What are the side effects of ibuprofen?"))
+    assert not is_simple_lookup(*matcher.find("Can I take ibuprofen after knee surgery?"))
+    assert not is_simple_lookup(*matcher.find("What are the side effects?"))
+
+@pytest.mark.asyncio
+async def test_index_loads_and_refreshes_on_version_change():
+    """Test that the index loads from the tables and rebuilds only when they change"""
+    db = reference_db()
+    on_change = MagicMock()
+    index = EntityIndex(lambda: db, page_size=1, on_change=on_change)
+    
+    entities, _ = await index.match("atorvastatin dosage")
+    assert [entity.name for entity in entities] == ["Atorvastatin"]
+    assert "Side effects: muscle pain, headache" in entities[0].context()
+    
+    assert index.refresh() is False
+    db.add_row("medications", {"name": "Ibuprofen", "description": "An NSAID.", "dosage_info": "200 mg."})
+    db.tables["reference_data_versions"][0]["version"] = 2
+    assert index.refresh() is True
+    on_change.assert_called_once()
+    
+    entities, _ = await index.match("ibuprofen")
+    assert [entity.name for entity in entities] == ["Ibuprofen"]
+
+@pytest.mark.asyncio
+async def test_index_serves_nothing_when_tables_unavailable():
+    """Test that a failed load does not fail the query"""
+    client = MagicMock()
+    client.table.side_effect = RuntimeError("database unavailable")
+    index = EntityIndex(lambda: client)
+    
+    assert await index.match("atorvastatin") == ([], [])
+
+@pytest.mark.asyncio
+async def test_database_rag_simple_lookup_skips_retrieval(mock_llama_index, mock_supabase):
+    """Test that a plain reference lookup is answered without embedding or vector search"""
+    matcher = EntityMatcher([Entity("medication", 1, "Atorvastatin", "Lowers cholesterol.", {"Dosage": "10 mg"})])
+    
+    with patch.object(entity_index, '_matcher', matcher), \
+         patch('agent._embed_query') as mock_embed:
+        result = await RAGAgent.database_rag("What is the dosage of atorvastatin?", "test-user-id")
+    
+    assert result == {"response": "This is a test response", "sources": ["Atorvastatin"], "model": LLM_FAST_MODEL}
+    mock_embed.assert_not_called()
+    mock_supabase.rpc.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_database_rag_adds_entity_context(mock_llama_index, mock_supabase):
+    """Test that matched entities are added to the retrieved context"""
+    matcher = EntityMatcher([Entity("medication", 1, "Atorvastatin", "Lowers cholesterol.")])
+    mock_supabase.rpc.return_value.execute.return_value.data = [
+        {"id": 7, "title": "Statins and exercise", "content": "Content", "score": 0.03}
+    ]
+    
+    with patch.object(entity_index, '_matcher', matcher):
+        result = await RAGAgent.database_rag("Can I run a marathon on atorvastatin?", "test-user-id")
+    
+    assert result["sources"] == ["Atorvastatin", "Statins and exercise"]
+    mock_supabase.rpc.assert_called_once()
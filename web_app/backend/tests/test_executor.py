@@ -0,0 +1,40 @@
+import asyncio
+import contextvars
+import threading
+import time
+import pytest
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import executor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+@pytest.mark.asyncio
+async def test_run_io_runs_off_the_event_loop():
+    """Test that blocking work runs on a worker thread"""
+    thread_name = await executor.run_io(lambda: threading.current_thread().name)
+    
+    assert thread_name.startswith("kyra-io")
+
+@pytest.mark.asyncio
+async def test_run_io_propagates_context():
+    """Test that context variables are visible in the worker"""
+    request_id.set("abc")
+    
+    assert await executor.run_io(request_id.get) == "abc"
+
+@pytest.mark.asyncio
+async def test_run_io_overlaps_blocking_calls():
+    """Test that concurrent blocking calls do not serialise"""
+    started = time.monotonic()
+    await asyncio.gather(*(executor.run_io(time.sleep, 0.2) for _ in range(5)))
+    
+    assert time.monotonic() - started < 0.6
+
+@pytest.mark.asyncio
+async def test_run_cpu_passes_arguments():
+    """Test argument forwarding on the CPU pool"""
+    assert await executor.run_cpu(pow, 2, 10) == 1024
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+import httpx
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fetcher import PageFetcher
+
+def make_fetcher(handler, **kwargs):
+    return PageFetcher(transport=httpx.MockTransport(handler), **kwargs)
+
+@pytest.mark.asyncio
+async def test_fetch_returns_text_and_validators():
+    """Test a successful fetch"""
+    def handler(request):
+        return httpx.Response(200, text="<p>Hello</p>", headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    
+    result = await make_fetcher(handler).fetch("https://example.com/page")
+    
+    assert result.error is None
+    assert result.text == "<p>Hello</p>"
+    assert result.etag == '"v1"'
+    assert result.last_modified == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+@pytest.mark.asyncio
+async def test_fetch_sends_conditional_headers():
+    """Test revalidation with a known ETag"""
+    def handler(request):
+        assert request.headers["If-None-Match"] == '"v1"'
+        return httpx.Response(304)
+    
+    result = await make_fetcher(handler).fetch("https://example.com/page", etag='"v1"')
+    
+    assert result.not_modified is True
+    assert result.error is None
+
+@pytest.mark.asyncio
+async def test_fetch_enforces_size_cap():
+    """Test that oversized responses are rejected"""
+    def handler(request):
+        return httpx.Response(200, content=b"x" * 2048)
+    
+    result = await make_fetcher(handler, max_bytes=1024).fetch("https://example.com/big")
+    
+    assert result.text is None
+    assert "larger than" in result.error
+
+@pytest.mark.asyncio
+async def test_fetch_all_reports_partial_failures():
+    """Test that one failing URL does not fail the batch"""
+    def handler(request):
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        return httpx.Response(200, text="ok")
+    
+    results = await make_fetcher(handler).fetch_all([
+        ("https://example.com/ok", None, None),
+        ("https://example.com/missing", None, None),
+    ])
+    
+    assert [result.url for result in results] == ["https://example.com/ok", "https://example.com/missing"]
+    assert results[0].text == "ok"
+    assert results[1].error is not None
+
+@pytest.mark.asyncio
+async def test_fetch_all_runs_concurrently():
+    """Test that slow pages are fetched in parallel"""
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, text="slow")
+    
+    fetcher = make_fetcher(handler, per_host_limit=10)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    results = await fetcher.fetch_all([(f"https://example.com/{i}", None, None) for i in range(5)])
+    
+    assert all(result.text == "slow" for result in results)
+    assert loop.time() - started < 0.6
+
+@pytest.mark.asyncio
+async def test_host_limits_are_released_when_idle():
+    """Test that per-host limits are dropped once a host has no requests in flight"""
+    fetcher = make_fetcher(lambda request: httpx.Response(200, text="ok"), per_host_limit=1)
+    
+    results = await fetcher.fetch_all([(f"https://host{i}.example.com/", None, None) for i in range(3)])
+    
+    assert all(result.text == "ok" for result in results)
+    assert fetcher._host_limits == {}
@@ -0,0 +1,238 @@
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import history
+from app import create_access_token, user_claims
+from benchmarks.fakes import FakeSupabase
+from history import (
+    MessageWriter,
+    conversation_context,
+    count_tokens,
+    decode_cursor,
+    encode_cursor,
+    fetch_messages,
+    truncate_tokens,
+)
+
+def seed_messages(db, user_id, count, inserted_at=None):
+    for i in range(count):
+        db.add_row("messages", {
+            "user_id": user_id,
+            "message": f"message {i}",
+            "is_ai_response": i % 2 == 1,
+            # Pairs of rows share a timestamp to exercise the id tie-break
+            "inserted_at": inserted_at or f"2026-10-18T10:00:{i // 2:02d}+00:00",
+        })
+
+@pytest.fixture
+def fake_db():
+    db = FakeSupabase()
+    with patch('clients._supabase_client', new=db):
+        history.summary_cache.clear()
+        yield db
+
+def test_cursor_round_trip():
+    """Test that cursors encode the keyset position"""
+    cursor = encode_cursor({"inserted_at": "2026-10-18T10:00:00+00:00", "id": 42})
+
+    assert decode_cursor(cursor) == ("2026-10-18T10:00:00+00:00", 42)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_fetch_messages_pages_without_gaps(fake_db):
+    """Test that keyset pages cover every message exactly once, newest first"""
+    seed_messages(fake_db, "user-1", 25)
+    seed_messages(fake_db, "user-2", 5)
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = fetch_messages(fake_db, "user-1", limit=10, cursor=cursor)
+        seen.extend(row["id"] for row in rows)
+        if cursor is None:
+            break
+
+    assert len(seen) == 25
+    assert seen == sorted(seen, reverse=True)
+
+def test_fetch_messages_after_id(fake_db):
+    """Test that already summarized messages are skipped"""
+    seed_messages(fake_db, "user-1", 10)
+
+    rows, cursor = fetch_messages(fake_db, "user-1", limit=50, after_id=7)
+
+    assert [row["id"] for row in rows] == [10, 9, 8]
+    assert cursor is None
+
+def test_truncate_tokens():
+    """Test that text is cut to whole words within the token limit"""
+    text = " ".join(f"word{i}" for i in range(200))
+
+    truncated = truncate_tokens(text, 20)
+
+    assert count_tokens(truncated) <= 20
+    assert text.startswith(truncated)
+    assert truncate_tokens("short", 20) == "short"
+
+@pytest.mark.asyncio
+async def test_writer_batches_turns(fake_db):
+    """Test that turns are buffered, visible as pending, and written in one insert"""
+    writer = MessageWriter(flush_size=100, flush_interval=60)
+    writer.record_turn("user-1", "Question?", "Answer.")
+
+    assert [row["message"] for row in writer.pending("user-1")] == ["Answer.", "Question?"]
+    assert fake_db.tables["messages"] == []
+
+    assert await writer.flush() == 2
+    assert [row["message"] for row in fake_db.tables["messages"]] == ["Question?", "Answer."]
+    assert writer.pending("user-1") == []
+
+@pytest.mark.asyncio
+async def test_writer_flushes_when_full(fake_db):
+    """Test that a full buffer is written without waiting for the interval"""
+    writer = MessageWriter(flush_size=4, flush_interval=60)
+    writer.record_turn("user-1", "Q1", "A1")
+    writer.record_turn("user-1", "Q2", "A2")
+    await asyncio.sleep(0.1)
+
+    assert len(fake_db.tables["messages"]) == 4
+
+@pytest.mark.asyncio
+async def test_writer_keeps_turns_when_insert_fails():
+    """Test that a failed batch is retried on the next flush"""
+    client = MagicMock()
+    client.table.return_value.insert.return_value.execute.side_effect = RuntimeError("down")
+    writer = MessageWriter(flush_size=100, flush_interval=60)
+    writer.record_turn("user-1", "Q", "A")
+
+    with patch('clients._supabase_client', new=client):
+        with pytest.raises(RuntimeError):
+            await writer.flush()
+
+    assert len(writer.pending("user-1")) == 2
+
+@pytest.mark.asyncio
+async def test_context_stays_within_budget_and_summarizes_overflow(fake_db):
+    """Test that old turns are dropped from the prompt and folded into the summary"""
+    for i in range(30):
+        fake_db.add_row("messages", {
+            "user_id": "user-1",
+            "message": f"turn {i} " + "about my medication " * 10,
+            "is_ai_response": i % 2 == 1,
+            "inserted_at": f"2026-10-18T10:{i:02d}:00+00:00",
+        })
+    llm = MagicMock()
+    llm.complete.return_value = "Patient asked about medication."
+
+    with patch('history.get_llm', return_value=llm):
+        context = await conversation_context("user-1", budget=200)
+        await asyncio.gather(*history._summary_tasks)
+
+    assert count_tokens(context) <= 220
+    assert "turn 29" in context
+    assert "turn 0 " not in context
+    summary = fake_db.tables["conversation_summaries"][0]
+    assert summary["summary"] == "Patient asked about medication."
+
+    # The next prompt starts from the summary and only reads newer turns
+    with patch('history.get_llm', return_value=llm):
+        context = await conversation_context("user-1", budget=200)
+
+    assert context.startswith("Summary of the earlier conversation:\nPatient asked about medication.")
+    assert "turn 29" in context
+
+@pytest.mark.asyncio
+async def test_summary_includes_turns_older_than_the_prompt_window(fake_db):
+    """Test that unsummarized turns beyond the messages read for the prompt are folded in, not skipped"""
+    for i in range(30):
+        fake_db.add_row("messages", {
+            "user_id": "user-1",
+            "message": f"turn {i} " + "about my medication " * 10,
+            "is_ai_response": i % 2 == 1,
+            "inserted_at": f"2026-10-18T10:{i:02d}:00+00:00",
+        })
+    llm = MagicMock()
+    llm.complete.return_value = "Summary."
+
+    with patch('history.get_llm', return_value=llm), \
+         patch('history.HISTORY_CONTEXT_MESSAGES', 10), \
+         patch('history.HISTORY_PAGE_SIZE', 8):
+        await conversation_context("user-1", budget=200)
+        await asyncio.gather(*history._summary_tasks)
+
+    prompts = "".join(call.args[0] for call in llm.complete.call_args_list)
+    assert all(f"turn {i} " in prompts for i in range(20))
+    assert llm.complete.call_count > 1
+    summary = fake_db.tables["conversation_summaries"][0]
+    assert "turn 0 " in llm.complete.call_args_list[0].args[0]
+    assert summary["summarized_through_id"] < 30
+
+@pytest.mark.asyncio
+async def test_turns_behind_a_full_window_are_summarized(fake_db):
+    """Test that turns older than the messages read are summarized even when every read turn fits"""
+    for i in range(45):
+        fake_db.add_row("messages", {
+            "user_id": "user-1",
+            "message": f"turn {i}",
+            "is_ai_response": i % 2 == 1,
+            "inserted_at": f"2026-10-18T10:{i:02d}:00+00:00",
+        })
+    llm = MagicMock()
+    llm.complete.return_value = "Summary."
+
+    with patch('history.get_llm', return_value=llm):
+        context = await conversation_context("user-1", budget=10000)
+        await asyncio.gather(*history._summary_tasks)
+
+    summarized = {line.split(": ", 1)[1] for line in llm.complete.call_args.args[0].splitlines() if ": turn " in line}
+    prompted = {line.split(": ", 1)[1] for line in context.splitlines() if ": turn " in line}
+    assert summarized == {f"turn {i}" for i in range(5)}
+    assert prompted == {f"turn {i}" for i in range(5, 45)}
+    assert fake_db.tables["conversation_summaries"][0]["summarized_through_id"] == 5
+
+def test_fetch_messages_quotes_cursor_timestamp():
+    """Test that the keyset filter quotes the timestamp so "+00:00" is not mangled"""
+    client = MagicMock()
+    query = client.table.return_value.select.return_value.eq.return_value
+    query.or_.return_value.order.return_value.order.return_value.limit.return_value.execute.return_value.data = []
+
+    fetch_messages(client, "user-1", cursor=encode_cursor({"inserted_at": "2026-10-18T10:00:00+00:00", "id": 7}))
+
+    assert query.or_.call_args.args[0] == (
+        'inserted_at.lt."2026-10-18T10:00:00+00:00",'
+        'and(inserted_at.eq."2026-10-18T10:00:00+00:00",id.lt.7)'
+    )
+
+def test_messages_endpoint_paginates(test_client, test_user, fake_db):
+    """Test the conversation history endpoint"""
+    seed_messages(fake_db, test_user["id"], 5)
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+
+    first = test_client.get("/messages", params={"limit": 3}, headers=headers).json()
+    second = test_client.get("/messages", params={"limit": 3, "cursor": first["next_cursor"]}, headers=headers).json()
+
+    assert [row["id"] for row in first["messages"]] == [5, 4, 3]
+    assert [row["id"] for row in second["messages"]] == [2, 1]
+    assert second["next_cursor"] is None
+    assert test_client.get("/messages", params={"cursor": "bad"}, headers=headers).status_code == 400
+
+def test_database_rag_records_turn_with_history(test_client, test_user, fake_db):
+    """Test that a chat request is answered with history and its turn recorded"""
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+
+    with patch('app.RAGAgent.database_rag', return_value={"response": "Take it with food.", "sources": []}) as mock_rag, \
+         patch('app.conversation_context', return_value="Recent conversation:\nPatient: Hi") as mock_context:
+        response = test_client.post(
+            "/database-rag", json={"query": "How do I take it?", "use_history": True}, headers=headers
+        )
+
+    assert response.status_code == 200
+    mock_context.assert_called_once_with(test_user["id"])
+    assert mock_rag.call_args.kwargs["history"] == "Recent conversation:\nPatient: Hi"
+    assert len(history.message_writer.pending(test_user["id"])) == 2
+    asyncio.run(history.message_writer.flush())
+    assert [row["message"] for row in fake_db.tables["messages"]] == ["How do I take it?", "Take it with food."]
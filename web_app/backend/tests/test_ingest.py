@@ -0,0 +1,87 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import content_hash
+from ingest import ingest, combine_embeddings, embed_with_retry
+
+def make_client(rows):
+    """Fake Supabase client serving one page of rag_documents"""
+    client = MagicMock()
+    page = MagicMock()
+    page.data = rows
+    query = client.table.return_value.select.return_value
+    query.or_.return_value = query
+    query.gt.return_value.order.return_value.limit.return_value.execute.return_value = page
+    client.rpc.return_value.execute.return_value.data = 1
+    return client
+
+def test_ingest_skips_unchanged_documents():
+    """Test that documents embedded from the same content are not re-embedded"""
+    rows = [
+        {"id": 1, "content": "Unchanged text", "content_hash": content_hash("Unchanged text")},
+        {"id": 2, "content": "New text", "content_hash": None},
+    ]
+    client = make_client(rows)
+    embed = MagicMock(side_effect=lambda texts: [[1.0, 0.0] for _ in texts])
+    
+    stats = ingest(client, embed)
+    
+    embed.assert_called_once_with(["New text"])
+    function_name, params = client.rpc.call_args.args
+    assert function_name == "bulk_update_rag_document_embeddings"
+    assert params["updates"] == [{"id": 2, "embedding": [1.0, 0.0], "content_hash": content_hash("New text")}]
+    assert stats["skipped"] == 1
+    assert stats["embedded"] == 1
+
+def test_ingest_reports_written_documents():
+    """Test that the ids of each written batch are passed to on_written"""
+    client = make_client([
+        {"id": 1, "content": "Unchanged text", "content_hash": content_hash("Unchanged text")},
+        {"id": 2, "content": "Changed text", "content_hash": content_hash("Old text")},
+    ])
+    written = []
+    
+    ingest(client, lambda texts: [[1.0, 0.0] for _ in texts], on_written=written.append)
+    
+    assert written == [[2]]
+
+def test_ingest_batches_embedding_calls():
+    """Test that many documents are embedded in batches"""
+    rows = [{"id": i, "content": f"Document {i}", "content_hash": None} for i in range(1, 6)]
+    client = make_client(rows)
+    embed = MagicMock(side_effect=lambda texts: [[1.0] for _ in texts])
+    
+    ingest(client, embed, batch_size=2)
+    
+    assert [len(call.args[0]) for call in embed.call_args_list] == [2, 2, 1]
+    client.rpc.assert_called_once()
+
+def test_ingest_filters_by_last_updated():
+    """Test that the since watermark is pushed down to the query"""
+    client = make_client([])
+    
+    ingest(client, MagicMock(), since="2024-01-01T00:00:00Z")
+    
+    filters = client.table.return_value.select.return_value.or_.call_args.args[0]
+    assert "last_updated.gte.2024-01-01T00:00:00Z" in filters
+    assert "embedding.is.null" in filters
+
+def test_combine_embeddings_is_normalised():
+    """Test chunk embedding averaging"""
+    combined = combine_embeddings([[1.0, 0.0], [0.0, 1.0]], [1, 1])
+    
+    assert combined == pytest.approx([0.70710678, 0.70710678])
+
+def test_embed_with_retry_recovers_from_errors():
+    """Test that transient embedding failures are retried"""
+    embed = MagicMock(side_effect=[RuntimeError("rate limited"), [[0.5]]])
+    
+    with patch('ingest.time.sleep') as mock_sleep:
+        assert embed_with_retry(embed, ["text"]) == [[0.5]]
+    
+    assert embed.call_count == 2
+    mock_sleep.assert_called_once()
@@ -0,0 +1,179 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import patch
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_access_token, user_claims
+from benchmarks.fakes import FakeSupabase
+from jobs import JobQueue, JobRejected, job_queue
+
+def answer_events(*tokens, delay=0.0, sources=None):
+    async def events():
+        for token in tokens:
+            await asyncio.sleep(delay)
+            yield "token", token
+        yield "sources", sources or {"source_urls": ["https://example.com"]}
+    return events
+
+@pytest.fixture
+def fake_db():
+    db = FakeSupabase()
+    with patch('clients._supabase_client', new=db):
+        yield db
+
+async def wait_finished(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.status not in ("succeeded", "failed") and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_job_collects_streamed_answer(fake_db):
+    """Test that a job folds its token and sources events into the result"""
+    queue = JobQueue(workers=1)
+    job = await queue.submit("user-1", "browser-rag", answer_events("Paris ", "is the capital."))
+    events = [event async for event, _ in job.follow()]
+    await queue.stop()
+
+    assert job.status == "succeeded"
+    assert job.result == {"response": "Paris is the capital.", "source_urls": ["https://example.com"]}
+    assert events == ["status", "status", "token", "token", "sources", "status", "result"]
+    assert fake_db.tables["rag_jobs"][0]["status"] == "succeeded"
+    assert fake_db.tables["rag_jobs"][0]["result"] == job.result
+
+@pytest.mark.asyncio
+async def test_user_quota_rejects_with_retry_after(fake_db):
+    """Test that a user at their quota is turned away until a job finishes"""
+    queue = JobQueue(workers=2, user_limit=1)
+    first = await queue.submit("user-1", "browser-rag", answer_events("a", delay=0.05))
+
+    with pytest.raises(JobRejected) as rejected:
+        await queue.submit("user-1", "browser-rag", answer_events("b"))
+    other = await queue.submit("user-2", "browser-rag", answer_events("c"))
+    await wait_finished(first)
+    again = await queue.submit("user-1", "browser-rag", answer_events("d"))
+    await wait_finished(again)
+    await queue.stop()
+
+    assert rejected.value.retry_after >= 1
+    assert other.status == "succeeded"
+    assert again.result["response"] == "d"
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects(fake_db):
+    """Test that submissions beyond the queue limit are rejected"""
+    queue = JobQueue(workers=1, queue_limit=2, user_limit=10)
+    running = await queue.submit("user-1", "browser-rag", answer_events("a", delay=0.2))
+    await asyncio.sleep(0.05)
+    await queue.submit("user-1", "browser-rag", answer_events("b"))
+    await queue.submit("user-1", "browser-rag", answer_events("c"))
+
+    with pytest.raises(JobRejected) as rejected:
+        await queue.submit("user-1", "browser-rag", answer_events("d"))
+
+    assert running.status == "running"
+    assert rejected.value.reason == "Job queue is full"
+    await queue.stop()
+
+@pytest.mark.asyncio
+async def test_concurrent_submissions_respect_queue_limit(fake_db):
+    """Test that submissions racing on the rag_jobs write cannot overfill the queue"""
+    queue = JobQueue(workers=1, queue_limit=2, user_limit=10)
+
+    results = await asyncio.gather(
+        *[queue.submit("user-1", "browser-rag", answer_events("a", delay=0.2)) for _ in range(5)],
+        return_exceptions=True,
+    )
+    await queue.stop()
+
+    assert sum(not isinstance(result, JobRejected) for result in results) == 2
+
+@pytest.mark.asyncio
+async def test_stop_fails_running_and_queued_jobs(fake_db):
+    """Test that stopping the workers records unfinished jobs as failed and frees the user's quota"""
+    queue = JobQueue(workers=1, user_limit=10)
+    running = await queue.submit("user-1", "browser-rag", answer_events("a", delay=1.0))
+    waiting = await queue.submit("user-1", "browser-rag", answer_events("b"))
+    await asyncio.sleep(0.05)
+
+    await queue.stop()
+
+    assert running.status == waiting.status == "failed"
+    assert "cancelled" in running.error
+    assert [event for event, _ in running.history][-2:] == ["status", "error"]
+    assert [row["status"] for row in fake_db.tables["rag_jobs"]] == ["failed", "failed"]
+    assert queue._active == {} and queue.queued() == 0
+
+@pytest.mark.asyncio
+async def test_job_timeout_and_failure(fake_db):
+    """Test that slow and failing jobs end as failed with an error"""
+    async def broken():
+        raise RuntimeError("No URLs could be loaded")
+        yield
+
+    queue = JobQueue(workers=2, timeout=0.05)
+    slow = await queue.submit("user-1", "browser-rag", answer_events("a", delay=1.0))
+    failing = await queue.submit("user-1", "browser-rag", broken)
+    await wait_finished(slow)
+    await wait_finished(failing)
+    await queue.stop()
+
+    assert slow.status == "failed" and "timed out" in slow.error
+    assert failing.status == "failed" and failing.error == "No URLs could be loaded"
+
+def test_job_endpoints(test_client, test_user, fake_db):
+    """Test submitting a browser RAG job and polling its result"""
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+
+    async def fake_stream(query, urls, history=None):
+        yield "token", "The answer."
+        yield "sources", {"source_urls": urls}
+
+    with patch('app.RAGAgent.browser_rag_stream', side_effect=fake_stream):
+        response = test_client.post(
+            "/jobs/browser-rag", json={"query": "What?", "urls": ["https://example.com"]}, headers=headers
+        )
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.headers["location"] == f"/jobs/{job_id}"
+
+        for _ in range(100):
+            result = test_client.get(f"/jobs/{job_id}/result", headers=headers)
+            if result.status_code != 202:
+                break
+            time.sleep(0.01)
+        events = test_client.get(f"/jobs/{job_id}/events", headers=headers)
+
+    assert result.status_code == 200
+    assert result.json() == {"response": "The answer.", "source_urls": ["https://example.com"]}
+    assert "event: result" in events.text
+    assert test_client.get(f"/jobs/{job_id}", headers=headers).json()["status"] == "succeeded"
+    assert test_client.get("/jobs/unknown", headers=headers).status_code == 404
+
+def test_job_endpoint_returns_429(test_client, test_user, fake_db):
+    """Test that a saturated job queue answers 429 with Retry-After"""
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+
+    with patch.object(job_queue, 'queue_limit', 0):
+        response = test_client.post("/jobs/database-rag", json={"query": "What?"}, headers=headers)
+
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+def test_job_from_another_worker(test_client, test_user, fake_db):
+    """Test that a job stored by another worker can be polled"""
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+    fake_db.add_row("rag_jobs", {
+        "id": "job-elsewhere",
+        "user_id": test_user["id"],
+        "kind": "browser-rag",
+        "status": "succeeded",
+        "result": {"response": "Done."},
+        "error": None,
+    })
+
+    assert test_client.get("/jobs/job-elsewhere/result", headers=headers).json() == {"response": "Done."}
+    assert "event: result" in test_client.get("/jobs/job-elsewhere/events", headers=headers).text
@@ -0,0 +1,49 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import MetricsMiddleware, span, server_timing, STAGE_SECONDS
+
+def test_server_timing_sums_repeated_stages():
+    """Test Server-Timing formatting"""
+    header = server_timing([("fetch", 0.010), ("embed", 0.0205), ("fetch", 0.005)])
+    
+    assert header == "fetch;dur=15.0, embed;dur=20.5"
+
+def test_span_records_histogram():
+    """Test that spans are observed in the stage histogram"""
+    before = STAGE_SECONDS.labels("test_stage")._sum.get()
+    with span("test_stage"):
+        pass
+    
+    assert STAGE_SECONDS.labels("test_stage")._sum.get() > before
+
+def test_middleware_adds_server_timing_header():
+    """Test that stages timed during a request appear in its Server-Timing header"""
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    
+    @app.get("/work")
+    async def work():
+        with span("llm"):
+            pass
+        return {"ok": True}
+    
+    with TestClient(app) as client:
+        response = client.get("/work")
+    
+    assert response.status_code == 200
+    assert "llm;dur=" in response.headers["server-timing"]
+    assert "total;dur=" in response.headers["server-timing"]
+
+def test_metrics_endpoint(test_client):
+    """Test that /metrics exposes Prometheus histograms"""
+    response = test_client.get("/metrics")
+    
+    assert response.status_code == 200
+    assert "kyra_stage_duration_seconds" in response.text
+    assert "kyra_requests_in_flight" in response.text
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import agent
+from agent import RAGAgent, patient_contexts
+from benchmarks.fakes import FakeEmbedding, FakeSupabase, hashed_embedding
+from entities import Entity, EntityIndex, EntityMatcher
+from patient_context import PatientContext, PatientContextCache, build_patient_context
+
+ATORVASTATIN = Entity("medication", 1, "Atorvastatin", "A statin that lowers cholesterol.")
+DIABETES = Entity("condition", 2, "Type 2 Diabetes", "Insulin resistance.")
+
+PATIENT = {"id": "test-user-id", "diagnosis": "Type 2 Diabetes", "prescription": "Atorvastatin 20 mg"}
+
+def patient_db():
+    db = FakeSupabase()
+    for title, content in [
+        ("Statins", "Atorvastatin lowers cholesterol and can cause muscle pain."),
+        ("Diabetes diet", "People with type 2 diabetes should limit sugar and eat fibre."),
+        ("Asthma", "Inhalers open the airways."),
+    ]:
+        db.add_row("rag_documents", {
+            "title": title, "content": content, "embedding": hashed_embedding(content, FakeEmbedding().dim)
+        })
+    return db
+
+def entity_index_with(*entities):
+    index = EntityIndex(MagicMock())
+    index._matcher = EntityMatcher(entities)
+    return index
+
+def test_build_retrieves_entities_and_documents():
+    """Test that the bundle holds the patient's reference entities and matching rows, once each"""
+    db = patient_db()
+    index = entity_index_with(ATORVASTATIN, DIABETES)
+
+    with patch('patient_context.get_supabase_client', return_value=db), \
+         patch('patient_context.get_database_embed_model', return_value=FakeEmbedding()), \
+         patch.object(db, 'rpc', wraps=db.rpc) as rpc:
+        context = build_patient_context(PATIENT, index, documents=2)
+
+    rpc.assert_called_once()
+    assert context.entities == [DIABETES, ATORVASTATIN]
+    titles = [row["title"] for row in context.documents]
+    assert {"Statins", "Diabetes diet"} <= set(titles)
+    assert len(titles) == len(set(titles))
+    assert build_patient_context({"id": "x", "diagnosis": " ", "prescription": None}, index) is None
+
+def test_covers_requires_named_entities_and_terms():
+    """Test that a question is covered only when its entities and most of its terms are in the bundle"""
+    context = PatientContext("u", [ATORVASTATIN], [{"title": "Statins", "content": "Atorvastatin can cause muscle pain."}])
+
+    assert context.covers("Can my medication cause muscle pain?", [("medication", 1)])
+    assert context.covers("What is my prescription?")
+    assert not context.covers("Can I take ibuprofen?", [("medication", 9)])
+    assert not context.covers("Is swimming good for asthma patients?")
+
+@pytest.mark.asyncio
+async def test_invalidation_during_build_discards_result():
+    """Test that a users row change while the bundle is being built keeps it out of the cache"""
+    cache = PatientContextCache(entity_index_with())
+    context = PatientContext("test-user-id", [], [])
+
+    def build(user, index):
+        cache.on_users_change({"data": {"type": "UPDATE", "record": {"id": "test-user-id"}, "old_record": {"id": "test-user-id"}}})
+        return context
+
+    with patch('patient_context.build_patient_context', side_effect=build):
+        assert await cache.warm(PATIENT) is context
+    assert cache.get("test-user-id") is None
+
+    with patch('patient_context.build_patient_context', return_value=context):
+        await cache.warm(PATIENT)
+    assert cache.get("test-user-id") is context
+    cache.on_users_change({"data": {"type": "DELETE", "record": None, "old_record": {"id": "test-user-id"}}})
+    assert cache.get("test-user-id") is None
+
+@pytest.mark.asyncio
+async def test_warm_after_invalidation_does_not_join_older_build():
+    """Test that a warm started after an invalidation builds afresh instead of storing the older build"""
+    cache = PatientContextCache(entity_index_with())
+    stale, fresh = PatientContext("test-user-id", [], []), PatientContext("test-user-id", [], [])
+    release = threading.Event()
+    builds = []
+
+    def build(user, index):
+        builds.append(user)
+        if len(builds) == 1:
+            release.wait(5)
+            return stale
+        return fresh
+
+    with patch('patient_context.build_patient_context', side_effect=build):
+        first = asyncio.ensure_future(cache.warm(PATIENT))
+        await asyncio.sleep(0.05)
+        cache.invalidate("test-user-id")
+        second = asyncio.ensure_future(cache.warm(PATIENT))
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(first, second)
+
+    assert len(builds) == 2
+    assert cache.get("test-user-id") is fresh
+
+@pytest.mark.asyncio
+async def test_database_rag_answers_from_bundle(mock_llama_index, mock_supabase):
+    """Test that a question the bundle covers is answered without embedding or search"""
+    db = patient_db()
+    with patch('patient_context.get_supabase_client', return_value=db), \
+         patch('patient_context.get_database_embed_model', return_value=FakeEmbedding()), \
+         patch('agent.entity_index._matcher', EntityMatcher([ATORVASTATIN, DIABETES])):
+        await patient_contexts.warm(PATIENT)
+        result = await RAGAgent.database_rag("Does atorvastatin cause muscle pain?", "test-user-id")
+        other = await RAGAgent.database_rag("Does atorvastatin cause muscle pain?", "other-user-id")
+
+    assert result["response"] == "This is a test response"
+    assert "Statins" in result["sources"] and "Atorvastatin" in result["sources"]
+    # Only the other patient, without a bundle, needed the search
+    mock_supabase.rpc.assert_called_once()
+    assert other["sources"] != result["sources"]
+
+@pytest.mark.asyncio
+async def test_bundle_warmed_during_shared_answer_is_not_shared(mock_llama_index, mock_supabase):
+    """Test that a bundle built while a coalesced answer runs never reaches the other callers"""
+    bundle = PatientContext("patient-a", [], [{"title": "Patient A statins", "content": "Atorvastatin can cause muscle pain."}])
+    entity_nodes = agent._entity_nodes
+
+    async def warm_during_match(query):
+        result = await entity_nodes(query)
+        patient_contexts._cache.set("patient-a", bundle)
+        await asyncio.sleep(0.01)
+        return result
+
+    with patch('agent._entity_nodes', side_effect=warm_during_match):
+        first, second = await asyncio.gather(
+            RAGAgent.database_rag("Can atorvastatin cause muscle pain?", "patient-a"),
+            RAGAgent.database_rag("Can atorvastatin cause muscle pain?", "patient-c"),
+        )
+
+    assert "Patient A statins" not in second["sources"]
+    assert first == second
+
+def test_login_warms_patient_context(test_client, test_user, mock_supabase):
+    """Test that a successful login builds the patient's bundle in the background"""
+    user = dict(test_user, diagnosis="Type 2 Diabetes", prescription="Atorvastatin")
+    mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[user])
+
+    with patch('app.verify_password', return_value=True), \
+         patch('app.patient_contexts.warm') as warm:
+        response = test_client.post("/token", data={"username": "testuser", "password": "password"})
+
+    assert response.status_code == 200
+    warm.assert_called_once_with({"id": "test-user-id", "diagnosis": "Type 2 Diabetes", "prescription": "Atorvastatin"})
@@ -0,0 +1,88 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent import RAGAgent
+from chunking import count_tokens
+from rerank import compress, rerank, split_sentences, trim_sentences, terms
+
+FILLER = " ".join(f"Unrelated remark number {i} about the weather." for i in range(40))
+
+def test_rerank_blends_lexical_and_retrieval_scores():
+    """Test that a candidate naming the query terms moves above closer embeddings"""
+    texts = [
+        "General advice on staying healthy.",
+        "Atorvastatin can cause muscle pain.",
+        "Drink water and rest.",
+    ]
+
+    assert rerank("atorvastatin muscle pain", texts, [0.9, 0.8, 0.7]) == [1, 0, 2]
+    assert rerank("hydration", texts, [0.9, 0.8, 0.7]) == [0, 1, 2]
+
+def test_compress_drops_redundant_chunks():
+    """Test that overlapping chunks and candidates beyond top_n are left out"""
+    texts = [
+        "Asthma is a chronic condition of the airways causing wheezing.",
+        "Asthma is a chronic condition of the airways causing wheezing and coughing.",
+        "Inhalers relieve asthma symptoms quickly.",
+        "Migraine causes headaches.",
+    ]
+
+    result = compress("asthma airways", texts, [0.9, 0.85, 0.8, 0.1], top_n=2)
+
+    assert result.indices == [0, 2]
+    assert result.texts == [texts[0], texts[2]]
+    assert result.context_tokens == count_tokens(texts[0]) + count_tokens(texts[2])
+
+def test_compress_trims_to_budget():
+    """Test that a chunk overflowing the budget keeps its relevant sentences"""
+    long_text = f"{FILLER} Atorvastatin lowers LDL cholesterol. {FILLER}"
+    texts = [long_text, "Statins are taken once a day."]
+
+    result = compress("atorvastatin cholesterol", texts, [0.9, 0.8], top_n=2, budget=100)
+
+    assert result.context_tokens <= 100
+    assert "Atorvastatin lowers LDL cholesterol." in result.texts[0]
+    assert result.baseline_tokens == count_tokens(long_text) + count_tokens(texts[1])
+    assert result.saved_tokens == result.baseline_tokens - result.context_tokens
+
+def test_compress_never_exceeds_budget():
+    """Test that a trimmed chunk counting more than the room left is dropped, not sent over budget"""
+    texts = ["Statins are taken once a day.", f"{FILLER} Atorvastatin lowers LDL cholesterol."]
+
+    with patch('rerank.trim_sentences', side_effect=lambda query_terms, text, max_tokens: text + " Extra."):
+        result = compress("statins", texts, [0.9, 0.8], top_n=2, budget=50)
+
+    assert result.indices == [0]
+    assert result.context_tokens <= 50
+
+def test_trim_sentences_keeps_order():
+    """Test that trimmed sentences stay in their original order"""
+    text = "Dose is 10 mg. The sky is blue. Take the dose at night."
+
+    trimmed = trim_sentences(set(terms("dose")), text, count_tokens("Dose is 10 mg. Take the dose at night."))
+
+    assert split_sentences(trimmed) == ["Dose is 10 mg.", "Take the dose at night."]
+
+@pytest.mark.asyncio
+async def test_database_rag_sends_compressed_context(mock_llama_index, mock_supabase):
+    """Test that the LLM sees the reranked, deduplicated rows and sources match them"""
+    mock_response = MagicMock()
+    mock_response.data = [
+        {"id": 1, "title": "Weather", "content": FILLER, "similarity": 0.9},
+        {"id": 2, "title": "Asthma", "content": "Asthma inhalers open the airways.", "similarity": 0.8},
+        {"id": 3, "title": "Asthma copy", "content": "Asthma inhalers open the airways.", "similarity": 0.7},
+    ]
+    mock_supabase.rpc.return_value.execute.return_value = mock_response
+
+    with patch('llama_index.core.get_response_synthesizer') as mock_synthesizer, \
+         patch('rerank.RERANK_LEXICAL_WEIGHT', 0.8):
+        mock_synthesizer.return_value.synthesize.return_value = "Use your inhaler."
+        result = await RAGAgent.database_rag("asthma inhalers", "test-user-id", top_k=2)
+
+    assert result["sources"] == ["Asthma", "Weather"]
+    _, nodes = mock_synthesizer.return_value.synthesize.call_args.args
+    assert [node.node.metadata["id"] for node in nodes] == [2, 1]
@@ -0,0 +1,86 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrieval import search_rag_documents, search_rag_documents_batch
+from benchmarks.fakes import FakeSupabase, hashed_embedding
+
+def test_hybrid_search_is_one_rpc():
+    """Test that hybrid retrieval runs as a single database function call"""
+    client = MagicMock()
+    client.rpc.return_value.execute.return_value.data = [{"id": 1}]
+    
+    rows = search_rag_documents(client, [0.1, 0.2], 3, "cardiology", ["statins"], query_text="atorvastatin dose")
+    
+    assert rows == [{"id": 1}]
+    client.rpc.assert_called_once()
+    function_name, params = client.rpc.call_args.args
+    assert function_name == "hybrid_search_rag_documents"
+    assert params["query_text"] == "atorvastatin dose"
+    assert params["match_count"] == 3
+    assert params["filter_category"] == "cardiology"
+    assert params["filter_tags"] == ["statins"]
+
+def test_vector_search_without_query_text():
+    """Test that the pure similarity search is used when hybrid search is off"""
+    client = MagicMock()
+    client.rpc.return_value.execute.return_value.data = None
+    
+    with patch('retrieval.RAG_HYBRID_SEARCH', False):
+        rows = search_rag_documents(client, [0.1, 0.2], query_text="atorvastatin")
+    
+    assert rows == []
+    function_name, params = client.rpc.call_args.args
+    assert function_name == "match_rag_documents"
+    assert "query_text" not in params
+
+def test_hybrid_search_finds_exact_terms():
+    """Test that an exact drug name is retrieved even when embeddings disagree"""
+    db = FakeSupabase()
+    for i in range(20):
+        db.add_row("rag_documents", {
+            "title": f"General advice {i}",
+            "content": f"Stay hydrated and rest, note {i}.",
+            "category": "general",
+            "embedding": hashed_embedding(f"general {i}", 64),
+        })
+    target = db.add_row("rag_documents", {
+        "title": "Atorvastatin",
+        "content": "Atorvastatin lowers cholesterol.",
+        "category": "general",
+        "embedding": hashed_embedding("unrelated", 64),
+    })
+    
+    query_embedding = hashed_embedding("general 3", 64)
+    vector_only = search_rag_documents(db, query_embedding, 3, "general")
+    hybrid = search_rag_documents(db, query_embedding, 3, "general", query_text="atorvastatin side effects")
+    
+    assert target["id"] not in [row["id"] for row in vector_only]
+    assert target["id"] in [row["id"] for row in hybrid]
+    assert all(row["category"] == "general" for row in hybrid)
+
+def test_batch_search_groups_rows_by_query():
+    """Test that several queries are searched in one call and answered in order"""
+    db = FakeSupabase()
+    for name in ("Asthma", "Atorvastatin", "Migraine"):
+        db.add_row("rag_documents", {
+            "title": name,
+            "content": f"{name} overview.",
+            "category": "general",
+            "embedding": hashed_embedding(name, 64),
+        })
+    
+    with patch.object(db, 'rpc', wraps=db.rpc) as rpc:
+        results = search_rag_documents_batch(
+            db, [hashed_embedding("Migraine", 64), hashed_embedding("Asthma", 64)],
+            ["migraine", "asthma"], 1, "general"
+        )
+    
+    rpc.assert_called_once()
+    assert rpc.call_args.args[0] == "hybrid_search_rag_documents_batch"
+    assert [[row["title"] for row in rows] for rows in results] == [["Migraine"], ["Asthma"]]
+    assert all("query_index" not in row for rows in results for row in rows)
+    assert search_rag_documents_batch(db, [], []) == []
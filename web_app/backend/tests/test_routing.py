@@ -0,0 +1,89 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent import RAGAgent
+from clients import LLM_MODEL
+from routing import LLM_FAST_MODEL, is_low_confidence, route_query, term_coverage
+
+CONTEXT = ["Atorvastatin is taken once a day. Common side effects include muscle pain."]
+
+def test_route_query_rules():
+    """Test that simple, covered questions go to the fast model and the rest to the large one"""
+    assert route_query("Atorvastatin side effects?", CONTEXT).model == LLM_FAST_MODEL
+    assert route_query("What does my prescription mean?", [], grounded=True).reason == "grounded"
+    assert route_query("Why does atorvastatin cause muscle pain?", CONTEXT).reason == "complex_marker"
+    assert route_query("Compare atorvastatin and rosuvastatin", CONTEXT).model == LLM_MODEL
+    assert route_query("Atorvastatin dose? And side effects?", CONTEXT).reason == "multiple_questions"
+    assert route_query(" ".join(["atorvastatin"] * 30), CONTEXT).reason == "long_query"
+    assert route_query("Ibuprofen with alcohol", CONTEXT).reason == "weak_grounding"
+    with patch('routing.ROUTER_ENABLED', False):
+        assert route_query("Atorvastatin side effects?", CONTEXT).model == LLM_MODEL
+
+def test_term_coverage_and_confidence():
+    """Test the grounding and low-confidence checks"""
+    assert term_coverage("atorvastatin muscle pain", CONTEXT) == 1.0
+    assert term_coverage("atorvastatin kidney", CONTEXT) == 0.5
+    assert is_low_confidence("")
+    assert is_low_confidence("I’m sorry, the context does not provide the dose.")
+    assert not is_low_confidence("Take 10 mg once a day.")
+
+def synthesizer_by_model(answers):
+    """Mocked get_response_synthesizer answering with the text given for the LLM's model"""
+    def get_synthesizer(llm=None, streaming=False):
+        synthesizer = MagicMock()
+        answer = answers[llm.model]
+        if streaming:
+            synthesizer.synthesize.side_effect = lambda query, nodes: MagicMock(response_gen=iter(answer))
+        else:
+            synthesizer.synthesize.return_value = "".join(answer)
+        return synthesizer
+    return get_synthesizer
+
+@pytest.mark.asyncio
+async def test_low_confidence_answer_falls_back(mock_llama_index, mock_supabase):
+    """Test that a hedging fast-model answer is replaced by the large model's"""
+    mock_supabase.rpc.return_value.execute.return_value.data = [
+        {"id": 1, "title": "Statins", "content": CONTEXT[0], "similarity": 0.9}
+    ]
+    answers = {LLM_FAST_MODEL: ["I don't know."], LLM_MODEL: ["Muscle pain."]}
+
+    with patch('llama_index.core.get_response_synthesizer', side_effect=synthesizer_by_model(answers)) as get_synthesizer:
+        result = await RAGAgent.database_rag("Atorvastatin side effects?", "test-user-id")
+
+    assert result == {"response": "Muscle pain.", "sources": ["Statins"], "model": LLM_MODEL}
+    assert [call.kwargs["llm"].model for call in get_synthesizer.call_args_list] == [LLM_FAST_MODEL, LLM_MODEL]
+
+@pytest.mark.asyncio
+async def test_streamed_fallback_sends_only_the_large_answer(mock_llama_index, mock_supabase):
+    """Test that a hedging streamed answer is held back and replaced"""
+    mock_supabase.rpc.return_value.execute.return_value.data = [
+        {"id": 1, "title": "Statins", "content": CONTEXT[0], "similarity": 0.9}
+    ]
+    answers = {LLM_FAST_MODEL: ["The context ", "does not ", "mention it."], LLM_MODEL: ["Muscle ", "pain."]}
+
+    with patch('llama_index.core.get_response_synthesizer', side_effect=synthesizer_by_model(answers)):
+        events = [event async for event in RAGAgent.database_rag_stream("Atorvastatin side effects?", "test-user-id")]
+
+    assert events == [
+        ("token", "Muscle "),
+        ("token", "pain."),
+        ("sources", {"sources": ["Statins"], "model": LLM_MODEL}),
+    ]
+
+@pytest.mark.asyncio
+async def test_confident_fast_answer_streams(mock_llama_index, mock_supabase):
+    """Test that a confident fast-model answer is streamed as is"""
+    mock_supabase.rpc.return_value.execute.return_value.data = [
+        {"id": 1, "title": "Statins", "content": CONTEXT[0], "similarity": 0.9}
+    ]
+    answers = {LLM_FAST_MODEL: ["Muscle ", "pain."], LLM_MODEL: ["Unused."]}
+
+    with patch('llama_index.core.get_response_synthesizer', side_effect=synthesizer_by_model(answers)):
+        events = [event async for event in RAGAgent.database_rag_stream("Atorvastatin side effects?", "test-user-id")]
+
+    assert events[-1] == ("sources", {"sources": ["Statins"], "model": LLM_FAST_MODEL})
+    assert "".join(data for event, data in events if event == "token") == "Muscle pain."
@@ -0,0 +1,84 @@
+import json
+import subprocess
+import pytest
+from unittest.mock import patch
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import clients
+from clients import warm_up, warmup_state
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budget for importing the app in a fresh interpreter
+IMPORT_BUDGET_SECONDS = float(os.getenv("STARTUP_IMPORT_BUDGET_SECONDS", "2.5"))
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "loaded": [name for name in ("llama_index", "supabase", "openai") if name in sys.modules],
+}))
+"""
+
+def test_import_is_lazy_and_within_budget():
+    """Test that importing the app neither loads the heavy clients nor needs their settings"""
+    env = {
+        key: value for key, value in os.environ.items()
+        if not key.startswith(("SUPABASE_", "OPENAI_"))
+    }
+    env["JWT_SECRET_KEY"] = "test-secret"
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report["loaded"] == []
+    assert report["seconds"] < IMPORT_BUDGET_SECONDS
+
+def test_get_supabase_client_requires_settings():
+    """Test that a missing Supabase setting fails only when the client is needed"""
+    with patch('clients._supabase_client', None), \
+         patch.dict(os.environ, {"SUPABASE_URL": "", "SUPABASE_KEY": ""}):
+        with pytest.raises(RuntimeError):
+            clients.get_supabase_client()
+
+def test_warm_up_marks_worker_ready():
+    """Test that warm-up builds the clients and records readiness"""
+    with patch('clients.configure_llama_index') as mock_configure, \
+         patch('clients.get_supabase_client') as mock_client, \
+         patch.dict(warmup_state, {"ready": False, "error": None, "seconds": None}):
+        warm_up()
+
+        mock_configure.assert_called_once()
+        mock_client.assert_called_once()
+        assert warmup_state["ready"] is True
+        assert warmup_state["seconds"] is not None
+
+def test_warm_up_records_failure():
+    """Test that a failed warm-up leaves the worker unready with the error"""
+    with patch('clients.configure_llama_index'), \
+         patch('clients.get_supabase_client', side_effect=RuntimeError("no database")), \
+         patch.dict(warmup_state, {"ready": True, "error": None, "seconds": None}):
+        warm_up()
+
+        assert warmup_state["ready"] is False
+        assert warmup_state["error"] == "no database"
+
+def test_readiness_probe(test_client):
+    """Test that /readyz follows the warm-up state while /healthz is always up"""
+    with patch.dict(warmup_state, {"ready": False, "error": None, "seconds": None}):
+        assert test_client.get("/healthz").status_code == 200
+        assert test_client.get("/readyz").status_code == 503
+
+        warmup_state["ready"] = True
+        response = test_client.get("/readyz")
+
+        assert response.status_code == 200
+        assert response.json()["ready"] is True
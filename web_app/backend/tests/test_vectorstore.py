@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vectorstore import MmapVectorStore, store_name
+
+def put_page(store, url, version, texts, directions):
+    return store.put(url, version, texts, [np.eye(4)[i] for i in directions], metadata={"url": url})
+
+def test_search_reads_requested_documents(tmp_path):
+    """Test that search ranks chunks of the requested documents only"""
+    store = MmapVectorStore(str(tmp_path))
+    put_page(store, "https://a", "v1", ["a0", "a1"], [0, 1])
+    put_page(store, "https://b", "v1", ["b0"], [2])
+
+    results = store.search([("https://a", "v1")], [0.1, 0.9, 0.5, 0], top_k=5)
+
+    assert [(segment.key, index) for segment, index, _ in results] == [("https://a", 1), ("https://a", 0)]
+    assert results[0][2] > results[1][2]
+    assert store.search([("https://a", "old")], [1, 0, 0, 0], top_k=5) == []
+
+def test_vectors_are_memory_mapped(tmp_path):
+    """Test that document rows are views into the mapped file"""
+    store = MmapVectorStore(str(tmp_path))
+    segment = put_page(store, "https://a", "v1", ["a0", "a1"], [0, 1])
+
+    vectors = store.vectors(segment)
+
+    assert isinstance(vectors, np.memmap)
+    assert not vectors.flags.writeable
+    assert np.allclose(vectors, np.eye(4)[:2])
+    assert store.texts(segment) == ["a0", "a1"]
+
+def test_other_workers_see_appends(tmp_path):
+    """Test that a second store on the same directory reads what the first wrote"""
+    writer = MmapVectorStore(str(tmp_path))
+    reader = MmapVectorStore(str(tmp_path))
+    put_page(writer, "https://a", "v1", ["a0"], [0])
+    assert reader.get("https://a").version == "v1"
+
+    put_page(writer, "https://b", "v1", ["b0 ünïcode"], [1])
+    segment = reader.get("https://b")
+
+    assert reader.texts(segment) == ["b0 ünïcode"]
+    assert np.allclose(reader.vectors(segment), [np.eye(4)[1]])
+
+def test_replace_and_compact(tmp_path):
+    """Test that compaction drops replaced and deleted rows without disturbing readers"""
+    store = MmapVectorStore(str(tmp_path), compact_ratio=0.5)
+    reader = MmapVectorStore(str(tmp_path))
+    put_page(store, "https://a", "v1", ["old 0", "old 1"], [0, 1])
+    put_page(store, "https://b", "v1", ["b0"], [2])
+    put_page(store, "https://c", "v1", ["c0"], [3])
+    store.delete("https://c")
+    assert reader.get("https://b") is not None
+    assert store.maybe_compact() is False
+
+    put_page(store, "https://a", "v2", ["new 0"], [0])
+    assert store.stats() == {"documents": 2, "rows": 5, "live_rows": 2}
+    assert store.maybe_compact() is True
+
+    assert store.stats() == {"documents": 2, "rows": 2, "live_rows": 2}
+    results = reader.search([("https://a", "v2"), ("https://b", "v1")], [1, 0, 0, 0], top_k=1)
+    assert reader.texts(results[0][0]) == ["new 0"]
+    assert reader.get("https://c") is None
+
+def test_compaction_keeps_newest_documents(tmp_path):
+    """Test that the store is bounded to the most recently written documents"""
+    store = MmapVectorStore(str(tmp_path), max_documents=2)
+    for i in range(4):
+        put_page(store, f"https://{i}", "v1", [f"page {i}"], [i])
+
+    assert store.maybe_compact() is True
+    assert [store.get(f"https://{i}") is not None for i in range(4)] == [False, False, True, True]
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("g")]) == 2
+
+def test_rejects_mismatched_dimensions(tmp_path):
+    """Test that vectors from another model cannot be mixed into a store"""
+    store = MmapVectorStore(str(tmp_path))
+    put_page(store, "https://a", "v1", ["a0"], [0])
+
+    with pytest.raises(ValueError):
+        store.put("https://b", "v1", ["b0"], [[1.0, 0.0]])
+
+def test_llama_index_view(tmp_path):
+    """Test that a VectorStoreIndex over the view retrieves stored chunks"""
+    from llama_index.core import VectorStoreIndex
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.schema import QueryBundle
+    from shared_index import SharedVectorStoreView
+
+    store = MmapVectorStore(str(tmp_path / store_name("openai:text-embedding-ada-002")))
+    put_page(store, "https://a", "v1", ["Paris is the capital.", "Lyon is a city."], [0, 1])
+    index = VectorStoreIndex.from_vector_store(
+        SharedVectorStoreView(store, [("https://a", "v1")]), embed_model=MockEmbedding(embed_dim=4)
+    )
+
+    nodes = index.as_retriever(similarity_top_k=1).retrieve(QueryBundle("capital?", embedding=[1, 0, 0, 0]))
+
+    assert [node.node.get_content() for node in nodes] == ["Paris is the capital."]
+    assert nodes[0].node.metadata == {"url": "https://a"}
+    assert nodes[0].score == pytest.approx(1.0)
@@ -0,0 +1,107 @@
+import jwt
+import pytest
+from datetime import timedelta
+from fastapi import WebSocketDisconnect
+from unittest.mock import patch
+
+# Import your application
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import history
+from app import create_access_token, user_claims
+from benchmarks.fakes import FakeSupabase
+
+@pytest.fixture
+def fake_db():
+    db = FakeSupabase()
+    with patch('clients._supabase_client', new=db):
+        history.summary_cache.clear()
+        yield db
+
+async def fake_stream(query, urls, history=None):
+    for token in ("The ", "answer."):
+        yield "token", token
+    yield "sources", {"source_urls": urls}
+
+def test_chat_socket_streams_and_records_turns(test_client, test_user, fake_db):
+    """Test that one authenticated socket answers several turns and records them"""
+    token = create_access_token(user_claims(test_user))
+
+    with patch('app.RAGAgent.browser_rag_stream', side_effect=fake_stream), \
+         patch('app.jwt.decode', wraps=jwt.decode) as decode:
+        with test_client.websocket_connect("/ws/chat") as websocket:
+            websocket.send_json({"token": token})
+            assert websocket.receive_json() == {"type": "ready"}
+
+            frames = []
+            for turn in ("1", "2"):
+                websocket.send_json({"id": turn, "query": f"Question {turn}?", "urls": ["https://example.com"]})
+                while not frames or frames[-1]["type"] != "done":
+                    frames.append(websocket.receive_json())
+                frames.append({"type": "next"})
+
+    decode.assert_called_once()
+    assert frames[:4] == [
+        {"type": "token", "id": "1", "data": "The "},
+        {"type": "token", "id": "1", "data": "answer."},
+        {"type": "sources", "id": "1", "data": {"source_urls": ["https://example.com"]}},
+        {"type": "done", "id": "1"},
+    ]
+    assert frames[8] == {"type": "done", "id": "2"}
+    # Turns are buffered, then written in one batch
+    assert len(history.message_writer.pending(test_user["id"])) == 4
+    assert test_client.portal.call(history.message_writer.flush) == 4
+    rows = fake_db.tables["messages"]
+    assert [(row["message"], row["is_ai_response"]) for row in rows] == [
+        ("Question 1?", False), ("The answer.", True), ("Question 2?", False), ("The answer.", True)
+    ]
+    assert all(row["user_id"] == test_user["id"] for row in rows)
+
+def test_chat_socket_rejects_bad_token(test_client, fake_db):
+    """Test that a connection without a valid token is closed"""
+    with test_client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"token": "not-a-token"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+
+    assert closed.value.code == 1008
+
+def test_chat_socket_reports_errors_per_turn(test_client, test_user, fake_db):
+    """Test that invalid messages and failed turns keep the connection open"""
+    token = create_access_token(user_claims(test_user))
+
+    async def broken(**kwargs):
+        raise RuntimeError("Search unavailable")
+        yield
+
+    with patch('app.RAGAgent.database_rag_stream', side_effect=broken), \
+         patch('app.RAGAgent.browser_rag_stream', side_effect=fake_stream):
+        with test_client.websocket_connect("/ws/chat") as websocket:
+            websocket.send_json({"token": token})
+            websocket.receive_json()
+
+            websocket.send_json({"id": "1"})
+            invalid = websocket.receive_json()
+            websocket.send_json({"id": "2", "query": "What?", "use_history": False})
+            failed = websocket.receive_json()
+            websocket.send_json({"id": "3", "query": "What?", "urls": ["https://example.com"], "use_history": False})
+            answered = websocket.receive_json()
+
+    assert invalid["type"] == "error" and invalid["detail"][0]["loc"] == ["query"]
+    assert failed == {"type": "error", "id": "2", "detail": "Search unavailable"}
+    assert answered == {"type": "token", "id": "3", "data": "The "}
+
+def test_chat_socket_closes_on_expired_token(test_client, test_user, fake_db):
+    """Test that a turn after the token expires closes the connection"""
+    token = create_access_token(user_claims(test_user), timedelta(seconds=5))
+
+    with test_client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"token": token})
+        websocket.receive_json()
+        with patch('app.time.time', return_value=jwt.decode(token, options={"verify_signature": False})["exp"]):
+            websocket.send_json({"query": "What?"})
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+
+    assert closed.value.code == 1008
@@ -0,0 +1,378 @@
+"""
+Memory-mapped vector store shared by every worker on a host.
+
+Chunk vectors live in one contiguous float32 file and chunk texts in one byte
+file. Both are append-only and mapped read-only into each worker, so N workers
+share a single copy in the page cache instead of each building its own
+in-memory index. A JSON-lines sidecar records where every document's rows and
+texts start; the latest record for a key wins, so replacing or deleting a
+document is an append too.
+
+    <directory>/CURRENT                        name of the live generation
+    <directory>/<generation>/vectors.f32       unit-length rows of ``dim`` float32
+    <directory>/<generation>/texts.bin         UTF-8 chunk texts, back to back
+    <directory>/<generation>/segments.jsonl    one record per put / delete
+
+Writers serialise on a lock file. Readers notice appends by file size and
+compactions by CURRENT changing. Compaction copies the live documents into a
+new generation and switches CURRENT atomically, so a reader never sees a
+half-written store.
+"""
+import asyncio
+import json
+import mmap
+import os
+import re
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import executor
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers in one process are still serialised
+    fcntl = None
+
+VECTOR_STORE_COMPACT_INTERVAL_SECONDS = float(os.getenv("VECTOR_STORE_COMPACT_INTERVAL_SECONDS", "300"))
+
+_GENERATION = re.compile(r"^g(\d{6})$")
+
+
+@dataclass(frozen=True)
+class Segment:
+    """
+    Where one document's chunks are in the store
+    """
+    key: str
+    version: str
+    start: int
+    count: int
+    dim: Optional[int]
+    text_offsets: Tuple[int, ...]
+    metadata: Dict[str, Any] = field(default_factory=dict, compare=False)
+
+
+def store_name(model_id: str) -> str:
+    """
+    Directory name for the vectors of one embedding model
+    """
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_id)
+
+
+def _unit_rows(matrix: Any) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+class MmapVectorStore:
+    """
+    Append-only, memory-mapped store of document chunk vectors and texts.
+
+    Documents are keyed (by URL for pages) and carry a version (their content
+    hash); ``search`` only reads the rows of the requested key / version pairs.
+    ``compact`` drops replaced and deleted rows and keeps the newest
+    ``max_documents`` documents.
+    """
+
+    def __init__(self, directory: str, max_documents: int = 4096, compact_ratio: float = 0.5):
+        self.directory = directory
+        self.max_documents = max_documents
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._generation: Optional[str] = None
+        self._segments: Dict[str, Segment] = {}
+        self._segments_offset = 0
+        self._rows = 0
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._texts: Optional[mmap.mmap] = None
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path("lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(self._path("CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _reset(self, generation: Optional[str]) -> None:
+        self._generation = generation
+        self._segments, self._segments_offset = {}, 0
+        self._rows, self._dim = 0, None
+        self._vectors, self._texts = None, None
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        if record.get("deleted"):
+            self._segments.pop(record["key"], None)
+            return
+        segment = Segment(
+            key=record["key"],
+            version=record["version"],
+            start=record["start"],
+            count=record["count"],
+            dim=record.get("dim"),
+            text_offsets=tuple(record["text_offsets"]),
+            metadata=record.get("metadata") or {},
+        )
+        self._segments[segment.key] = segment
+        self._rows = max(self._rows, segment.start + segment.count)
+        if segment.dim:
+            self._dim = segment.dim
+
+    def _refresh(self) -> None:
+        """
+        Pick up records appended, or a compaction finished, by any worker
+        """
+        with self._lock:
+            generation = self._read_current()
+            if generation != self._generation:
+                self._reset(generation)
+            if generation is None:
+                return
+            path = self._path(generation, "segments.jsonl")
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                return
+            if size <= self._segments_offset:
+                return
+            with open(path, "rb") as f:
+                f.seek(self._segments_offset)
+                data = f.read(size - self._segments_offset)
+            # A record still being written has no newline yet
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                if line.strip():
+                    self._apply(json.loads(line))
+            self._segments_offset += end
+
+    def _maps(self) -> Tuple[Optional[np.ndarray], Optional[mmap.mmap]]:
+        """
+        Read-only maps covering every known record, re-mapped after the files grew
+        """
+        with self._lock:
+            if self._dim and (self._vectors is None or len(self._vectors) < self._rows):
+                path = self._path(self._generation, "vectors.f32")
+                rows = os.path.getsize(path) // (self._dim * 4)
+                self._vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+            text_end = max((segment.text_offsets[-1] for segment in self._segments.values()), default=0)
+            if text_end and (self._texts is None or len(self._texts) < text_end):
+                with open(self._path(self._generation, "texts.bin"), "rb") as f:
+                    self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._vectors, self._texts
+
+    def get(self, key: str) -> Optional[Segment]:
+        self._refresh()
+        return self._segments.get(key)
+
+    def vectors(self, segment: Segment) -> np.ndarray:
+        """
+        The document's rows, as a view into the mapped file (nothing is copied)
+        """
+        if not segment.count:
+            return np.zeros((0, segment.dim or 0), dtype=np.float32)
+        vectors, _ = self._maps()
+        return vectors[segment.start:segment.start + segment.count]
+
+    def texts(self, segment: Segment) -> List[str]:
+        if not segment.count:
+            return []
+        _, texts = self._maps()
+        offsets = segment.text_offsets
+        return [texts[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(segment.count)]
+
+    def _new_generation(self) -> str:
+        numbers = [int(match.group(1)) for name in os.listdir(self.directory) if (match := _GENERATION.match(name))]
+        generation = f"g{max(numbers, default=0) + 1:06d}"
+        os.makedirs(self._path(generation))
+        return generation
+
+    def _switch(self, generation: str) -> None:
+        tmp_path = self._path(f"CURRENT.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(generation)
+        os.replace(tmp_path, self._path("CURRENT"))
+
+    def _append_record(self, record: Dict[str, Any]) -> None:
+        with open(self._path(self._generation, "segments.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def put(self, key: str, version: str, texts: Sequence[str], embeddings: Any,
+            metadata: Optional[Dict[str, Any]] = None) -> Segment:
+        """
+        Append a document's chunks, replacing any earlier version of it
+        """
+        matrix = _unit_rows(embeddings) if len(texts) else np.zeros((0, 0), dtype=np.float32)
+        if len(matrix) != len(texts):
+            raise ValueError("Need one embedding per text")
+        encoded = [text.encode("utf-8") for text in texts]
+
+        with self._write_lock():
+            self._refresh()
+            if self._generation is None:
+                self._switch(self._new_generation())
+                self._refresh()
+            dim = matrix.shape[1] if len(texts) else None
+            if dim and self._dim and dim != self._dim:
+                raise ValueError(f"Expected {self._dim}-dimensional embeddings, got {dim}")
+
+            with open(self._path(self._generation, "vectors.f32"), "ab") as f:
+                start = os.fstat(f.fileno()).st_size // (dim * 4) if dim else self._rows
+                f.write(matrix.tobytes())
+            with open(self._path(self._generation, "texts.bin"), "ab") as f:
+                text_start = os.fstat(f.fileno()).st_size
+                f.write(b"".join(encoded))
+            offsets = np.concatenate([[0], np.cumsum([len(text) for text in encoded], dtype=np.int64)]) + text_start
+            self._append_record({
+                "key": key,
+                "version": version,
+                "start": int(start),
+                "count": len(texts),
+                "dim": dim,
+                "text_offsets": offsets.tolist(),
+                "metadata": metadata or {},
+            })
+            self._refresh()
+            return self._segments[key]
+
+    def delete(self, key: str) -> None:
+        with self._write_lock():
+            self._refresh()
+            if key in self._segments:
+                self._append_record({"key": key, "deleted": True})
+                self._refresh()
+
+    def search(self, documents: Sequence[Tuple[str, str]], query_embedding: Any,
+               top_k: int) -> List[Tuple[Segment, int, float]]:
+        """
+        Best ``top_k`` chunks of the given (key, version) documents by cosine similarity.
+
+        Returns (segment, chunk index, score) triples, best first.
+        """
+        self._refresh()
+        with self._lock:
+            segments = [
+                segment for key, version in documents
+                if (segment := self._segments.get(key)) is not None and segment.version == version and segment.count
+            ]
+            if not segments:
+                return []
+            vectors, _ = self._maps()
+
+        query = _unit_rows(query_embedding)[0]
+        scores = np.concatenate([vectors[segment.start:segment.start + segment.count] @ query for segment in segments])
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        # Position in the concatenated scores -> (segment, chunk index)
+        ends = np.cumsum([segment.count for segment in segments])
+        results = []
+        for position in best:
+            which = int(np.searchsorted(ends, position, side="right"))
+            first = ends[which] - segments[which].count
+            results.append((segments[which], int(position - first), float(scores[position])))
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        self._refresh()
+        with self._lock:
+            return {
+                "documents": len(self._segments),
+                "rows": self._rows,
+                "live_rows": sum(segment.count for segment in self._segments.values()),
+            }
+
+    def _needs_compaction(self) -> bool:
+        stats = self.stats()
+        dead = stats["rows"] - stats["live_rows"]
+        return stats["documents"] > self.max_documents or (dead > 0 and dead >= self.compact_ratio * stats["rows"])
+
+    def compact(self) -> None:
+        """
+        Rewrite the newest ``max_documents`` live documents into a new generation
+        """
+        with self._write_lock():
+            self._compact()
+
+    def maybe_compact(self) -> bool:
+        """
+        Compact if enough rows are dead or there are too many documents
+        """
+        if self._read_current() is None:
+            return False
+        with self._write_lock():
+            # Another worker may have compacted while this one waited for the lock
+            if not self._needs_compaction():
+                return False
+            self._compact()
+            return True
+
+    def _compact(self) -> None:
+        self._refresh()
+        if self._generation is None:
+            return
+        previous = self._generation
+        live = sorted(self._segments.values(), key=lambda segment: segment.start)[-self.max_documents:]
+        vectors, texts = self._maps()
+        generation = self._new_generation()
+
+        row, text_offset = 0, 0
+        with open(self._path(generation, "vectors.f32"), "wb") as vector_file, \
+             open(self._path(generation, "texts.bin"), "wb") as text_file, \
+             open(self._path(generation, "segments.jsonl"), "w", encoding="utf-8") as segment_file:
+            for segment in live:
+                if segment.count:
+                    vector_file.write(np.ascontiguousarray(vectors[segment.start:segment.start + segment.count]).tobytes())
+                    text_file.write(texts[segment.text_offsets[0]:segment.text_offsets[-1]])
+                shift = text_offset - segment.text_offsets[0]
+                segment_file.write(json.dumps({
+                    "key": segment.key,
+                    "version": segment.version,
+                    "start": row,
+                    "count": segment.count,
+                    "dim": segment.dim,
+                    "text_offsets": [offset + shift for offset in segment.text_offsets],
+                    "metadata": segment.metadata,
+                }) + "\n")
+                row += segment.count
+                text_offset += segment.text_offsets[-1] - segment.text_offsets[0]
+            for f in (vector_file, text_file, segment_file):
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._switch(generation)
+        self._refresh()
+        # Keep the previous generation for readers that have not switched yet
+        for name in os.listdir(self.directory):
+            if _GENERATION.match(name) and name not in (generation, previous):
+                for file_name in os.listdir(self._path(name)):
+                    os.remove(self._path(name, file_name))
+                os.rmdir(self._path(name))
+
+    async def run(self, interval: float = VECTOR_STORE_COMPACT_INTERVAL_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await executor.run_io(self.maybe_compact)
+            except Exception:
+                pass
@@ -1,19 +1,38 @@
 import { NextResponse } from 'next/server';
 
+const BACKEND_URL = 'http://127.0.0.1:8000';
+
 export async function POST(request: Request) {
   try {
     const body = await request.json();
+    const endpoint = body.urls?.length ? '/browser-rag/stream' : '/database-rag/stream';
     
-    const response = await fetch('http://127.0.0.1:8000/api/chat', {
+    const response = await fetch(`${BACKEND_URL}${endpoint}`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(body),
+      headers: {
+        'Content-Type': 'application/json',
+        Authorization: request.headers.get('Authorization') ?? '',
+      },
+      // Chat turns are answered in the context of, and saved to, the conversation history
+      body: JSON.stringify({ use_history: true, ...body }),
     });
     
+    // Pass server-sent events straight through instead of buffering the whole answer
+    if (response.ok && response.body && response.headers.get('Content-Type')?.includes('text/event-stream')) {
+      return new Response(response.body, {
+        status: response.status,
+        headers: {
+          'Content-Type': 'text/event-stream',
+          'Cache-Control': 'no-cache, no-transform',
+          Connection: 'keep-alive',
+        },
+      });
+    }
+    
     const data = await response.json();
     return NextResponse.json(data, { status: response.status });
   } catch (error) {
-    return NextResponse.json({ error: 'Failed to login' }, { status: 500 });
     console.log(error)
+    return NextResponse.json({ error: 'Failed to chat' }, { status: 500 });
   }
-}
\ No newline at end of file
+}
@@ -0,0 +1,49 @@
+/**
+ * VECTOR SEARCH OVER RAG DOCUMENTS
+ * Lets the backend embed only the query and fetch the top-k documents,
+ * instead of pulling whole collections and re-embedding them per request.
+ */
+
+-- Approximate nearest-neighbour index for cosine distance
+create index if not exists rag_documents_embedding_hnsw_idx
+  on public.rag_documents using hnsw (embedding vector_cosine_ops)
+  with (m = 16, ef_construction = 64);
+
+-- Metadata filter indexes
+create index if not exists rag_documents_category_idx on public.rag_documents (category);
+create index if not exists rag_documents_tags_idx on public.rag_documents using gin (tags);
+
+-- Top-k similarity search with optional category / tags filters
+create or replace function public.match_rag_documents (
+  query_embedding vector(1536),
+  match_count     integer default 5,
+  filter_category text default null,
+  filter_tags     text[] default null
+)
+returns table (
+  id          bigint,
+  title       text,
+  content     text,
+  url         text,
+  category    text,
+  tags        text[],
+  similarity  double precision
+)
+language sql stable
+as $$
+  select
+    d.id,
+    d.title,
+    d.content,
+    d.url,
+    d.category,
+    d.tags,
+    1 - (d.embedding <=> query_embedding) as similarity
+  from public.rag_documents d
+  where d.embedding is not null
+    and (filter_category is null or d.category = filter_category)
+    and (filter_tags is null or d.tags && filter_tags)
+  order by d.embedding <=> query_embedding
+  limit match_count;
+$$;
+comment on function public.match_rag_documents is 'Top-k cosine similarity search over rag_documents with optional metadata filters.';
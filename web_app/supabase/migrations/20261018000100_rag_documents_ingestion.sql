@@ -0,0 +1,48 @@
+/**
+ * INCREMENTAL EMBEDDING INGESTION
+ * Tracks which content each stored embedding was computed from, so the
+ * ingestion job only re-embeds new or changed documents.
+ */
+
+-- sha256 (hex) of the content the current embedding was computed from
+alter table public.rag_documents add column if not exists content_hash text;
+comment on column public.rag_documents.content_hash is 'sha256 of the content the embedding was computed from.';
+
+create index if not exists rag_documents_last_updated_idx on public.rag_documents (last_updated);
+
+-- Keep last_updated current when the text of a document changes
+create or replace function public.touch_rag_document()
+returns trigger as $$
+begin
+  new.last_updated := timezone('utc'::text, now());
+  return new;
+end;
+$$ language plpgsql;
+
+create trigger on_rag_document_changed
+  before update of title, content on public.rag_documents
+  for each row
+  when (old.title is distinct from new.title or old.content is distinct from new.content)
+  execute procedure public.touch_rag_document();
+
+-- Write a batch of embeddings in one statement. Rows whose content changed
+-- since it was embedded are skipped, so a concurrent edit is never overwritten
+-- with a stale embedding.
+create or replace function public.bulk_update_rag_document_embeddings(updates jsonb)
+returns integer
+language sql
+as $$
+  with batch as (
+    select * from jsonb_to_recordset(updates) as u(id bigint, embedding vector(1536), content_hash text)
+  ), updated as (
+    update public.rag_documents d
+    set embedding = batch.embedding,
+        content_hash = batch.content_hash
+    from batch
+    where d.id = batch.id
+      and encode(sha256(convert_to(d.content, 'UTF8')), 'hex') = batch.content_hash
+    returning d.id
+  )
+  select count(*)::integer from updated;
+$$;
+comment on function public.bulk_update_rag_document_embeddings is 'Bulk write of document embeddings produced by the ingestion job.';
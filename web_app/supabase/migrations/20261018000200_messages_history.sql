@@ -0,0 +1,23 @@
+/**
+ * CONVERSATION HISTORY
+ * Keyset pagination over a user's messages and a rolling summary of older
+ * turns, so chat prompts stay within a fixed token budget.
+ */
+
+-- Serves "where user_id = $1 [and (inserted_at, id) < cursor] order by inserted_at desc, id desc limit n"
+create index if not exists messages_user_id_inserted_at_idx
+  on public.messages (user_id, inserted_at desc, id desc);
+
+-- CONVERSATION SUMMARIES (one rolling summary per patient)
+create table if not exists public.conversation_summaries (
+  user_id               uuid references public.users on delete cascade not null primary key,
+  summary               text not null default '',
+  summarized_through_id bigint,
+  updated_at            timestamp with time zone default timezone('utc'::text, now()) not null
+);
+comment on table public.conversation_summaries is 'Rolling summary of each patient''s older messages.';
+comment on column public.conversation_summaries.summarized_through_id is 'Highest messages.id folded into the summary.';
+
+alter table public.conversation_summaries enable row level security;
+
+create policy "Allow individual read access" on public.conversation_summaries for select using ( auth.uid() = user_id );
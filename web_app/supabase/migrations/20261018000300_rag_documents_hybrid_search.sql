@@ -0,0 +1,90 @@
+/**
+ * HYBRID SEARCH OVER RAG DOCUMENTS
+ * Combines full-text search, which catches exact drug names and medical
+ * terms, with vector similarity, merged by reciprocal rank fusion in a single
+ * query so the backend still makes one round trip per retrieval.
+ */
+
+-- Title terms rank above body terms
+alter table public.rag_documents add column if not exists fts tsvector
+  generated always as (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(content, '')), 'B')
+  ) stored;
+comment on column public.rag_documents.fts is 'Weighted full-text search vector over title and content.';
+
+create index if not exists rag_documents_fts_idx on public.rag_documents using gin (fts);
+
+-- Each ranking contributes weight / (rrf_k + rank) for the documents it returns;
+-- both rankings apply the category / tags prefilter before taking candidates.
+create or replace function public.hybrid_search_rag_documents (
+  query_text       text,
+  query_embedding  vector(1536),
+  match_count      integer default 5,
+  filter_category  text default null,
+  filter_tags      text[] default null,
+  full_text_weight double precision default 1,
+  semantic_weight  double precision default 1,
+  rrf_k            integer default 50
+)
+returns table (
+  id          bigint,
+  title       text,
+  content     text,
+  url         text,
+  category    text,
+  tags        text[],
+  similarity  double precision,
+  score       double precision
+)
+language sql stable
+as $$
+  with full_text as (
+    select
+      d.id,
+      row_number() over (
+        order by ts_rank_cd(d.fts, websearch_to_tsquery('english', query_text)) desc
+      ) as rank_ix
+    from public.rag_documents d
+    where d.fts @@ websearch_to_tsquery('english', query_text)
+      and (filter_category is null or d.category = filter_category)
+      and (filter_tags is null or d.tags && filter_tags)
+    order by rank_ix
+    limit match_count * 2
+  ),
+  semantic as (
+    select
+      d.id,
+      1 - (d.embedding <=> query_embedding) as similarity,
+      row_number() over (order by d.embedding <=> query_embedding) as rank_ix
+    from public.rag_documents d
+    where d.embedding is not null
+      and (filter_category is null or d.category = filter_category)
+      and (filter_tags is null or d.tags && filter_tags)
+    order by rank_ix
+    limit match_count * 2
+  ),
+  fused as (
+    select
+      coalesce(full_text.id, semantic.id) as id,
+      semantic.similarity,
+      coalesce(1.0 / (rrf_k + full_text.rank_ix), 0.0) * full_text_weight +
+      coalesce(1.0 / (rrf_k + semantic.rank_ix), 0.0) * semantic_weight as score
+    from full_text
+    full outer join semantic on full_text.id = semantic.id
+  )
+  select
+    d.id,
+    d.title,
+    d.content,
+    d.url,
+    d.category,
+    d.tags,
+    fused.similarity,
+    fused.score
+  from fused
+  join public.rag_documents d on d.id = fused.id
+  order by fused.score desc
+  limit match_count;
+$$;
+comment on function public.hybrid_search_rag_documents is 'Full-text + vector search over rag_documents merged by reciprocal rank fusion, with optional metadata filters.';
@@ -0,0 +1,42 @@
+/**
+ * REFERENCE DATA VERSIONS
+ * A counter per reference table, bumped on every change, so backend workers
+ * can cheaply check whether their in-memory copy of the table is current.
+ */
+
+create table if not exists public.reference_data_versions (
+  name        text primary key,
+  version     bigint not null default 0,
+  updated_at  timestamp with time zone default timezone('utc'::text, now()) not null
+);
+comment on table public.reference_data_versions is 'Change counters for reference tables cached by the backend.';
+
+insert into public.reference_data_versions (name)
+values ('medical_conditions'), ('medications')
+on conflict (name) do nothing;
+
+alter table public.reference_data_versions enable row level security;
+
+create policy "Allow authenticated read access" on public.reference_data_versions
+  for select using (auth.role() = 'authenticated');
+
+create or replace function public.bump_reference_data_version()
+returns trigger as $$
+begin
+  insert into public.reference_data_versions (name, version)
+  values (tg_table_name, 1)
+  on conflict (name) do update
+    set version = public.reference_data_versions.version + 1,
+        updated_at = timezone('utc'::text, now());
+  return null;
+end;
+$$ language plpgsql security definer set search_path = public;
+
+-- Statement-level, so a bulk load bumps the version once
+create trigger on_medical_conditions_changed
+  after insert or update or delete or truncate on public.medical_conditions
+  for each statement execute procedure public.bump_reference_data_version();
+
+create trigger on_medications_changed
+  after insert or update or delete or truncate on public.medications
+  for each statement execute procedure public.bump_reference_data_version();
@@ -0,0 +1,24 @@
+/**
+ * RAG JOBS
+ * Long browser / database RAG requests run as background jobs. The worker
+ * that accepts a job runs it; this table mirrors its status and result so
+ * any worker can answer a poll for it.
+ */
+create table if not exists public.rag_jobs (
+  id          uuid not null primary key,
+  user_id     uuid references public.users on delete cascade not null,
+  kind        text not null,
+  status      text not null check (status in ('queued', 'running', 'succeeded', 'failed')),
+  result      jsonb,
+  error       text,
+  created_at  timestamp with time zone default timezone('utc'::text, now()) not null,
+  started_at  timestamp with time zone,
+  finished_at timestamp with time zone
+);
+comment on table public.rag_jobs is 'Background RAG jobs and their results.';
+
+create index if not exists rag_jobs_user_id_created_at_idx on public.rag_jobs (user_id, created_at desc);
+
+alter table public.rag_jobs enable row level security;
+
+create policy "Allow individual read access" on public.rag_jobs for select using ( auth.uid() = user_id );
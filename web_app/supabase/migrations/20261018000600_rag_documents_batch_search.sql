@@ -0,0 +1,55 @@
+/**
+ * BATCHED HYBRID SEARCH
+ * Runs hybrid_search_rag_documents for several questions over the same
+ * filters in one call, so a batch of intake questions costs one round trip.
+ * Embeddings are passed as a JSON array of arrays and cast per query.
+ */
+create or replace function public.hybrid_search_rag_documents_batch (
+  query_texts      text[],
+  query_embeddings jsonb,
+  match_count      integer default 5,
+  filter_category  text default null,
+  filter_tags      text[] default null,
+  full_text_weight double precision default 1,
+  semantic_weight  double precision default 1,
+  rrf_k            integer default 50
+)
+returns table (
+  query_index integer,
+  id          bigint,
+  title       text,
+  content     text,
+  url         text,
+  category    text,
+  tags        text[],
+  similarity  double precision,
+  score       double precision
+)
+language sql stable
+as $$
+  select
+    (q.ordinality - 1)::integer as query_index,
+    r.id,
+    r.title,
+    r.content,
+    r.url,
+    r.category,
+    r.tags,
+    r.similarity,
+    r.score
+  from unnest(query_texts) with ordinality as q(query_text, ordinality)
+  join jsonb_array_elements(query_embeddings) with ordinality as e(embedding, ordinality)
+    on e.ordinality = q.ordinality
+  cross join lateral public.hybrid_search_rag_documents(
+    q.query_text,
+    (e.embedding::text)::vector(1536),
+    match_count,
+    filter_category,
+    filter_tags,
+    full_text_weight,
+    semantic_weight,
+    rrf_k
+  ) r
+  order by query_index, r.score desc;
+$$;
+comment on function public.hybrid_search_rag_documents_batch is 'hybrid_search_rag_documents for several queries at once; rows carry the zero-based index of their query.';
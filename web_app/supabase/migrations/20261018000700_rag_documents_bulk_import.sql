@@ -0,0 +1,63 @@
+/**
+ * STREAMING BULK IMPORT
+ * Hash of each document's text, kept current by a trigger, so an import can
+ * skip documents already stored under another URL; and a function inserting
+ * a batch of imported rows in one statement. Imported rows have no
+ * embedding yet: the ingestion job picks them up.
+ */
+
+-- sha256 (hex) of the current content, unlike content_hash which tracks the embedding
+alter table public.rag_documents add column if not exists text_hash text;
+comment on column public.rag_documents.text_hash is 'sha256 of the current content, used to skip duplicate imports.';
+
+create or replace function public.set_rag_document_text_hash()
+returns trigger as $$
+begin
+  new.text_hash := encode(sha256(convert_to(new.content, 'UTF8')), 'hex');
+  return new;
+end;
+$$ language plpgsql;
+
+create trigger on_rag_document_text_changed
+  before insert or update of content on public.rag_documents
+  for each row
+  execute procedure public.set_rag_document_text_hash();
+
+update public.rag_documents
+set text_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+where text_hash is null;
+
+create index if not exists rag_documents_url_idx on public.rag_documents (url) where url is not null;
+create index if not exists rag_documents_text_hash_idx on public.rag_documents (text_hash);
+
+-- Insert a batch of documents, leaving out those whose URL or text is already
+-- stored. Batches are serialised so concurrent imports cannot both insert a
+-- document. Returns the number of rows inserted.
+create or replace function public.bulk_import_rag_documents(documents jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+  inserted integer;
+begin
+  perform pg_advisory_xact_lock(hashtext('bulk_import_rag_documents'));
+
+  with batch as (
+    select * from jsonb_to_recordset(documents) as d(
+      title text, content text, url text, source_type text, category text, tags text[],
+      author text, publication_date date, metadata jsonb, text_hash text
+    )
+  )
+  insert into public.rag_documents (title, content, url, source_type, category, tags, author, publication_date, metadata)
+  select b.title, b.content, b.url, b.source_type, b.category, b.tags, b.author, b.publication_date, b.metadata
+  from batch b
+  where not exists (
+    select 1 from public.rag_documents d
+    where (b.url is not null and d.url = b.url) or d.text_hash = b.text_hash
+  );
+
+  get diagnostics inserted = row_count;
+  return inserted;
+end;
+$$;
+comment on function public.bulk_import_rag_documents is 'Batched insert of documents from the bulk import endpoint, skipping duplicates.';
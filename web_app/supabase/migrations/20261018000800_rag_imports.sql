@@ -0,0 +1,34 @@
+/**
+ * RAG IMPORTS
+ * Progress of bulk imports into rag_documents. The worker that receives an
+ * upload imports it and writes its counters here after each batch, so any
+ * worker can report the import while it runs and after it finishes.
+ */
+create table if not exists public.rag_imports (
+  id          uuid not null primary key,
+  user_id     uuid references public.users on delete cascade not null,
+  format      text not null check (format in ('ndjson', 'csv')),
+  status      text not null check (status in ('running', 'succeeded', 'failed')),
+  rows        integer not null default 0,
+  inserted    integer not null default 0,
+  duplicates  integer not null default 0,
+  invalid     integer not null default 0,
+  batches     integer not null default 0,
+  errors      jsonb not null default '[]'::jsonb,
+  error       text,
+  embeddings  text not null check (embeddings in ('pending', 'queued', 'none')),
+  started_at  timestamp with time zone not null,
+  finished_at timestamp with time zone
+);
+comment on table public.rag_imports is 'Bulk imports of rag_documents and their progress.';
+
+create index if not exists rag_imports_started_at_idx on public.rag_imports (started_at desc);
+
+alter table public.rag_imports enable row level security;
+
+create policy "Allow admin read access" on public.rag_imports for select using (
+  exists (
+    select 1 from public.user_roles
+    where user_id = auth.uid() and role = 'admin'
+  )
+);
@@ -0,0 +1,86 @@
+/**
+ * HYBRID SEARCH: INDEXED VECTOR CANDIDATES
+ * The semantic ranking of hybrid_search_rag_documents numbered every filtered
+ * row with row_number() over the distance, which sorts the whole table and
+ * bypasses the HNSW index. The candidates are now taken with
+ * order by distance / limit, which the index serves, and only that small set
+ * is numbered. hybrid_search_rag_documents_batch calls this function and
+ * picks up the change.
+ */
+create or replace function public.hybrid_search_rag_documents (
+  query_text       text,
+  query_embedding  vector(1536),
+  match_count      integer default 5,
+  filter_category  text default null,
+  filter_tags      text[] default null,
+  full_text_weight double precision default 1,
+  semantic_weight  double precision default 1,
+  rrf_k            integer default 50
+)
+returns table (
+  id          bigint,
+  title       text,
+  content     text,
+  url         text,
+  category    text,
+  tags        text[],
+  similarity  double precision,
+  score       double precision
+)
+language sql stable
+as $$
+  with full_text as (
+    select
+      d.id,
+      row_number() over (
+        order by ts_rank_cd(d.fts, websearch_to_tsquery('english', query_text)) desc
+      ) as rank_ix
+    from public.rag_documents d
+    where d.fts @@ websearch_to_tsquery('english', query_text)
+      and (filter_category is null or d.category = filter_category)
+      and (filter_tags is null or d.tags && filter_tags)
+    order by rank_ix
+    limit match_count * 2
+  ),
+  nearest as (
+    select
+      d.id,
+      d.embedding <=> query_embedding as distance
+    from public.rag_documents d
+    where d.embedding is not null
+      and (filter_category is null or d.category = filter_category)
+      and (filter_tags is null or d.tags && filter_tags)
+    order by d.embedding <=> query_embedding
+    limit match_count * 2
+  ),
+  semantic as (
+    select
+      nearest.id,
+      1 - nearest.distance as similarity,
+      row_number() over (order by nearest.distance) as rank_ix
+    from nearest
+  ),
+  fused as (
+    select
+      coalesce(full_text.id, semantic.id) as id,
+      semantic.similarity,
+      coalesce(1.0 / (rrf_k + full_text.rank_ix), 0.0) * full_text_weight +
+      coalesce(1.0 / (rrf_k + semantic.rank_ix), 0.0) * semantic_weight as score
+    from full_text
+    full outer join semantic on full_text.id = semantic.id
+  )
+  select
+    d.id,
+    d.title,
+    d.content,
+    d.url,
+    d.category,
+    d.tags,
+    fused.similarity,
+    fused.score
+  from fused
+  join public.rag_documents d on d.id = fused.id
+  order by fused.score desc
+  limit match_count;
+$$;
+comment on function public.hybrid_search_rag_documents is 'Full-text + vector search over rag_documents merged by reciprocal rank fusion, with optional metadata filters.';